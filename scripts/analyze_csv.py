@@ -9,8 +9,8 @@ import numpy as np
 from pathlib import Path
 
 
-def load_log(path: str):
-    """CSVログファイルを読み込む"""
+def load_log(path: str, face_id=None):
+    """CSVログファイルを読み込む（face_id を指定すると、複数人モードのその顔の行だけを使う）"""
     df = pd.read_csv(path)
     # メタ情報を取得
     meta_row = df[df["row_type"] == "meta"].iloc[0] if len(df[df["row_type"] == "meta"]) > 0 else None
@@ -18,6 +18,10 @@ def load_log(path: str):
     # フレームデータとイベントデータを分離
     frames = df[df["row_type"] == "frame"].copy()
     events = df[df["row_type"] == "event"].copy()
+    if face_id is not None:
+        if "face_id" not in frames.columns:
+            raise SystemExit("This log has no face_id column (recorded without --max-faces)")
+        frames = frames[pd.to_numeric(frames["face_id"], errors="coerce") == face_id]
     
     # 数値列を変換
     numeric_cols = ["ts", "ear", "ear_base", "ear_thr", "blink_count", "gaze", 
@@ -152,10 +156,11 @@ def main():
     parser = argparse.ArgumentParser(description="Analyze CSV log files")
     parser.add_argument("--csv", required=True, help="Path to CSV log file")
     parser.add_argument("--output", default=None, help="Output CSV file path (optional)")
+    parser.add_argument("--face-id", type=int, default=None, help="Analyze only this face (logs recorded with --max-faces)")
     args = parser.parse_args()
     
     # ログファイルを読み込む
-    frames, events, meta_row = load_log(args.csv)
+    frames, events, meta_row = load_log(args.csv, face_id=args.face_id)
     
     # ブロックごとに分析
     results = analyze_by_block(frames, events)
@@ -169,7 +174,8 @@ def main():
     else:
         # デフォルトの出力ファイル名
         csv_path = Path(args.csv)
-        output_path = csv_path.parent / f"{csv_path.stem}_analysis.csv"
+        suffix = f"_face{args.face_id}" if args.face_id is not None else ""
+        output_path = csv_path.parent / f"{csv_path.stem}{suffix}_analysis.csv"
         save_csv(results, str(output_path))
 
 
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+顔ランドマーク推論のバックエンドを、同じ録画を再生して比較する
+
+  solutions: mp.solutions.face_mesh（FaceProcessor, 同期）
+  tasks:     Tasks の FaceLandmarker（FaceLandmarkerProcessor, LIVE_STREAM の非同期）
+
+各バックエンドについて、メインループが推論で止まる時間（process() の所要時間）、
+フレームを渡してから結果が届くまでの遅延、結果の数（推論が追いつかず渡さなかったフレーム数）、
+プロセスの CPU 使用率を表示します。
+
+例:
+  python scripts/bench_face_backend.py --video logs/session_xxx.avi
+  python scripts/bench_face_backend.py --video clip.avi --backends tasks --model models/face_landmarker.task --threads 2
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+import psutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from mediapipe_wrappers import DEFAULT_FACE_MODEL, FaceLandmarkerProcessor, FaceProcessor, limit_threads
+
+
+def load_frames(path, max_frames):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise SystemExit(f"Cannot open video: {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    frames = []
+    while len(frames) < max_frames:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        # アプリと同じく RGB 順で渡す
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    cap.release()
+    return frames, fps
+
+
+def _wait_pending(face, timeout=2.0):
+    deadline = time.time() + timeout
+    while face.get_stats()['landmarker_pending'] > 0 and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def run(face, frames, fps, pace):
+    """frames を順に process() に渡し、計測結果を返す"""
+    proc = psutil.Process()
+    interval = 1.0 / fps if pace == 'fps' else 0.0
+    call_ms = []
+    with_face = 0
+    base = None
+    if isinstance(face, FaceLandmarkerProcessor):
+        # ウォームアップ分の結果が届ききってから数え始める
+        _wait_pending(face)
+        base = face.get_stats()
+    cpu0 = proc.cpu_times()
+    t_start = time.perf_counter()
+    next_t = t_start
+    for frame in frames:
+        if interval > 0:
+            wait = next_t - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+            next_t += interval
+        t0 = time.perf_counter()
+        fm = face.process(frame)
+        call_ms.append((time.perf_counter() - t0) * 1000.0)
+        if fm['has_face'] and fm.get('fresh', True):
+            with_face += 1
+    # 非同期の推論は、最後のフレームの結果が届くまで待ってから締める
+    if isinstance(face, FaceLandmarkerProcessor):
+        _wait_pending(face)
+    elapsed = time.perf_counter() - t_start
+    cpu1 = proc.cpu_times()
+    cpu = (cpu1.user - cpu0.user) + (cpu1.system - cpu0.system)
+    call = np.array(call_ms)
+    result = {
+        'frames': len(frames),
+        'call_ms_mean': float(call.mean()),
+        'call_ms_p95': float(np.percentile(call, 95)),
+        'cpu_percent': 100.0 * cpu / elapsed,
+        'fps': len(frames) / elapsed,
+        'with_face': with_face,
+    }
+    if isinstance(face, FaceLandmarkerProcessor):
+        st = face.get_stats()
+        result['latency_ms'] = st['landmarker_latency_ms']
+        result['results'] = st['landmarker_results'] - base['landmarker_results']
+        result['skipped'] = st['landmarker_skipped'] - base['landmarker_skipped']
+    else:
+        # 同期処理では、渡してから結果が得られるまでが process() の所要時間そのもの
+        result['latency_ms'] = result['call_ms_mean']
+        result['results'] = len(frames)
+        result['skipped'] = 0
+    return result
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Compare FaceMesh (solutions) and FaceLandmarker (tasks) on a replayed video')
+    ap.add_argument('--video', required=True, help='再生する動画（--record-frames で録画した .avi など）')
+    ap.add_argument('--backends', default='solutions,tasks', help='比較するバックエンド（カンマ区切り）')
+    ap.add_argument('--model', default=DEFAULT_FACE_MODEL, help='tasks 用のモデル（face_landmarker.task）')
+    ap.add_argument('--threads', type=int, default=0, help='OpenCV の画像処理に使うスレッド数の上限（0 で制限しない）')
+    ap.add_argument('--pace', default='fps', choices=['fps', 'fast'], help='fps: 録画の fps で渡す / fast: 待たずに渡す（tasks は推論中のフレームを捨てるので fps での比較が基本）')
+    ap.add_argument('--fps', type=float, default=None, help='--pace fps の速度（省略時は動画の fps）')
+    ap.add_argument('--max-frames', type=int, default=900)
+    ap.add_argument('--warmup', type=int, default=10, help='計測前に処理するフレーム数')
+    args = ap.parse_args()
+
+    frames, video_fps = load_frames(args.video, args.max_frames)
+    if len(frames) <= args.warmup:
+        raise SystemExit("Not enough frames in the video")
+    fps = args.fps or video_fps
+    limit_threads(args.threads)
+
+    rows = []
+    for backend in [b.strip() for b in args.backends.split(',') if b.strip()]:
+        if backend == 'solutions':
+            face = FaceProcessor(static_mode=False, refine_iris=True, max_faces=1)
+        elif backend == 'tasks':
+            try:
+                face = FaceLandmarkerProcessor(args.model, max_faces=1)
+            except FileNotFoundError as e:
+                print(f"Skipping tasks: {e}")
+                continue
+        else:
+            print(f"Unknown backend: {backend}")
+            continue
+        for frame in frames[:args.warmup]:
+            face.process(frame)
+        rows.append((backend, run(face, frames[args.warmup:], fps, args.pace)))
+        if isinstance(face, FaceLandmarkerProcessor):
+            face.close()
+
+    print(f"{len(frames) - args.warmup} frames, pace={args.pace}"
+          f"{f' @ {fps:.1f} fps' if args.pace == 'fps' else ''}, threads={args.threads or 'all'}")
+    print(f"{'backend':<10} {'call ms':>8} {'p95':>7} {'latency':>8} {'results':>8} {'skipped':>8} {'face':>6} "
+          f"{'fps':>6} {'cpu%':>6}")
+    for backend, r in rows:
+        print(f"{backend:<10} {r['call_ms_mean']:>8.2f} {r['call_ms_p95']:>7.2f} {r['latency_ms']:>8.2f} "
+              f"{r['results']:>8} {r['skipped']:>8} {r['with_face']:>6} {r['fps']:>6.1f} {r['cpu_percent']:>6.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+複数人モード（--max-faces）で、顔の数が 1〜4 人に増えたときの1フレームあたりの処理時間を測る
+
+  mesh:   FaceMesh（max_faces=K）の処理時間。録画のフレームを K 個タイル状に並べた画像を渡す
+          （顔が小さすぎると検出されないので、見つかった顔の数も表示します）
+  faces:  追跡 ID の対応付けと顔ごとの瞬目・視線・スコアの更新（FaceTracker.update）。
+          録画から得たランドマークを K 人分ずらして複製し、検出の成否に左右されずに測ります
+
+例:
+  python scripts/bench_multi_face.py --video logs/session_xxx.avi
+  python scripts/bench_multi_face.py --video clip.avi --faces 1,2,4 --max-frames 300
+"""
+import argparse
+import math
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from mediapipe_wrappers import FaceProcessor
+from multi_face import FaceTracker, frame_faces
+
+
+def load_frames(path, max_frames):
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise SystemExit(f"Cannot open video: {path}")
+    frames = []
+    while len(frames) < max_frames:
+        ok, frame = cap.read()
+        if not ok:
+            break
+        # アプリと同じく RGB 順で渡す
+        frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    cap.release()
+    return frames
+
+
+def tile(frame, k):
+    """frame を k 個、ほぼ正方形の格子に並べた画像（各マスは元の解像度のまま）"""
+    cols = math.ceil(math.sqrt(k))
+    rows = math.ceil(k / cols)
+    h, w = frame.shape[:2]
+    canvas = np.zeros((h * rows, w * cols, 3), dtype=frame.dtype)
+    for i in range(k):
+        r, c = divmod(i, cols)
+        canvas[r * h:(r + 1) * h, c * w:(c + 1) * w] = frame
+    return canvas
+
+
+def replicate(lms, k):
+    """1人分のランドマークを、重ならないよう横にずらして k 人分にする"""
+    faces = []
+    for i in range(k):
+        face = lms.copy()
+        face[:, 0] = (face[:, 0] + i) / k
+        faces.append(face)
+    return faces
+
+
+def bench_mesh(frames, k, warmup):
+    face = FaceProcessor(static_mode=False, refine_iris=True, max_faces=k)
+    tiled = [tile(f, k) for f in frames]
+    for frame in tiled[:warmup]:
+        face.process(frame)
+    ms = []
+    found = []
+    for frame in tiled[warmup:]:
+        t0 = time.perf_counter()
+        fm = face.process(frame)
+        ms.append((time.perf_counter() - t0) * 1000.0)
+        found.append(len(frame_faces(fm)))
+    return float(np.mean(ms)), float(np.mean(found))
+
+
+def bench_faces(landmarks, k, repeat):
+    tracker = FaceTracker(max_faces=k)
+    per_frame = [replicate(lms, k) for lms in landmarks]
+    tracker.update(per_frame[0])
+    ms = []
+    for _ in range(repeat):
+        for faces in per_frame:
+            t0 = time.perf_counter()
+            tracker.update(faces)
+            ms.append((time.perf_counter() - t0) * 1000.0)
+    return float(np.mean(ms)), len(tracker.tracks)
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Per-frame cost of multi-face tracking for 1..4 faces')
+    ap.add_argument('--video', required=True, help='再生する動画（--record-frames で録画した .avi など）')
+    ap.add_argument('--faces', default='1,2,3,4', help='測る顔の数（カンマ区切り）')
+    ap.add_argument('--max-frames', type=int, default=300)
+    ap.add_argument('--warmup', type=int, default=10, help='計測前に処理するフレーム数')
+    ap.add_argument('--repeat', type=int, default=5, help='顔ごとの状態更新を繰り返す回数（短い処理の計測を安定させる）')
+    args = ap.parse_args()
+
+    frames = load_frames(args.video, args.max_frames)
+    if len(frames) <= args.warmup:
+        raise SystemExit("Not enough frames in the video")
+    # 顔ごとの処理に使うランドマーク（1人分）を録画から求めておく
+    face = FaceProcessor(static_mode=False, refine_iris=True, max_faces=1)
+    landmarks = []
+    for frame in frames:
+        fm = face.process(frame)
+        if fm['landmarks'] is not None:
+            landmarks.append(fm['landmarks'].copy())
+    if not landmarks:
+        raise SystemExit("No face found in the video")
+
+    counts = [int(k) for k in args.faces.split(',') if k.strip()]
+    rows = []
+    for k in counts:
+        mesh_ms, found = bench_mesh(frames, k, args.warmup)
+        faces_ms, tracks = bench_faces(landmarks, k, args.repeat)
+        rows.append((k, mesh_ms, found, faces_ms, tracks))
+
+    print(f"{len(frames) - args.warmup} frames for mesh, {len(landmarks)} landmark frames x{args.repeat} for faces")
+    print(f"{'faces':>5} {'mesh ms':>8} {'found':>6} {'faces ms':>9} {'tracks':>7} {'total ms':>9} {'vs 1':>6}")
+    base = None
+    for k, mesh_ms, found, faces_ms, tracks in rows:
+        total = mesh_ms + faces_ms
+        base = total if base is None else base
+        print(f"{k:>5} {mesh_ms:>8.2f} {found:>6.1f} {faces_ms:>9.3f} {tracks:>7} {total:>9.2f} {total / base:>5.2f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
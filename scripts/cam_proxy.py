@@ -1,16 +1,549 @@
 #!/usr/bin/env python3
 import argparse
+import json
+import os
+import queue
+import threading
 import time
 import sys
 import cv2
 import zmq
 import numpy as np
 
-try:
-    from picamera2 import Picamera2
-except Exception as e:
-    print("Picamera2 の読み込みに失敗しました。", file=sys.stderr)
-    raise
+# 共有メモリ転送（--transport shm）用に src/ を読み込めるようにする
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from orientation import Orientation
+from governor import LatencyTargetGovernor, parse_quality_levels
+
+
+class _PicameraSource:
+    """Picamera2 から取得する（実機用）"""
+
+    def __init__(self, width, height, fps):
+        try:
+            from picamera2 import Picamera2
+        except Exception as e:
+            print("Picamera2 の読み込みに失敗しました。", file=sys.stderr)
+            raise
+        self.picam = Picamera2()
+
+        # ストリームの設定（size, format のみ。ここに fps は入れない）
+        # あえて RGB888 で取得（こちらの方が内部的に安定することがある）
+        config = self.picam.create_preview_configuration(
+            main={"size": (width, height), "format": "RGB888"}
+        )
+        self.picam.configure(config)
+
+        # カメラ全体の設定（ここで fps を指定する）
+        self.picam.set_controls({"FrameRate": fps})
+
+        self.picam.start()
+
+    def read(self):
+        # NumPy配列として取得（RGB888 はメモリ上 B,G,R の並びなので、OpenCV からは BGR として扱える）
+        return self.picam.capture_array()
+
+    def close(self):
+        self.picam.stop()
+
+
+class _SyntheticSource:
+    """動く模様を生成する（カメラの無い PC でのベンチマーク用）"""
+
+    def __init__(self, width, height, fps, pace=True):
+        self.width = width
+        self.height = height
+        self.interval = 1.0 / fps if (pace and fps > 0) else 0.0
+        self.next_t = time.time()
+        self.n = 0
+        # 圧縮率が実際の映像に近くなるよう、ノイズの上に動く矩形を描く
+        rng = np.random.default_rng(0)
+        self.base = rng.integers(0, 64, (height, width, 3), dtype=np.uint8)
+        self.base = cv2.GaussianBlur(self.base, (0, 0), 3)
+
+    def read(self):
+        if self.interval > 0:
+            wait = self.next_t - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            self.next_t = max(self.next_t + self.interval, time.time() - self.interval)
+        frame = self.base.copy()
+        x = (self.n * 4) % max(1, self.width - 80)
+        y = (self.n * 2) % max(1, self.height - 80)
+        cv2.rectangle(frame, (x, y), (x + 80, y + 80), (60, 160, 230), -1)
+        cv2.putText(frame, str(self.n), (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 255, 255), 2)
+        self.n += 1
+        return frame
+
+    def close(self):
+        pass
+
+
+class _FileSource:
+    """動画ファイルを繰り返し再生する（記録した映像でのベンチマーク用）"""
+
+    def __init__(self, path, width, height, fps, pace=True):
+        self.path = path
+        self.size = (width, height)
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Cannot open source file: {path}")
+        self.interval = 1.0 / fps if (pace and fps > 0) else 0.0
+        self.next_t = time.time()
+
+    def read(self):
+        if self.interval > 0:
+            wait = self.next_t - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            self.next_t = max(self.next_t + self.interval, time.time() - self.interval)
+        ok, frame = self.cap.read()
+        if not ok:
+            # 末尾まで来たら先頭に戻る
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.cap.read()
+            if not ok:
+                return None
+        if (frame.shape[1], frame.shape[0]) != self.size:
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return frame
+
+    def close(self):
+        self.cap.release()
+
+
+class _StageTimer:
+    """段ごとの処理時間（ミリ秒）を集計する。複数スレッドから呼ばれる"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sum = {}
+        self._count = {}
+
+    def add(self, stage, sec):
+        with self._lock:
+            self._sum[stage] = self._sum.get(stage, 0.0) + sec
+            self._count[stage] = self._count.get(stage, 0) + 1
+
+    def snapshot(self, reset=True):
+        with self._lock:
+            avg = {k: 1000.0 * self._sum[k] / self._count[k] for k in self._sum if self._count[k]}
+            if reset:
+                self._sum.clear()
+                self._count.clear()
+        return avg
+
+
+class _Stream:
+    """同じ取得フレームから派生させて送る追加ストリーム（縮小 JPEG・独自の fps 上限）"""
+
+    def __init__(self, name, size, fps, quality):
+        self.name = name
+        self.topic = name.encode('utf-8')
+        self.size = size  # (幅, 高さ)。None なら向きの変換後の解像度のまま
+        self.interval = 1.0 / fps if fps > 0 else 0.0
+        # 取得間隔の揺らぎで1フレーム遅れないよう、少し早めでも送る
+        self.tolerance = min(0.01, self.interval * 0.25)
+        self.quality = quality
+        self.next_due = 0.0
+        self.published = 0
+
+    def due(self, ts):
+        """取得時刻 ts のフレームをこのストリームで送るか（取得スレッドから順に呼ぶ）"""
+        if ts + self.tolerance < self.next_due:
+            return False
+        if ts - self.next_due < self.interval:
+            self.next_due += self.interval
+        else:
+            # 大きく遅れた（または最初の）フレームから数え直す
+            self.next_due = ts + self.interval
+        return True
+
+
+def parse_streams(items, default_quality):
+    """'preview:320x240@10:50' の形式（名前:幅x高さ@fps[:品質]、幅x高さは full も可）を _Stream にする"""
+    streams = []
+    for item in items:
+        parts = item.split(':')
+        if len(parts) not in (2, 3):
+            raise ValueError(f"Stream must be NAME:WxH@FPS[:QUALITY]: {item}")
+        name, spec = parts[0], parts[1]
+        quality = int(parts[2]) if len(parts) == 3 else default_quality
+        size_text, fps = spec.split('@')
+        if size_text.lower() == 'full':
+            size = None
+        else:
+            w, h = size_text.lower().split('x')
+            size = (int(w), int(h))
+        streams.append(_Stream(name, size, float(fps), quality))
+    return streams
+
+
+class _Publisher:
+    """フレームを ZMQ で送る（jpeg: JPEG 本体 / shm: 共有メモリへ書いて通知のみ / landmarks: ランドマーク配列）
+
+    共有メモリのリングは書き込み側が1つである前提なので、publish() は1スレッドからのみ呼ぶ。
+    """
+
+    def __init__(self, pub, topic, transport, shm_name, shm_slots):
+        self.pub = pub
+        self.topic = topic
+        self.transport = transport
+        self.shm_name = shm_name
+        self.shm_slots = shm_slots
+        self.ring = None
+
+    def publish(self, payload, ts, meta=None):
+        if self.transport == 'shm':
+            # 共有メモリに生フレームを書き、通知だけを送る（エンコード不要）
+            # JPEG 経路と同じく、取得した並びをそのまま BGR として扱う
+            arr = payload
+            if self.ring is None:
+                from shm_ring import ShmFrameRing
+                h, w = arr.shape[:2]
+                self.ring = ShmFrameRing.create(self.shm_name, w, h, channels=arr.shape[2], slots=self.shm_slots)
+            slot, seq = self.ring.write(arr, ts)
+            note = {'shm': self.ring.name, 'slot': slot, 'seq': seq, 'ts': ts, 'order': 'bgr'}
+            self.pub.send_multipart([self.topic, json.dumps(note).encode('utf-8')])
+        elif self.transport == 'landmarks':
+            # (N, 3) float32 のバイト列（顔が無ければ空）と、形状・画像サイズの JSON を送る
+            self.pub.send_multipart([self.topic, payload, repr(ts).encode('ascii'), json.dumps(meta).encode('utf-8')])
+        else:
+            parts = [self.topic, payload, repr(ts).encode('ascii')]
+            if meta is not None:
+                # 4つ目のパートにエンコード条件（JPEG 品質・縮小率）を付ける（受信側でログに残す）
+                parts.append(json.dumps(meta).encode('utf-8'))
+            self.pub.send_multipart(parts)
+
+    def publish_stream(self, stream, jpg, ts, meta):
+        """追加ストリームの JPEG を送る（転送方式によらず ZMQ で送る）"""
+        self.pub.send_multipart([stream.topic, jpg, repr(ts).encode('ascii'), json.dumps(meta).encode('utf-8')])
+
+    def close(self):
+        if self.ring is not None:
+            self.ring.close()
+
+
+class CamProxy:
+    """取得 → 向きの変換・JPEG エンコード → 送信 を行うプロキシ
+
+    workers=0 のときは1スレッドで順に処理します（従来の動作）。
+    workers>=1 のときは取得スレッドとエンコードワーカーを上限付きキューでつなぎ、
+    送信はメインスレッドで通し番号順に並べ直してから行います。取得キューが満杯なら
+    新しいフレームを捨てる（通し番号は受け付けたフレームにだけ振る）ので、順序は崩れません。
+    block_capture=True なら捨てずに空きを待ちます（速度を制限しない入力でのベンチマーク用）。
+    段ごとの処理時間と破棄数は stats_topic に JSON で定期的に送ります。
+
+    feedback（ZMQ PULL ソケット）と governor を渡すと、受信側が報告する遅延に応じて
+    JPEG 品質・縮小率を切り替え、切り替えを stats_topic にイベントとして送ります。
+
+    transport='landmarks' では face（mediapipe_wrappers.FaceProcessor）で FaceMesh を実行し、
+    画像の代わりにランドマーク配列を送ります。FaceMesh は前フレームの追跡状態を持つので、
+    ワーカーは1つに限ります。
+
+    streams（_Stream のリスト）を渡すと、同じ取得フレームを縮小・JPEG 化して別トピックにも送ります
+    （プレビュー用の小さい低 fps ストリームなど）。送るかどうかは取得時に fps 上限から決め、
+    送らないフレームではそのストリームの縮小・エンコードを行いません。
+    """
+
+    def __init__(self, source, publisher, orientation, quality=85, workers=2, queue_size=4,
+                 stats_pub=None, stats_topic=b'proxy_stats', stats_interval=5.0, block_capture=False,
+                 feedback=None, governor=None, face=None, streams=None):
+        self.source = source
+        self.publisher = publisher
+        self.orientation = orientation
+        self.quality = quality
+        self.scale = 1.0
+        # 受信側からの遅延報告（送信元ID -> (受信時刻, 遅延ミリ秒)）
+        self.feedback = feedback
+        self.governor = governor
+        self._reports = {}
+        if governor is not None:
+            self.quality, self.scale = governor.current
+        self.streams = list(streams or [])
+        self.face = face
+        if face is not None and workers > 1:
+            print("[cam_proxy] landmarks transport uses a single worker (FaceMesh tracks across frames)", file=sys.stderr)
+            workers = 1
+        self.workers = workers
+        self.queue_size = max(1, queue_size)
+        self.block_capture = block_capture
+        self.stats_pub = stats_pub
+        self.stats_topic = stats_topic
+        self.stats_interval = stats_interval
+        self.timer = _StageTimer()
+        self._lock = threading.Lock()
+        self.counters = {'captured': 0, 'published': 0, 'drop_capture': 0, 'encode_failed': 0, 'quality_changes': 0}
+        self._stop = threading.Event()
+        self._last_stats = time.time()
+        self._last_counters = dict(self.counters)
+        self.started = None
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.counters[key] += n
+
+    def _capture(self):
+        t0 = time.perf_counter()
+        arr = self.source.read()
+        # 取得時刻（受信側でフレームの経過時間・遅延を計算するために送る）
+        ts = time.time()
+        self.timer.add('capture', time.perf_counter() - t0)
+        # このフレームを送る追加ストリーム（fps 上限の判定は取得順に行う）
+        due = [st for st in self.streams if st.due(ts)] if arr is not None else []
+        return arr, ts, due
+
+    def _encode(self, arr, dst=None, due=()):
+        """向きを変換し、jpeg 転送なら JPEG にする
+
+        (送る中身, 向きの変換後の配列, エンコード条件, 追加ストリームの [(stream, jpg, 条件)]) を返す
+        """
+        t0 = time.perf_counter()
+        # 品質・縮小率は送信スレッドが書き換えるので、このフレームで使う値を先に読んでおく
+        quality, scale = self.quality, self.scale
+        if scale != 1.0 and not due and self.publisher.transport == 'jpeg':
+            # 縮小してから向きを変える（変換する画素数を減らす）
+            arr = cv2.resize(arr, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            scaled = True
+        else:
+            scaled = False
+        if not self.orientation.identity:
+            arr = self.orientation.apply(arr, dst=dst)
+        oriented = arr
+        extras = self._encode_streams(oriented, due)
+        if self.publisher.transport == 'landmarks':
+            payload, meta = self._landmarks(arr)
+            self.timer.add('encode', time.perf_counter() - t0)
+            return payload, oriented, meta, extras
+        if self.publisher.transport == 'shm':
+            payload = arr
+        else:
+            if scale != 1.0 and not scaled:
+                # 追加ストリームは元の解像度から作るので、主ストリームは向きの変換後に縮小する
+                arr = cv2.resize(arr, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            # RGB888 は既に BGR の並びなので、色の変換をせずにそのままエンコードする
+            ok, enc = cv2.imencode('.jpg', arr, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+            payload = enc.tobytes() if ok else None
+        self.timer.add('encode', time.perf_counter() - t0)
+        meta = {'quality': quality, 'scale': scale} if self.governor is not None else None
+        return payload, oriented, meta, extras
+
+    def _encode_streams(self, oriented, due):
+        extras = []
+        h, w = oriented.shape[:2]
+        for st in due:
+            img = oriented if st.size is None else cv2.resize(oriented, st.size, interpolation=cv2.INTER_AREA)
+            ok, enc = cv2.imencode('.jpg', img, [int(cv2.IMWRITE_JPEG_QUALITY), st.quality])
+            if ok:
+                meta = {'quality': st.quality, 'scale': round(img.shape[1] / float(w), 3), 'stream': st.name}
+                extras.append((st, enc.tobytes(), meta))
+        return extras
+
+    def _landmarks(self, arr):
+        # 取得した並びは BGR なので、FaceMesh 用に RGB にする（向きの変換後の配列とは別に確保）
+        rgb = cv2.cvtColor(arr, cv2.COLOR_BGR2RGB)
+        fm = self.face.process(rgb)
+        h, w = arr.shape[:2]
+        meta = {'size': [w, h]}
+        if not fm['has_face']:
+            meta['shape'] = [0, 3]
+            return b'', meta
+        lm = fm['landmarks']
+        meta['shape'] = list(lm.shape)
+        return lm.tobytes(), meta
+
+    def _publish(self, payload, ts, meta=None, extras=()):
+        t0 = time.perf_counter()
+        if payload is not None:
+            self.publisher.publish(payload, ts, meta)
+        for st, jpg, st_meta in extras:
+            self.publisher.publish_stream(st, jpg, ts, st_meta)
+            st.published += 1
+        self.timer.add('publish', time.perf_counter() - t0)
+        if payload is None:
+            self._count('encode_failed')
+            return
+        self.timer.add('latency', time.time() - ts)
+        self._count('published')
+
+    def _poll_feedback(self):
+        """受信側の遅延報告を読み、必要なら JPEG 品質・縮小率を切り替える（送信スレッドから呼ぶ）"""
+        if self.feedback is None or self.governor is None:
+            return
+        now = time.time()
+        while True:
+            try:
+                msg = self.feedback.recv_json(zmq.NOBLOCK)
+            except zmq.Again:
+                break
+            except ValueError:
+                continue
+            try:
+                self._reports[str(msg.get('id', '?'))] = (now, float(msg['latency_ms']))
+            except (KeyError, TypeError, ValueError):
+                continue
+            # 複数の受信側がいる場合は、最も遅れている受信側に合わせる
+            fresh = [lat for t, lat in self._reports.values() if now - t < 2.0]
+            level = self.governor.update(max(fresh) / 1000.0, now)
+            if level is not None:
+                self._set_quality(level, max(fresh))
+
+    def _set_quality(self, level, latency_ms):
+        self.quality, self.scale = level
+        self._count('quality_changes')
+        event = {'event': 'quality_change', 'ts': time.time(), 'level': self.governor.level,
+                 'quality': self.quality, 'scale': self.scale, 'latency_ms': latency_ms}
+        print(f"[cam_proxy] {json.dumps(event)}", flush=True)
+        if self.stats_pub is not None:
+            self.stats_pub.send_multipart([self.stats_topic, json.dumps(event).encode('utf-8')])
+
+    def _maybe_send_stats(self):
+        now = time.time()
+        if now - self._last_stats < self.stats_interval:
+            return
+        stats = self.get_stats(now)
+        self._last_stats = now
+        print(f"[cam_proxy] {json.dumps(stats)}", flush=True)
+        if self.stats_pub is not None:
+            self.stats_pub.send_multipart([self.stats_topic, json.dumps(stats).encode('utf-8')])
+
+    def get_stats(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            counters = dict(self.counters)
+        dt = max(1e-6, now - self._last_stats)
+        stats = {
+            'ts': now,
+            'workers': self.workers,
+            'quality': self.quality,
+            'scale': self.scale,
+            'fps_in': (counters['captured'] - self._last_counters['captured']) / dt,
+            'fps_out': (counters['published'] - self._last_counters['published']) / dt,
+            'stage_ms': self.timer.snapshot(),
+        }
+        if self.streams:
+            stats['streams'] = {st.name: st.published for st in self.streams}
+        stats.update(counters)
+        self._last_counters = counters
+        return stats
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self, duration=None):
+        self.started = time.time()
+        if self.workers <= 0:
+            self._run_serial(duration)
+        else:
+            self._run_pipelined(duration)
+
+    def _expired(self, duration):
+        return duration is not None and time.time() - self.started >= duration
+
+    def _run_serial(self, duration):
+        # 向きの変換結果はエンコードまたは共有メモリへの書き込みで、次の取得より前に使い終わるので使い回す
+        oriented = None
+        while not self._stop.is_set() and not self._expired(duration):
+            arr, ts, due = self._capture()
+            if arr is None:
+                continue
+            self._count('captured')
+            payload, oriented, meta, extras = self._encode(arr, dst=oriented, due=due)
+            self._publish(payload, ts, meta, extras)
+            self._poll_feedback()
+            self._maybe_send_stats()
+
+    def _capture_loop(self, cap_q):
+        seq = 0
+        while not self._stop.is_set():
+            arr, ts, due = self._capture()
+            if arr is None:
+                continue
+            self._count('captured')
+            if self.block_capture:
+                while not self._stop.is_set():
+                    try:
+                        cap_q.put((seq, ts, arr, due), timeout=0.5)
+                        seq += 1
+                        break
+                    except queue.Full:
+                        pass
+                continue
+            if cap_q.full():
+                # エンコードが追いつかない間は新しいフレームを捨てる（順序と通し番号を保つため）
+                self._count('drop_capture')
+                continue
+            cap_q.put((seq, ts, arr, due))
+            seq += 1
+        for _ in range(self.workers):
+            cap_q.put(None)
+
+    def _encode_loop(self, cap_q, out_q):
+        # ワーカーごとに向きの変換先を使い回す（jpeg はエンコード後に不要になる）。
+        # shm は送信スレッドがリングへ書くまで保持するので、毎回新しい配列にする
+        reuse = self.publisher.transport != 'shm'
+        oriented = None
+        while True:
+            item = cap_q.get()
+            if item is None:
+                out_q.put(None)
+                break
+            seq, ts, arr, due = item
+            payload, out, meta, extras = self._encode(arr, dst=oriented if reuse else None, due=due)
+            if reuse:
+                oriented = out
+            out_q.put((seq, ts, payload, meta, extras))
+
+    def _run_pipelined(self, duration):
+        cap_q = queue.Queue(maxsize=self.queue_size)
+        out_q = queue.Queue(maxsize=self.queue_size + self.workers)
+        threads = [threading.Thread(target=self._capture_loop, args=(cap_q,), name='proxy-capture', daemon=True)]
+        for i in range(self.workers):
+            threads.append(threading.Thread(target=self._encode_loop, args=(cap_q, out_q),
+                                            name=f'proxy-encode-{i}', daemon=True))
+        for t in threads:
+            t.start()
+        # 通し番号順に並べ直して送る（エンコードの終わる順はワーカー間で前後する）
+        pending = {}
+        next_seq = 0
+        finished = 0
+        try:
+            while finished < self.workers:
+                if self._expired(duration):
+                    self.stop()
+                try:
+                    item = out_q.get(timeout=0.5)
+                except queue.Empty:
+                    self._poll_feedback()
+                    self._maybe_send_stats()
+                    continue
+                if item is None:
+                    finished += 1
+                    continue
+                seq, ts, payload, meta, extras = item
+                pending[seq] = (ts, payload, meta, extras)
+                while next_seq in pending:
+                    ts, payload, meta, extras = pending.pop(next_seq)
+                    next_seq += 1
+                    self._publish(payload, ts, meta, extras)
+                self._poll_feedback()
+                self._maybe_send_stats()
+        finally:
+            self.stop()
+            for t in threads:
+                t.join(timeout=2.0)
+
+
+def _make_source(args):
+    pace = not args.no_pace
+    if args.source == 'synthetic':
+        return _SyntheticSource(args.width, args.height, args.fps, pace=pace)
+    if args.source == 'file':
+        if not args.source_path:
+            raise SystemExit('--source file requires --source-path')
+        return _FileSource(args.source_path, args.width, args.height, args.fps, pace=pace)
+    return _PicameraSource(args.width, args.height, args.fps)
+
 
 def main():
     ap = argparse.ArgumentParser()
@@ -20,7 +553,38 @@ def main():
     ap.add_argument('--height', type=int, default=480)
     ap.add_argument('--fps', type=int, default=30)
     ap.add_argument('--quality', type=int, default=85)
-    ap.add_argument('--rotate', type=int, default=180, choices=[0, 90, 180, 270], help='Camera rotation in degrees')
+    ap.add_argument('--rotate', type=int, default=270, choices=[0, 90, 180, 270], help='Camera rotation in degrees (clockwise)')
+    ap.add_argument('--flip-h', action='store_true', help='Mirror horizontally after rotating')
+    ap.add_argument('--flip-v', action='store_true', help='Mirror vertically after rotating')
+    # jpeg: JPEG を ZMQ で送る（リモートホスト向け） / shm: 生フレームを共有メモリに書き、ZMQ では通知のみ送る（同一ホスト向け）
+    # landmarks: このホストで FaceMesh を実行し、ランドマーク配列（約 478x3 float32）だけを送る
+    ap.add_argument('--transport', default='jpeg', choices=['jpeg', 'shm', 'landmarks'], help='Frame transport')
+    ap.add_argument('--face-roi', action='store_true', help='Run FaceMesh on a crop around the previous face (transport=landmarks)')
+    ap.add_argument('--keyframe-interval', type=int, default=1,
+                    help='Run FaceMesh every N frames and track eye/iris points in between (transport=landmarks)')
+    ap.add_argument('--presence-interval', type=int, default=0,
+                    help='While no face is tracked, skip FaceMesh and check for a face every N frames (transport=landmarks, 0 = off)')
+    ap.add_argument('--shm-name', default='focus_alert_frames', help='Shared memory name (transport=shm)')
+    ap.add_argument('--shm-slots', type=int, default=4, help='Number of ring slots (transport=shm)')
+    # パイプライン: 取得とエンコードを別スレッドで並行に行う（0 なら1スレッドで順に処理）
+    ap.add_argument('--workers', type=int, default=2, help='Encode worker threads (0 = single-threaded loop)')
+    ap.add_argument('--queue-size', type=int, default=4, help='Capture queue size; newer frames are dropped when full')
+    # 同じ取得フレームから別トピックを派生させる（繰り返し指定可）。例: --stream preview:320x240@10:50
+    ap.add_argument('--stream', action='append', default=[], metavar='NAME:WxH@FPS[:QUALITY]',
+                    help='Extra JPEG stream from the same capture (size may be "full"); repeatable')
+    ap.add_argument('--stats-topic', default='proxy_stats', help='Topic for per-stage timing and drop counters')
+    ap.add_argument('--stats-interval', type=float, default=5.0, help='Seconds between stats messages')
+    # ベンチマーク用の入力（カメラの無い PC でも動かせる）
+    ap.add_argument('--source', default='picamera2', choices=['picamera2', 'synthetic', 'file'], help='Frame source')
+    ap.add_argument('--source-path', default=None, help='Video file for --source file')
+    ap.add_argument('--no-pace', action='store_true', help='Do not pace synthetic/file sources to --fps; capture waits for the encoders instead of dropping (max throughput)')
+    ap.add_argument('--duration', type=float, default=None, help='Stop after N seconds and print a summary')
+    # 受信側の遅延報告に応じて JPEG 品質・縮小率を切り替える（transport=jpeg のみ）
+    ap.add_argument('--adaptive', action='store_true', help='Adapt JPEG quality/scale to the latency reported by subscribers')
+    ap.add_argument('--feedback-url', default='tcp://127.0.0.1:5556', help='Side channel (PULL) for subscriber latency reports')
+    ap.add_argument('--target-latency-ms', type=float, default=150.0, help='End-to-end latency target for --adaptive')
+    ap.add_argument('--quality-levels', default=None,
+                    help='Quality@scale steps, best first (default: derived from --quality, e.g. 85@1,70@1,55@1,55@0.75,45@0.5)')
     args = ap.parse_args()
 
     ctx = zmq.Context.instance()
@@ -28,53 +592,62 @@ def main():
     pub.bind(args.url)
     topic = args.topic.encode('utf-8')
 
-    picam = Picamera2()
-    
-    # ストリームの設定（size, format のみ。ここに fps は入れない）
-    # あえて RGB888 で取得（こちらの方が内部的に安定することがある）
-    config = picam.create_preview_configuration(
-main={"size": (args.width, args.height), "format": "RGB888"}
-    )
-    picam.configure(config)
+    feedback = None
+    governor = None
+    if args.adaptive:
+        if args.transport != 'jpeg':
+            print("[cam_proxy] --adaptive applies to --transport jpeg only; ignoring", file=sys.stderr)
+        else:
+            if args.quality_levels:
+                levels = parse_quality_levels(args.quality_levels)
+            else:
+                q = args.quality
+                levels = [(q, 1.0), (max(20, q - 15), 1.0), (max(20, q - 30), 1.0),
+                          (max(20, q - 30), 0.75), (max(20, q - 40), 0.5)]
+            governor = LatencyTargetGovernor(levels, target=args.target_latency_ms / 1000.0)
+            feedback = ctx.socket(zmq.PULL)
+            feedback.bind(args.feedback_url)
 
-# カメラ全体の設定（ここで fps を指定する）
-    picam.set_controls({"FrameRate": args.fps})
+    face = None
+    if args.transport == 'landmarks':
+        # mediapipe は landmarks 転送のときだけ読み込む
+        from mediapipe_wrappers import FaceProcessor
+        face = FaceProcessor(static_mode=False, refine_iris=True, max_faces=1, roi=args.face_roi,
+                             keyframe_interval=args.keyframe_interval, presence_interval=args.presence_interval)
 
-    picam.start()
+    streams = parse_streams(args.stream, args.quality)
+    names = [args.topic] + [st.name for st in streams]
+    if len(set(names)) != len(names):
+        raise SystemExit(f"Stream names must differ from each other and from --topic: {names}")
 
-    t_prev = time.time()
-    encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), args.quality]
+    source = _make_source(args)
+    publisher = _Publisher(pub, topic, args.transport, args.shm_name, args.shm_slots)
+    # 回転・反転は1回の変換にまとめる
+    orientation = Orientation(args.rotate, args.flip_h, args.flip_v)
+    # 統計はフレームと同じソケットで、フレームのトピックと前方一致しない別トピックに送る
+    proxy = CamProxy(source, publisher, orientation, quality=args.quality, workers=args.workers,
+                     queue_size=args.queue_size, stats_pub=pub, stats_topic=args.stats_topic.encode('utf-8'),
+                     stats_interval=args.stats_interval, block_capture=args.no_pace,
+                     feedback=feedback, governor=governor, face=face, streams=streams)
 
     try:
-        while True:
-            # NumPy配列として取得（この時点では RGB 順）
-            arr = picam.capture_array()
-
-            # 「反時計回りに90度」は「時計回りに270度」と同じです。
-            # OpenCVでは cv2.ROTATE_90_COUNTERCLOCKWISE を使用します。
-            arr = cv2.rotate(arr, cv2.ROTATE_90_COUNTERCLOCKWISE)
-            
-            # 【重要】RGB から BGR へ変換
-            # OpenCVのimencodeは「BGR」の並びを想定してJPEGを作るため、ここでの変換が不可欠です
-            frame_bgr = cv2.cvtColor(arr, cv2.COLOR_RGB2BGR)
-            
-            # エンコードして送信
-            ok, enc = cv2.imencode('.jpg', arr, encode_param)
-            
-            if not ok:
-                continue
-                
-            pub.send_multipart([topic, enc.tobytes()])
-            
-            # FPS計算など（省略）
-            t_prev = time.time()
-
+        proxy.run(duration=args.duration)
     except KeyboardInterrupt:
         pass
     finally:
-        picam.stop()
+        proxy.stop()
+        source.close()
+        publisher.close()
+        elapsed = time.time() - proxy.started if proxy.started else 0.0
+        c = proxy.counters
+        if elapsed > 0:
+            print(f"[cam_proxy] {elapsed:.1f}s workers={proxy.workers} captured={c['captured']} "
+                  f"published={c['published']} ({c['published'] / elapsed:.1f} fps) "
+                  f"drop_capture={c['drop_capture']} encode_failed={c['encode_failed']}", flush=True)
+        if feedback is not None:
+            feedback.close(0)
         pub.close(0)
         ctx.term()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
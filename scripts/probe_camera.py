@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+カメラが実際に出せる構成（ピクセル形式 × 解像度 × fps）を総当たりで計測し、
+最速の構成を config/camera_cache.json に保存する
+
+保存した構成は capture.Camera(cache_path=...) が読み込み、backend=auto のときの
+Picamera2 の試行や、OpenCV のピクセル形式の既定値による遅い構成を避けます。
+
+例:
+  python scripts/probe_camera.py --cam 0 --width 640 --height 480
+  python scripts/probe_camera.py --list-only
+"""
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import psutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from capture import DEFAULT_CAMERA_CACHE, save_camera_cache
+
+
+DEFAULT_FOURCCS = ['MJPG', 'YUYV']
+DEFAULT_SIZES = ['320x240', '640x480', '800x600', '1280x720']
+DEFAULT_FPS = [15, 30, 60]
+
+
+def _decode_fourcc(value):
+    v = int(value)
+    if v <= 0:
+        return None
+    return ''.join(chr((v >> (8 * i)) & 0xFF) for i in range(4))
+
+
+def _measure(read, frames, warmup):
+    """read() を frames 回呼んで、実効fps と 1フレームあたりの CPU 時間を測る"""
+    for _ in range(warmup):
+        ok, _ = read()
+        if not ok:
+            return None
+    proc = psutil.Process()
+    cpu0 = proc.cpu_times()
+    t0 = time.perf_counter()
+    got = 0
+    for _ in range(frames):
+        ok, _ = read()
+        if not ok:
+            break
+        got += 1
+    elapsed = time.perf_counter() - t0
+    cpu1 = proc.cpu_times()
+    if got == 0 or elapsed <= 0:
+        return None
+    cpu = (cpu1.user - cpu0.user) + (cpu1.system - cpu0.system)
+    return {
+        'frames': got,
+        'fps_measured': got / elapsed,
+        'cpu_percent': 100.0 * cpu / elapsed,
+        'cpu_ms_per_frame': 1000.0 * cpu / got,
+    }
+
+
+def probe_opencv(index, fourcc, width, height, fps, frames, warmup):
+    cap = cv2.VideoCapture(index)
+    if not cap.isOpened():
+        cap = cv2.VideoCapture(index, cv2.CAP_DSHOW)
+    if not cap.isOpened():
+        return None
+    try:
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        cap.set(cv2.CAP_PROP_FPS, fps)
+        actual = {
+            'fourcc': _decode_fourcc(cap.get(cv2.CAP_PROP_FOURCC)),
+            'width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            'height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            'fps': cap.get(cv2.CAP_PROP_FPS),
+        }
+        # ドライバが黙って別の構成に置き換えた組み合わせは「非対応」として扱う
+        supported = (actual['width'], actual['height']) == (width, height) and \
+            (actual['fourcc'] is None or actual['fourcc'] == fourcc)
+        result = {'backend': 'opencv', 'index': index, 'fourcc': fourcc, 'width': width, 'height': height,
+                  'fps': fps, 'actual': actual, 'supported': supported}
+        if supported:
+            m = _measure(cap.read, frames, warmup)
+            if m is None:
+                result['supported'] = False
+            else:
+                result.update(m)
+        return result
+    finally:
+        cap.release()
+
+
+def probe_picamera2(width, height, fps, frames, warmup):
+    try:
+        from picamera2 import Picamera2
+    except Exception:
+        return None
+    picam = Picamera2()
+    try:
+        config = picam.create_video_configuration(main={"size": (width, height), "format": "RGB888"})
+        picam.configure(config)
+        try:
+            picam.set_controls({"FrameRate": fps})
+        except Exception:
+            pass
+        picam.start()
+
+        def read():
+            return True, picam.capture_array()
+
+        result = {'backend': 'picamera2', 'fourcc': None, 'width': width, 'height': height,
+                  'fps': fps, 'supported': True}
+        m = _measure(read, frames, warmup)
+        if m is None:
+            result['supported'] = False
+        else:
+            result.update(m)
+        return result
+    except Exception as e:
+        print(f"Picamera2 {width}x{height}@{fps}: {e}")
+        return None
+    finally:
+        try:
+            picam.stop()
+            picam.close()
+        except Exception:
+            pass
+
+
+def pick_best(results, width, height):
+    """要求解像度で動いた構成のうち、実効fps が最も高いもの（同程度なら CPU 負荷が低いもの）"""
+    ok = [r for r in results if r.get('supported') and (r['width'], r['height']) == (width, height)]
+    if not ok:
+        return None
+    # 1fps 未満の差は計測誤差とみなし、CPU 時間で選ぶ
+    return min(ok, key=lambda r: (-round(r['fps_measured']), r['cpu_ms_per_frame']))
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Probe camera formats and cache the fastest configuration')
+    ap.add_argument('--cam', type=int, default=0)
+    ap.add_argument('--width', type=int, default=640, help='アプリで使う解像度の幅（この解像度の最速構成を保存）')
+    ap.add_argument('--height', type=int, default=480, help='アプリで使う解像度の高さ')
+    ap.add_argument('--fourccs', type=str, default=','.join(DEFAULT_FOURCCS), help='試すピクセル形式（カンマ区切り）')
+    ap.add_argument('--sizes', type=str, default=','.join(DEFAULT_SIZES), help='試す解像度（幅x高さ、カンマ区切り）')
+    ap.add_argument('--fps', type=str, default=','.join(str(f) for f in DEFAULT_FPS), help='試すfps（カンマ区切り）')
+    ap.add_argument('--frames', type=int, default=90, help='1構成あたりの計測フレーム数')
+    ap.add_argument('--warmup', type=int, default=10, help='計測前に読み捨てるフレーム数')
+    ap.add_argument('--no-picamera2', action='store_true', help='Picamera2 を試さない')
+    ap.add_argument('--list-only', action='store_true', help='計測結果を表示するだけでキャッシュは保存しない')
+    ap.add_argument('--output', type=str, default=DEFAULT_CAMERA_CACHE)
+    args = ap.parse_args()
+
+    fourccs = [f.strip() for f in args.fourccs.split(',') if f.strip()]
+    sizes = []
+    for item in args.sizes.split(','):
+        w, h = item.strip().lower().split('x')
+        sizes.append((int(w), int(h)))
+    if (args.width, args.height) not in sizes:
+        sizes.append((args.width, args.height))
+    fps_list = [int(f) for f in args.fps.split(',') if f.strip()]
+
+    results = []
+    for w, h in sizes:
+        for fps in fps_list:
+            if not args.no_picamera2:
+                r = probe_picamera2(w, h, fps, args.frames, args.warmup)
+                if r is not None:
+                    results.append(r)
+            for fourcc in fourccs:
+                r = probe_opencv(args.cam, fourcc, w, h, fps, args.frames, args.warmup)
+                if r is None:
+                    continue
+                results.append(r)
+
+    if not results:
+        print("No camera could be opened.")
+        return 1
+
+    print(f"{'backend':<10} {'fourcc':<6} {'size':>10} {'req fps':>7} {'fps':>7} {'cpu%':>6} {'cpu ms/f':>9}")
+    for r in results:
+        size = f"{r['width']}x{r['height']}"
+        if not r.get('supported'):
+            a = r.get('actual') or {}
+            got = f"-> {a.get('fourcc')} {a.get('width')}x{a.get('height')}" if a else ''
+            print(f"{r['backend']:<10} {str(r['fourcc']):<6} {size:>10} {r['fps']:>7} {'unsupported':>7} {got}")
+            continue
+        print(f"{r['backend']:<10} {str(r['fourcc']):<6} {size:>10} {r['fps']:>7} "
+              f"{r['fps_measured']:>7.1f} {r['cpu_percent']:>6.1f} {r['cpu_ms_per_frame']:>9.2f}")
+
+    best = pick_best(results, args.width, args.height)
+    if best is None:
+        print(f"No working configuration at {args.width}x{args.height}.")
+        return 1
+    print(f"Fastest at {args.width}x{args.height}: {best['backend']} {best['fourcc'] or ''} "
+          f"@{best['fps']} ({best['fps_measured']:.1f} fps, {best['cpu_ms_per_frame']:.2f} ms CPU/frame)")
+    if not args.list_only:
+        save_camera_cache(args.output, best, results)
+        print(f"Saved: {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,6 @@
 #!/usr/bin/env bash
 # Picamera2からの映像をZMQで配信する送信プロセス（system python）と、解析アプリ（pyenv 3.11）を起動する
-# 使い方: ./scripts/start_focus_alert.sh [--width 640] [--height 480] [--fps 30] [--quality 85]
+# 使い方: ./scripts/start_focus_alert.sh [--width 640] [--height 480] [--fps 30] [--quality 85] [--transport jpeg|shm|landmarks] [--adaptive] [--face-workers N] [--idle-after SEC]
 set -euo pipefail
 
 # 【追加】デスクトップ起動用にpyenvの初期化を明示的に行う
@@ -14,6 +14,13 @@ FPS=30
 QUALITY=85
 URL="tcp://127.0.0.1:5555"
 TOPIC="frame"
+# jpeg: JPEG を ZMQ で配信 / shm: 同一ホスト向けに共有メモリで生フレームを受け渡す
+# landmarks: プロキシ側で FaceMesh を実行し、ランドマークだけを配信する
+TRANSPORT="jpeg"
+# --adaptive: アプリが処理の遅れを報告し、プロキシが JPEG 品質・縮小率を調整する（jpeg のみ）
+FEEDBACK_URL="tcp://127.0.0.1:5556"
+PROXY_EXTRA=()
+APP_EXTRA=()
 APP_LOG_DIR="logs"
 
 # 簡単なオプション引数を解析
@@ -25,6 +32,15 @@ while [[ $# -gt 0 ]]; do
     --quality) QUALITY="$2"; shift 2;;
     --url) URL="$2"; shift 2;;
     --topic) TOPIC="$2"; shift 2;;
+    --transport) TRANSPORT="$2"; shift 2;;
+    --adaptive)
+      PROXY_EXTRA+=(--adaptive --feedback-url "$FEEDBACK_URL")
+      APP_EXTRA+=(--zmq-feedback-url "$FEEDBACK_URL")
+      shift;;
+    # --face-workers N: アプリ側の FaceMesh を N 個の別プロセスで実行する（マルチコア向け）
+    --face-workers) APP_EXTRA+=(--face-workers "$2"); shift 2;;
+    # --idle-after SEC: 顔が SEC 秒見つからなければ、アプリの処理・描画の頻度を下げる
+    --idle-after) APP_EXTRA+=(--idle-after "$2"); shift 2;;
     *) echo "Unknown arg: $1"; exit 1;;
   esac
 done
@@ -74,11 +90,12 @@ PROXY_LOG="$APP_LOG_DIR/cam_proxy_${TIMESTAMP}.log"
   fi
   echo "[cam_proxy] Starting camera proxy..."
   # システムPythonを直接実行
-  # カメラを180度回転（上下反転を修正）
+  # カメラを時計回りに270度（反時計回りに90度）回転
   exec "$SYSTEM_PYTHON3" "$PROJ_DIR/scripts/cam_proxy.py" \
     --url "$URL" --topic "$TOPIC" \
     --width "$WIDTH" --height "$HEIGHT" --fps "$FPS" --quality "$QUALITY" \
-    --rotate 180
+    --transport "$TRANSPORT" \
+    --rotate 270 ${PROXY_EXTRA[@]+"${PROXY_EXTRA[@]}"}
 ) &
 PROXY_PID=$!
 echo "[launcher] cam_proxy started pid=$PROXY_PID (log: $PROXY_LOG)"
@@ -96,6 +113,12 @@ if [[ ! -f "$PROJ_DIR/.python-version" ]]; then
 fi
 
 APP_LOG="$APP_LOG_DIR/app_${TIMESTAMP}.log"
+APP_BACKEND="zmq"
+if [[ "$TRANSPORT" == "shm" ]]; then
+  APP_BACKEND="shm"
+elif [[ "$TRANSPORT" == "landmarks" ]]; then
+  APP_BACKEND="landmarks"
+fi
 (
   # エラーハンドリングを改善（確実にログに出力されるように）
   exec >"$APP_LOG" 2>&1
@@ -110,11 +133,11 @@ APP_LOG="$APP_LOG_DIR/app_${TIMESTAMP}.log"
   echo "[app_gui] Project directory: $PROJ_DIR"
   # GUI版アプリを起動（メインメニューから選択可能）
   exec python "$PROJ_DIR/src/app_gui.py" \
-    --backend zmq --zmq-url "$URL" --zmq-topic "$TOPIC" \
+    --backend "$APP_BACKEND" --zmq-url "$URL" --zmq-topic "$TOPIC" \
     --width "$WIDTH" --height "$HEIGHT" \
     --display-width 480 --display-height 320 \
     --log-dir "$APP_LOG_DIR" \
-    --config-dir "$PROJ_DIR/config"
+    --config-dir "$PROJ_DIR/config" ${APP_EXTRA[@]+"${APP_EXTRA[@]}"}
 ) &
 APP_PID=$!
 echo "[launcher] app (GUI) started pid=$APP_PID (log: $APP_LOG)"
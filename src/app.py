@@ -1,16 +1,23 @@
 import argparse
+import os
 import time
 import cv2
 import numpy as np
 
-from capture import Camera
-from mediapipe_wrappers import FaceProcessor
+from capture import Camera, DEFAULT_CAMERA_CACHE
+from mediapipe_wrappers import DEFAULT_FACE_MODEL, FaceLandmarkerProcessor, FaceProcessor, limit_threads, missing_face_model
+from face_worker import FaceWorkerPool
 from features.blink import BlinkDetector
 from features.gaze import GazeEstimator
 from fusion import FusionScorer
+from multi_face import FaceTracker
 from personalize import Personalizer
 from overlay import Overlay
 from logger import CSVLogger
+from recorder import FrameRecorder
+from governor import CaptureGovernor, default_levels, parse_levels
+from idle import IdleController
+from pipeline import FramePipeline
 
 
 def parse_args():
@@ -25,12 +32,48 @@ def parse_args():
     p.add_argument('--auto-log-name', action='store_true', default=True, help='ログファイル名を自動生成（日時ベース）')
     p.add_argument('--alert-mode', type=str, default='on', choices=['on','off'], help='off にするとアラート表示を無効化')
     # カメラのバックエンド/向き（Raspberry Pi を想定）
-    p.add_argument('--backend', type=str, default='auto', choices=['auto','opencv','picamera2','zmq'], help='使用するカメラバックエンド')
+    p.add_argument('--backend', type=str, default='auto', choices=['auto','opencv','picamera2','zmq','shm','replay','landmarks'], help='使用するカメラバックエンド（landmarks: cam_proxy.py --transport landmarks のランドマークを受信）')
     p.add_argument('--rotate', type=int, default=0, choices=[0,90,180,270], help='フレームの回転角（度）')
     p.add_argument('--flip-h', action='store_true', help='左右反転')
     p.add_argument('--flip-v', action='store_true', help='上下反転')
-    p.add_argument('--zmq-url', type=str, default='tcp://127.0.0.1:5555', help='ZMQ カメラプロキシのURL（backend=zmq 用）')
-    p.add_argument('--zmq-topic', type=str, default='frame', help='ZMQ のトピック名（backend=zmq 用）')
+    p.add_argument('--orient-landmarks', action='store_true', help='画素は回転・反転せず、ランドマーク座標だけを変換する（FaceMesh が元の向きの顔を検出できる場合に）')
+    p.add_argument('--zmq-url', type=str, default='tcp://127.0.0.1:5555', help='ZMQ カメラプロキシのURL（backend=zmq/shm 用）')
+    p.add_argument('--zmq-topic', type=str, default='frame', help='ZMQ のトピック名（backend=zmq/shm 用）')
+    p.add_argument('--zmq-latest-only', action='store_true', help='ZMQ の受信キューを空にして最新フレームだけをデコード（backend=zmq 用）')
+    p.add_argument('--zmq-feedback-url', type=str, default=None, help='処理の遅れを cam_proxy.py --adaptive に報告する副チャネル（例: tcp://127.0.0.1:5556）')
+    p.add_argument('--zmq-decode-scale', type=str, default='1', choices=['1','2','4','auto'], help='JPEG を 1/2・1/4 に縮小してデコード（auto は --width/--height を基準に選択）')
+    # 録画の再生（backend=replay 用。カメラ無しでのベンチマーク向け）
+    p.add_argument('--replay-path', type=str, default=None, help='再生する動画ファイルまたは連番画像ディレクトリ（backend=replay 用）')
+    p.add_argument('--replay-pace', type=str, default='recorded', choices=['recorded','fps','fast'], help='再生速度: 記録時刻どおり / 固定fps / 最速')
+    p.add_argument('--replay-fps', type=float, default=30.0, help='--replay-pace fps の再生fps（時刻情報の無い連番画像にも使用）')
+    p.add_argument('--replay-loop', action='store_true', help='末尾まで再生したら先頭に戻る')
+    p.add_argument('--headless', action='store_true', help='ウィンドウを表示せずに処理する（記録は自動で開始し、再生の終了か --duration で終わって処理性能を表示）。'
+                   'ライブのカメラ・--replay-loop では --duration が必要')
+    p.add_argument('--duration', type=float, default=0.0, help='この秒数で処理を終える（0 で無制限）')
+    # 生フレームの録画（ログと同じ名前の .avi と _frames.csv。backend=replay で再生可能）
+    p.add_argument('--record-frames', action='store_true', help='記録中のカメラフレームをログと並べて録画する')
+    p.add_argument('--record-queue', type=int, default=64, help='録画の書き込み待ちキューの上限（フレーム数）')
+    p.add_argument('--record-drop', type=str, default='drop_oldest', choices=['drop_oldest','drop_new'], help='キューが満杯のときに捨てるフレーム')
+    p.add_argument('--face-roi', action='store_true', help='前フレームの顔周辺だけを FaceMesh に渡して処理を軽くする')
+    p.add_argument('--keyframe-interval', type=int, default=1, help='FaceMesh を Nフレームに1回だけ実行し、間は目と虹彩の点を追跡する（1 で毎フレーム）')
+    p.add_argument('--face-backend', type=str, default='solutions', choices=['solutions','tasks'], help='顔ランドマークの推論: solutions（FaceMesh, 同期）/ tasks（FaceLandmarker, LIVE_STREAM の非同期）')
+    p.add_argument('--face-model', type=str, default=DEFAULT_FACE_MODEL, help='--face-backend tasks のモデル（face_landmarker.task）')
+    p.add_argument('--face-wait-ms', type=float, default=0.0, help='--face-backend tasks で新しい結果が無いときに待つ最大時間（ミリ秒）')
+    p.add_argument('--face-threads', type=int, default=0, help='--face-backend tasks で OpenCV の画像処理に使うスレッド数の上限（0 で制限しない）')
+    p.add_argument('--face-workers', type=int, default=0, help='FaceMesh を別プロセスで実行するワーカー数（0 ならメインループ内で実行）')
+    p.add_argument('--presence-interval', type=int, default=0, help='顔を見失っている間は FaceMesh を止め、Nフレームに1回だけ軽い判定で顔の出現を調べる（0 で無効）')
+    p.add_argument('--presence-mode', type=str, default='detector', choices=['detector','motion','both'], help='--presence-interval の判定: 短距離の顔検出器 / フレーム差分 / 差分で動きがあれば検出器')
+    p.add_argument('--max-faces', type=int, default=1, help='同時に追跡する顔の数（2 以上で顔ごとに ID を振り、判定・ログも顔ごとに行う）')
+    p.add_argument('--track-max-error', type=float, default=1.5, help='キーフレーム間の追跡誤差（ピクセル）の上限。超えたら FaceMesh を実行')
+    # 処理の遅れに応じた取得解像度・fps の自動調整
+    p.add_argument('--governor', action='store_true', help='処理時間に応じてカメラの解像度・fpsを段階的に切り替える')
+    p.add_argument('--governor-levels', type=str, default=None, help='切り替えるレベル（重い順、幅x高さ@fps をカンマ区切り）。省略時は --width/--height を最上段に 3/4・1/2 の3段')
+    # 不在時の省電力
+    p.add_argument('--idle-after', type=float, default=0.0, help='顔が見つからない状態がこの秒数続いたら、カメラと描画の頻度を下げる（0 で無効）')
+    p.add_argument('--idle-fps', type=float, default=2.0, help='アイドル中に顔の有無を調べるフレームレート')
+    p.add_argument('--no-reconnect', action='store_true', help='カメラが切断されても自動で再接続しない')
+    p.add_argument('--threaded-capture', action='store_true', help='別スレッドでカメラを読み、常に最新フレームを処理する')
+    p.add_argument('--camera-cache', type=str, default=DEFAULT_CAMERA_CACHE, help='scripts/probe_camera.py が保存した最速構成（backend=auto/opencv で使用）')
     # 実験のメタ情報
     p.add_argument('--session', type=str, default=None)
     p.add_argument('--participant', type=str, default=None)
@@ -50,16 +93,70 @@ def parse_args():
 
 def main():
     args = parse_args()
+    if args.backend == 'replay' and not args.replay_path:
+        print("Error: --replay-path is required for backend=replay")
+        return
+    if args.headless and args.duration <= 0 and (args.backend != 'replay' or args.replay_loop):
+        # ヘッドレスでは 'q' を押せないので、終わりの無い入力には時間の上限を必須にする
+        print("Error: --headless needs --duration with a live camera or --replay-loop")
+        return
+    # landmarks: 送信側で FaceMesh 済みのランドマークを受け取る（画素は届かない）
+    landmark_mode = args.backend == 'landmarks'
+    if landmark_mode and args.record_frames:
+        print("Warning: --record-frames is ignored for backend=landmarks (no frames are received)")
+        args.record_frames = False
+
+    governor = None
+    if args.governor:
+        levels = parse_levels(args.governor_levels) if args.governor_levels else default_levels(args.width, args.height)
+        governor = CaptureGovernor(levels)
+    cap_w, cap_h, cap_fps = governor.current if governor else (args.width, args.height, 30)
 
     try:
-        cam = Camera(index=args.cam, width=args.width, height=args.height, fps=30,
+        cam = Camera(index=args.cam, width=cap_w, height=cap_h,
+                    fps=args.replay_fps if args.backend == 'replay' else cap_fps,
                     backend=args.backend, rotate=args.rotate, flip_h=args.flip_h, flip_v=args.flip_v,
-                    zmq_url=args.zmq_url, zmq_topic=args.zmq_topic).open()
+                    zmq_url=args.zmq_url, zmq_topic=args.zmq_topic,
+                    threaded=args.threaded_capture, color_order='rgb',
+                    zmq_latest_only=args.zmq_latest_only, zmq_decode_scale=args.zmq_decode_scale,
+                    replay_path=args.replay_path, replay_pace=args.replay_pace, replay_loop=args.replay_loop,
+                    auto_reconnect=not args.no_reconnect, cache_path=args.camera_cache,
+                    orient_pixels=not args.orient_landmarks, zmq_feedback_url=args.zmq_feedback_url).open()
     except Exception as e:
         print(f"Error: Failed to open camera: {e}")
         print("Please check camera connection and permissions.")
         return
-    face = FaceProcessor(static_mode=False, refine_iris=True, max_faces=1)
+    face = None
+    face_pool = None
+    if not landmark_mode:
+        if args.max_faces > 1 and (args.face_roi or args.keyframe_interval > 1):
+            print("Warning: --face-roi/--keyframe-interval are ignored with --max-faces > 1")
+        face_kwargs = dict(static_mode=False, refine_iris=True, max_faces=args.max_faces, roi=args.face_roi,
+                           keyframe_interval=args.keyframe_interval, track_max_error=args.track_max_error,
+                           presence_interval=args.presence_interval, presence_mode=args.presence_mode)
+        missing = missing_face_model(args.face_model) if args.face_backend == 'tasks' else None
+        if missing:
+            # モデルが無いときは mediapipe の奥で失敗させず、取得方法を示して solutions の FaceMesh で続ける
+            print(f"Warning: {missing}\n  Falling back to --face-backend solutions")
+            args.face_backend = 'solutions'
+        if args.face_backend == 'tasks':
+            # Tasks の FaceLandmarker（LIVE_STREAM）。推論は MediaPipe 内部のスレッドで非同期に進む
+            if args.face_workers > 0 or args.face_roi or args.keyframe_interval > 1 or args.presence_interval > 0:
+                print("Warning: --face-workers/--face-roi/--keyframe-interval/--presence-interval "
+                      "are ignored for --face-backend tasks")
+            if args.face_workers <= 0:
+                limit_threads(args.face_threads)
+            face = FaceLandmarkerProcessor(args.face_model, max_faces=args.max_faces, orientation=cam.landmark_orientation,
+                                           wait_ms=args.face_wait_ms)
+        elif args.face_workers > 0:
+            # FaceMesh を別プロセスで動かし、メインループは結果の出たフレームから順に処理する
+            try:
+                face_pool = FaceWorkerPool(workers=args.face_workers, orientation=cam.landmark_orientation,
+                                           **face_kwargs).start()
+            except Exception as e:
+                print(f"Warning: FaceMesh workers unavailable ({e}); processing in the main loop")
+        if face is None and face_pool is None:
+            face = FaceProcessor(orientation=cam.landmark_orientation, **face_kwargs)
 
     blink = BlinkDetector()
     # まばたき検出の閾値を調整
@@ -81,12 +178,26 @@ def main():
             perso.apply_to_detectors(blink_detector=blink, gaze_estimator=gaze)
         except Exception as e:
             print('Failed to load model:', e)
+
+    tracker = None
+    if args.max_faces > 1:
+        # 複数人モード: 顔ごとに追跡 ID と検出器・スコアを持つ。表示と学習は代表の顔（最も古い追跡）で行う
+        def setup_face_detectors(track):
+            # 顔ごとの検出器は、上で設定した検出器と同じしきい値・基準値から始める
+            track.blink.open_baseline = blink.open_baseline
+            track.blink.ear_threshold_ratio = blink.ear_threshold_ratio
+            track.blink.adapt_enabled = blink.adapt_enabled
+            track.gaze.bias, track.gaze.bias_y = gaze.bias, gaze.bias_y
+            track.fusion.hi = fusion.hi
+        tracker = FaceTracker(max_faces=args.max_faces, setup=setup_face_detectors)
+        if landmark_mode:
+            print("Warning: backend=landmarks receives one face per frame; --max-faces has no effect")
     overlay = Overlay()
     # ログファイルは「記録開始」ボタンが押されたときに作成される
     # ここではloggerをNoneに設定（後で作成される）
     logger = None
+    recorder = None
 
-    last_alert_time = 0.0
     cooldown_sec = 60.0
     alert_enabled = (args.alert_mode == 'on')
     block_id = None
@@ -112,167 +223,124 @@ def main():
     if args.display_width is None or args.display_height is None:
         # Raspberry Pi用のデフォルト（3.5インチタッチモニタ）
         # PCではカメラ解像度をそのまま表示
-        if args.backend == 'zmq':
+        if args.backend in ('zmq', 'shm', 'landmarks'):
             # Raspberry Pi用: 320×480に固定
             display_width = args.display_width if args.display_width else 320
             display_height = args.display_height if args.display_height else 480
         else:
             # PC用: カメラ解像度をそのまま使用（または指定値）
-            display_width = args.display_width if args.display_width else args.width
-            display_height = args.display_height if args.display_height else args.height
+            display_width = args.display_width if args.display_width else cam.width
+            display_height = args.display_height if args.display_height else cam.height
     else:
         display_width = args.display_width
         display_height = args.display_height
 
-    cv2.namedWindow(win_name, cv2.WINDOW_NORMAL)
-    cv2.resizeWindow(win_name, display_width, display_height)
-    # Raspberry Pi用のみフルスクリーン
-    if args.backend == 'zmq':
-        cv2.setWindowProperty(win_name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
-    frame_failure_count = 0
-    max_failures = 30  # 約1秒間（30fps想定）連続で失敗したら警告
-    
+    if not args.headless:
+        cv2.namedWindow(win_name, cv2.WINDOW_NORMAL)
+        cv2.resizeWindow(win_name, display_width, display_height)
+        # Raspberry Pi用のみフルスクリーン
+        if args.backend in ('zmq', 'shm', 'landmarks'):
+            cv2.setWindowProperty(win_name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
+    bench_start = time.time()
+    # 不在時の省電力: 顔が --idle-after 秒見つからなければ、--idle-fps でだけフレームを取得・処理・描画する
+    idle = IdleController(args.idle_after, args.idle_fps) if args.idle_after > 0 else None
+    pipeline = FramePipeline(cam, blink, gaze, fusion, perso, face=face, face_pool=face_pool,
+                             face_factory=lambda: FaceProcessor(orientation=cam.landmark_orientation, **face_kwargs),
+                             landmark_mode=landmark_mode, tracker=tracker, idle=idle, governor=governor,
+                             phase=args.phase, learning_enabled=learning_enabled, alert_enabled=alert_enabled,
+                             cooldown_sec=cooldown_sec, overlay=None if args.headless else overlay)
+
     while True:
-        ok, frame = cam.read()
-        if not ok:
-            frame_failure_count += 1
-            if frame_failure_count >= max_failures:
-                print(f"Warning: Camera frame read failed {frame_failure_count} times consecutively.")
-                # 完全に停止せず、エラー表示を続ける
-            # エラー時も空のフレームで処理を続行（UIでエラー表示）
-            if frame is None:
-                # ダミーフレームを作成（エラー表示用）
-                frame = np.zeros((args.height, args.width, 3), dtype=np.uint8)
-                cv2.putText(frame, "Camera Error", (50, args.height//2), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-        else:
-            frame_failure_count = 0  # 成功したらリセット
-        t0 = time.time()
-        try:
-            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            fm = face.process(rgb)
-        except Exception as e:
-            print(f"Error processing frame: {e}")
-            fm = None
+        out = pipeline.step(logger, recorder, block_id)
+        if out is None:
+            break
+        if args.duration > 0 and time.time() - bench_start >= args.duration:
+            break
+        ok, frame, feats, score, alert = out['ok'], out['frame'], out['feats'], out['score'], out['alert']
+        fps, status, cam_status = out['fps'], out['status'], out['cam_status']
 
-        feats = {}
-        status = {
-            'has_face': bool(fm and fm.get('has_face', False)),
-            'phase': args.phase,
-            'calibrating': perso.in_calibration() if args.phase == 'train' else False,
-        }
-        if fm is not None and fm['landmarks'] is not None:
-            lms = fm['landmarks']
-            feats['blink'] = blink.update(lms)
-            feats['gaze'] = gaze.update(lms)
+        if args.headless:
+            # 描画・表示は行わない。最初のフレームで記録を自動開始する
+            key = ord('s') if not is_recording else 0xFF
         else:
-            feats['blink'] = blink.miss()
-            feats['gaze'] = gaze.miss()
-
-        # まずスコアを更新し、アラート判定
-        score = fusion.update(feats, perso)
-        now = time.time()
-        alert = fusion.should_alert(score, now, last_alert_time, cooldown_sec) if alert_enabled else False
-        if alert:
-            last_alert_time = now
-
-        # 次に、学習ONの場合のみパーソナライズを更新
-        if learning_enabled:
-            perso.update(feats, status=status, alert=alert)
-
-        fps = 1.0 / max(1e-3, (time.time() - t0))
-        
-        # カメラ状態を取得
-        cam_status_dict = cam.get_status() if hasattr(cam, 'get_status') else {}
-        cam_status = {
-            'connected': cam_status_dict.get('connected', cam.impl is not None),
-            'frame_ok': ok,
-            'fps': fps,
-            'consecutive_failures': cam_status_dict.get('consecutive_failures', 0),
-        }
-        
-        # 横長モードの判定（表示幅 > 表示高さ）
-        landscape_mode = (display_width > display_height)
+            # 横長モードの判定（表示幅 > 表示高さ）
+            landscape_mode = (display_width > display_height)
         
-        vis = overlay.draw(frame, feats, score, alert, fps, status=status, 
-                          show_alert_text=alert_enabled, cam_status=cam_status,
-                          landscape_mode=landscape_mode, is_recording=is_recording, block_id=block_id)
-        btn_rects = overlay.draw_buttons(vis, states={'distract_on': distractor_on},
-                                        landscape_mode=landscape_mode, is_recording=is_recording)
+            vis = overlay.draw(frame, feats, score, alert, fps, status=status, 
+                              show_alert_text=alert_enabled, cam_status=cam_status,
+                              landscape_mode=landscape_mode, is_recording=is_recording, block_id=block_id,
+                              color_order=cam.color_order,
+                              orientation=cam.landmark_orientation if ok else None)
+            btn_rects = overlay.draw_buttons(vis, states={'distract_on': distractor_on},
+                                            landscape_mode=landscape_mode, is_recording=is_recording)
 
-        if logger:
-            logger.write_frame(feats, score, alert, block_id=block_id)
-
-        # フレームを表示解像度にリサイズ（アスペクト比を維持しつつフィット）
-        h, w = vis.shape[:2]
-        target_w, target_h = display_width, display_height
+            # フレームを表示解像度にリサイズ（アスペクト比を維持しつつフィット）
+            h, w = vis.shape[:2]
+            target_w, target_h = display_width, display_height
         
-        # カメラ解像度と表示解像度が同じ場合はリサイズ不要
-        if w == target_w and h == target_h:
-            vis_display = vis
-            btn_rects_scaled = btn_rects
-        else:
-            scale = min(target_w / w, target_h / h)
-            new_w = int(w * scale)
-            new_h = int(h * scale)
-            vis_resized = cv2.resize(vis, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+            # カメラ解像度と表示解像度が同じ場合はリサイズ不要
+            if w == target_w and h == target_h:
+                vis_display = vis
+                btn_rects_scaled = btn_rects
+            else:
+                scale = min(target_w / w, target_h / h)
+                new_w = int(w * scale)
+                new_h = int(h * scale)
+                vis_resized = cv2.resize(vis, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
             
-            # 黒背景に中央配置
-            vis_display = np.zeros((target_h, target_w, 3), dtype=np.uint8)
-            y_offset = (target_h - new_h) // 2
-            x_offset = (target_w - new_w) // 2
-            vis_display[y_offset:y_offset+new_h, x_offset:x_offset+new_w] = vis_resized
+                # 黒背景に中央配置
+                vis_display = np.zeros((target_h, target_w, 3), dtype=np.uint8)
+                y_offset = (target_h - new_h) // 2
+                x_offset = (target_w - new_w) // 2
+                vis_display[y_offset:y_offset+new_h, x_offset:x_offset+new_w] = vis_resized
             
-            # ボタン矩形をリサイズ後の座標に変換
-            btn_rects_scaled = {}
-            for name, (x1, y1, x2, y2) in btn_rects.items():
-                btn_rects_scaled[name] = (
-                    int(x1 * scale + x_offset),
-                    int(y1 * scale + y_offset),
-                    int(x2 * scale + x_offset),
-                    int(y2 * scale + y_offset)
-                )
+                # ボタン矩形をリサイズ後の座標に変換
+                btn_rects_scaled = {}
+                for name, (x1, y1, x2, y2) in btn_rects.items():
+                    btn_rects_scaled[name] = (
+                        int(x1 * scale + x_offset),
+                        int(y1 * scale + y_offset),
+                        int(x2 * scale + x_offset),
+                        int(y2 * scale + y_offset)
+                    )
         
-        cv2.imshow(win_name, vis_display)
-        cv2.setMouseCallback(win_name, on_mouse)
-        key = cv2.waitKey(1) & 0xFF
-        # タッチ入力 → ボタン矩形のヒットテストでキーを擬似的に発火
-        if last_click['x'] is not None:
-            x, y = last_click['x'], last_click['y']
-            last_click['x'] = None
-            # リサイズ後の座標で判定
-            for name, (x1,y1,x2,y2) in btn_rects_scaled.items():
-                if x1 <= x <= x2 and y1 <= y <= y2:
-                    if name == 'start':
-                        key = ord('s')
-                    elif name == 'stop':
-                        key = ord('e')
-                    elif name == 'new_block':
-                        key = ord('b')  # 'b' for new block
-                    elif name == 'marker':
-                        key = ord('m')
-                    elif name == 'distract':
-                        key = ord('d')
-                    elif name == 'calib':
-                        key = ord('c')
-                    elif name == 'quit':
-                        key = ord('q')
-                    break
+            cv2.imshow(win_name, vis_display)
+            cv2.setMouseCallback(win_name, on_mouse)
+            key = cv2.waitKey(1) & 0xFF
+            # タッチ入力 → ボタン矩形のヒットテストでキーを擬似的に発火
+            if last_click['x'] is not None:
+                x, y = last_click['x'], last_click['y']
+                last_click['x'] = None
+                # リサイズ後の座標で判定
+                for name, (x1,y1,x2,y2) in btn_rects_scaled.items():
+                    if x1 <= x <= x2 and y1 <= y <= y2:
+                        if name == 'start':
+                            key = ord('s')
+                        elif name == 'stop':
+                            key = ord('e')
+                        elif name == 'new_block':
+                            key = ord('b')  # 'b' for new block
+                        elif name == 'marker':
+                            key = ord('m')
+                        elif name == 'distract':
+                            key = ord('d')
+                        elif name == 'calib':
+                            key = ord('c')
+                        elif name == 'quit':
+                            key = ord('q')
+                        break
         if key == ord('q'):
             break
         if key == ord('c'):
             # 視線の中心をキャリブレーション
-            gaze.calibrate_center()
+            pipeline.calibrate_center()
             if logger:
                 logger.write_event('calibrate_center', block_id=block_id)
         if key == ord('s'):
             # 「記録開始」ボタンが押されたとき
             if not is_recording:
                 # カウントを初期化
-                blink.blinks = 0
-                blink.close_frames = 0
-                blink.long_close_frames = 0
-                blink.closed = False
+                pipeline.reset_blink_counts()
                 # loggerがまだ作成されていない場合は作成
                 if logger is None:
                     log_path = args.log if args.log else ('logs' if args.auto_log_name else None)
@@ -289,10 +357,33 @@ def main():
                             'rotate': args.rotate,
                             'flip_h': args.flip_h,
                             'flip_v': args.flip_v,
+                            'orient_landmarks': args.orient_landmarks,
                             'ear_threshold_ratio': args.ear_threshold_ratio,
                             'ear_baseline_init': args.ear_baseline_init,
+                            'threaded_capture': args.threaded_capture,
+                            'record_frames': args.record_frames,
+                            'face_roi': args.face_roi,
+                            'keyframe_interval': args.keyframe_interval,
+                            'presence_interval': args.presence_interval,
+                            'presence_mode': args.presence_mode,
+                            'idle_after': args.idle_after,
+                            'idle_fps': args.idle_fps,
+                            'face_workers': args.face_workers,
+                            'face_backend': args.face_backend,
+                            'max_faces': args.max_faces,
+                            'face_threads': args.face_threads,
+                            'governor_levels': ','.join(f'{w}x{h}@{f:g}' for w, h, f in governor.levels) if governor else None,
+                            'zmq_latest_only': args.zmq_latest_only,
+                            'zmq_decode_scale': args.zmq_decode_scale,
+                            'zmq_feedback_url': args.zmq_feedback_url,
+                            'camera_cache': cam.cached,
                         }, auto_name=args.auto_log_name)
                         print(f"Logging started: {logger.path}")
+                        if args.record_frames:
+                            recorder = FrameRecorder(os.path.splitext(logger.path)[0] + '.avi', fps=cam.fps,
+                                                     queue_size=args.record_queue, drop_policy=args.record_drop,
+                                                     color_order=cam.color_order)
+                            print(f"Frame recording started: {recorder.path}")
                 # 最初のブロックを開始
                 block_id = 1
                 is_recording = True
@@ -323,7 +414,33 @@ def main():
                 logger.write_event('distractor_start' if distractor_on else 'distractor_end', block_id=block_id)
 
     cam.release()
-    cv2.destroyAllWindows()
+    pipeline.finish(logger, block_id)
+    face = pipeline.face
+    if recorder is not None:
+        rec_stats = recorder.close()
+        print(f"Frame recording: {rec_stats['written']} written, {rec_stats['dropped']} dropped, "
+              f"{rec_stats['failed']} failed of {rec_stats['submitted']} frames")
+        if logger:
+            logger.write_event('recording_stats', info=str(rec_stats), block_id=block_id)
+    if not args.headless:
+        cv2.destroyAllWindows()
+    elapsed = time.time() - bench_start
+    bench_frames = pipeline.bench_frames
+    if bench_frames > 0:
+        print(f"Processed {bench_frames} frames in {elapsed:.2f}s "
+              f"({bench_frames / max(1e-6, elapsed):.1f} fps end-to-end, "
+              f"{1000.0 * pipeline.bench_proc_sec / bench_frames:.1f} ms/frame processing)")
+        if isinstance(face, FaceLandmarkerProcessor):
+            lm_stats = face.get_stats()
+            print(f"FaceLandmarker: {lm_stats['landmarker_results']}/{lm_stats['landmarker_submitted']} results, "
+                  f"{lm_stats['landmarker_latency_ms']:.1f} ms latency")
+        elif face is not None and face.keyframe_interval > 1:
+            print(f"FaceMesh ran on {face.mesh_calls}/{face.frames} frames ({100.0 * face.mesh_ratio():.0f}%)")
+        if isinstance(face, FaceProcessor) and face.presence_interval > 0:
+            print(f"Presence gate: FaceMesh skipped on {face.absent_skipped} frames with no face "
+                  f"({face.presence_checks} checks, {face.detector_calls} detector runs)")
+    if face is not None:
+        face.close()
     # 終了時、学習ONかつ保存先指定があればパーソナライズを保存
     if learning_enabled and args.model_save:
         try:
@@ -1,45 +1,131 @@
 """
 GUI版のメインアプリケーション
 メインメニューから計測開始/データ確認/オプションを選択できる
+
+mediapipe（mediapipe_wrappers, face_worker）はここでは読み込まず、メニューを表示してから
+バックグラウンドのスレッドで読み込み・FaceMesh の初期化を行う（startup.FaceWarmup）
 """
 import argparse
 import time
-import cv2
-import numpy as np
 import sys
 import os
 
+_LAUNCH = time.perf_counter()
+
 # パスを追加
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from capture import Camera
-from mediapipe_wrappers import FaceProcessor
-from features.blink import BlinkDetector
-from features.gaze import GazeEstimator
-from fusion import FusionScorer
-from personalize import Personalizer
-from overlay import Overlay
-from logger import CSVLogger
-from gui import MainMenu, OptionsMenu, DataViewer
+from startup import FaceWarmup, StartupTimer
+
+# 起動時間の区間ごとの記録（計測開始後、最初のスコアが出た時点で表示する）
+STARTUP = StartupTimer(_LAUNCH)
+
+with STARTUP.phase('import cv2, numpy, gui'):
+    import cv2
+    import numpy as np
+    from gui import MainMenu, OptionsMenu, DataViewer
+with STARTUP.phase('import app modules'):
+    from capture import Camera
+    from features.blink import BlinkDetector
+    from features.gaze import GazeEstimator
+    from fusion import FusionScorer
+    from multi_face import FaceTracker
+    from personalize import Personalizer
+    from overlay import Overlay
+    from logger import CSVLogger
+    from recorder import FrameRecorder
+    from governor import CaptureGovernor, default_levels, parse_levels
+    from idle import IdleController
+    from pipeline import FramePipeline
+
+
+def _face_kwargs(args):
+    """FaceProcessor（FaceWorkerPool）に渡す設定"""
+    return dict(static_mode=False, refine_iris=True, max_faces=getattr(args, 'max_faces', 1),
+                roi=getattr(args, 'face_roi', False),
+                keyframe_interval=getattr(args, 'keyframe_interval', 1),
+                track_max_error=getattr(args, 'track_max_error', 1.5),
+                presence_interval=getattr(args, 'presence_interval', 0),
+                presence_mode=getattr(args, 'presence_mode', 'detector'))
+
 
+def _warms_face_processor(args):
+    """メインループ内の FaceProcessor を使う構成か（それ以外は mediapipe の読み込みだけを先に済ませる）"""
+    return (args.backend != 'landmarks' and getattr(args, 'face_backend', 'solutions') == 'solutions'
+            and getattr(args, 'face_workers', 0) <= 0)
 
-def run_measurement(args, settings=None, rotate_display=False):
-    """計測を実行"""
+
+def run_measurement(args, settings=None, rotate_display=False, warmup=None, timer=None):
+    """計測を実行
+
+    warmup（startup.FaceWarmup）を渡すと、準備済みの FaceProcessor を使う。
+    timer（startup.StartupTimer）には計測開始から最初のスコアまでの区間を記録して表示する。
+    """
+    timer = timer or StartupTimer()
+    timer.mark('measure tapped')
     # 設定を適用
     if settings:
         args.ear_threshold_ratio = settings.get('ear_threshold_ratio', args.ear_threshold_ratio)
         args.ear_baseline_init = settings.get('ear_baseline_init', args.ear_baseline_init)
         # 集中度閾値とクールダウンはfusion.pyとapp.pyで直接設定する必要がある
     
+    governor = None
+    if getattr(args, 'governor', False):
+        levels_text = getattr(args, 'governor_levels', None)
+        governor = CaptureGovernor(parse_levels(levels_text) if levels_text else default_levels(args.width, args.height))
+    cap_w, cap_h, cap_fps = governor.current if governor else (args.width, args.height, 30)
+
     try:
-        cam = Camera(index=args.cam, width=args.width, height=args.height, fps=30,
-                    backend=args.backend, rotate=args.rotate, flip_h=args.flip_h, flip_v=args.flip_v,
-                    zmq_url=args.zmq_url, zmq_topic=args.zmq_topic).open()
+        with timer.phase('open camera'):
+            cam = Camera(index=args.cam, width=cap_w, height=cap_h, fps=cap_fps,
+                        backend=args.backend, rotate=args.rotate, flip_h=args.flip_h, flip_v=args.flip_v,
+                        zmq_url=args.zmq_url, zmq_topic=args.zmq_topic,
+                        threaded=getattr(args, 'threaded_capture', False), color_order='rgb',
+                        zmq_latest_only=getattr(args, 'zmq_latest_only', False),
+                        zmq_decode_scale=getattr(args, 'zmq_decode_scale', '1'),
+                        auto_reconnect=True, cache_path=getattr(args, 'camera_cache', None),
+                        zmq_feedback_url=getattr(args, 'zmq_feedback_url', None)).open()
     except Exception as e:
         print(f"Error: Failed to open camera: {e}")
         return False
     
-    face = FaceProcessor(static_mode=False, refine_iris=True, max_faces=1)
+    # landmarks: 送信側で FaceMesh 済みのランドマークを受け取る（画素は届かない）
+    landmark_mode = args.backend == 'landmarks'
+    face = None
+    face_pool = None
+    if not landmark_mode:
+        # バックグラウンドで読み込み中なら、ここで読み込みの完了を待つことになる
+        with timer.phase('import mediapipe_wrappers'):
+            from mediapipe_wrappers import (DEFAULT_FACE_MODEL, FaceLandmarkerProcessor, FaceProcessor, limit_threads,
+                                            missing_face_model)
+            from face_worker import FaceWorkerPool
+        face_kwargs = _face_kwargs(args)
+        face_model = getattr(args, 'face_model', None) or DEFAULT_FACE_MODEL
+        missing = missing_face_model(face_model) if getattr(args, 'face_backend', 'solutions') == 'tasks' else None
+        if missing:
+            # モデルが無いときは mediapipe の奥で失敗させず、取得方法を示して solutions の FaceMesh で続ける
+            print(f"Warning: {missing}\n  Falling back to --face-backend solutions")
+            args.face_backend = 'solutions'
+        if getattr(args, 'face_backend', 'solutions') == 'tasks':
+            # Tasks の FaceLandmarker（LIVE_STREAM）。推論は MediaPipe 内部のスレッドで非同期に進む
+            if getattr(args, 'face_workers', 0) <= 0:
+                limit_threads(getattr(args, 'face_threads', 0))
+            face = FaceLandmarkerProcessor(face_model,
+                                           max_faces=getattr(args, 'max_faces', 1),
+                                           wait_ms=getattr(args, 'face_wait_ms', 0.0))
+        elif getattr(args, 'face_workers', 0) > 0:
+            # FaceMesh を別プロセスで動かし、メインループは結果の出たフレームから順に処理する
+            try:
+                face_pool = FaceWorkerPool(workers=args.face_workers, **face_kwargs).start()
+            except Exception as e:
+                print(f"Warning: FaceMesh workers unavailable ({e}); processing in the main loop")
+        if face is None and face_pool is None:
+            # メニュー表示中に準備しておいた FaceProcessor があれば使う
+            with timer.phase('wait for FaceMesh warm-up'):
+                face = warmup.take() if warmup is not None else None
+            if face is None:
+                with timer.phase('build FaceMesh'):
+                    face = FaceProcessor(**face_kwargs)
     blink = BlinkDetector()
     blink.open_baseline = args.ear_baseline_init
     blink.ear_threshold_ratio = args.ear_threshold_ratio
@@ -59,14 +145,26 @@ def run_measurement(args, settings=None, rotate_display=False):
         blink.adapt_enabled = (args.phase == 'train') and (args.learning == 'on')
     except Exception:
         pass
+
+    tracker = None
+    if getattr(args, 'max_faces', 1) > 1:
+        # 複数人モード: 顔ごとに追跡 ID と検出器・スコアを持つ。表示は代表の顔（最も古い追跡）で行う
+        def setup_face_detectors(track):
+            # 顔ごとの検出器は、上で設定した検出器と同じしきい値・基準値から始める
+            track.blink.open_baseline = blink.open_baseline
+            track.blink.ear_threshold_ratio = blink.ear_threshold_ratio
+            track.blink.adapt_enabled = blink.adapt_enabled
+            track.gaze.bias, track.gaze.bias_y = gaze.bias, gaze.bias_y
+            track.fusion.hi = fusion.hi
+        tracker = FaceTracker(max_faces=args.max_faces, setup=setup_face_detectors)
     
     overlay = Overlay()
     
     # ログファイルは「記録開始」ボタンが押されたときに作成される
     # ここではloggerをNoneに設定（後で作成される）
     logger = None
+    recorder = None
     
-    last_alert_time = 0.0
     cooldown_sec = settings.get('cooldown_sec', 60.0) if settings else 60.0
     alert_enabled = (args.alert_mode == 'on')
     block_id = None
@@ -99,19 +197,19 @@ def run_measurement(args, settings=None, rotate_display=False):
     
     # 表示解像度（横長画面480x320）
     if args.display_width is None or args.display_height is None:
-        if args.backend == 'zmq':
+        if args.backend in ('zmq', 'shm', 'landmarks'):
             display_width = args.display_width if args.display_width else 480
             display_height = args.display_height if args.display_height else 320
         else:
-            display_width = args.display_width if args.display_width else args.width
-            display_height = args.display_height if args.display_height else args.height
+            display_width = args.display_width if args.display_width else cam.width
+            display_height = args.display_height if args.display_height else cam.height
     else:
         display_width = args.display_width
         display_height = args.display_height
     
     cv2.namedWindow(win_name, cv2.WINDOW_NORMAL)
     # フルスクリーンモードを先に設定（resizeWindowの前に）
-    if args.backend == 'zmq' and os.environ.get('FOCUS_ALERT_FULLSCREEN', '1') == '1':
+    if args.backend in ('zmq', 'shm', 'landmarks') and os.environ.get('FOCUS_ALERT_FULLSCREEN', '1') == '1':
         try:
             cv2.setWindowProperty(win_name, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
         except Exception as e:
@@ -120,71 +218,35 @@ def run_measurement(args, settings=None, rotate_display=False):
     if os.environ.get('FOCUS_ALERT_FULLSCREEN', '1') != '1':
         cv2.resizeWindow(win_name, display_width, display_height)
     
-    frame_failure_count = 0
-    max_failures = 30
+    first_score = True  # 最初のスコアが出た時点で起動・計測開始からの内訳を表示する
+    # 不在時の省電力: 顔が --idle-after 秒見つからなければ、--idle-fps でだけフレームを取得・処理・描画する
+    idle_after = getattr(args, 'idle_after', 0.0)
+    idle = IdleController(idle_after, getattr(args, 'idle_fps', 2.0)) if idle_after > 0 else None
+    pipeline = FramePipeline(cam, blink, gaze, fusion, perso, face=face, face_pool=face_pool,
+                             face_factory=lambda: FaceProcessor(**face_kwargs),
+                             landmark_mode=landmark_mode, tracker=tracker, idle=idle, governor=governor,
+                             phase=args.phase, learning_enabled=False, alert_enabled=alert_enabled,
+                             cooldown_sec=cooldown_sec, overlay=overlay)
     
     while True:
-        ok, frame = cam.read()
-        if not ok:
-            frame_failure_count += 1
-            if frame_failure_count >= max_failures:
-                print(f"Warning: Camera frame read failed {frame_failure_count} times consecutively.")
-            if frame is None:
-                frame = np.zeros((args.height, args.width, 3), dtype=np.uint8)
-                cv2.putText(frame, "Camera Error", (50, args.height//2), 
-                           cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-        else:
-            frame_failure_count = 0
-        
-        t0 = time.time()
-        try:
-            rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            fm = face.process(rgb)
-        except Exception as e:
-            print(f"Error processing frame: {e}")
-            fm = None
-        
-        feats = {}
-        status = {
-            'has_face': bool(fm and fm.get('has_face', False)),
-            'phase': args.phase,
-            'calibrating': perso.in_calibration() if args.phase == 'train' else False,
-        }
-        if fm is not None and fm['landmarks'] is not None:
-            lms = fm['landmarks']
-            feats['blink'] = blink.update(lms)
-            feats['gaze'] = gaze.update(lms)
-        else:
-            feats['blink'] = blink.miss()
-            feats['gaze'] = gaze.miss()
-        
-        score = fusion.update(feats, perso)
-        now = time.time()
-        alert = fusion.should_alert(score, now, last_alert_time, cooldown_sec) if alert_enabled else False
-        if alert:
-            last_alert_time = now
-        
-        fps = 1.0 / max(1e-3, (time.time() - t0))
-        
-        cam_status_dict = cam.get_status() if hasattr(cam, 'get_status') else {}
-        cam_status = {
-            'connected': cam_status_dict.get('connected', cam.impl is not None),
-            'frame_ok': ok,
-            'fps': fps,
-            'consecutive_failures': cam_status_dict.get('consecutive_failures', 0),
-        }
+        out = pipeline.step(logger, recorder, block_id)
+        if out is None:
+            break
+        frame, feats, score, alert = out['frame'], out['feats'], out['score'], out['alert']
+        fps, status, cam_status = out['fps'], out['status'], out['cam_status']
+        if first_score and not out['pending'] and out['fm'] is not None:
+            timer.mark('first score')
+            timer.report()
+            first_score = False
         
         # 横長モード判定（480x320）
         landscape_mode = (display_width == 480 and display_height == 320)
         
         vis = overlay.draw(frame, feats, score, alert, fps, status=status, 
                           show_alert_text=alert_enabled, cam_status=cam_status, landscape_mode=landscape_mode,
-                          is_recording=is_recording, block_id=block_id)
+                          is_recording=is_recording, block_id=block_id, color_order=cam.color_order)
         btn_rects = overlay.draw_buttons(vis, states={'distract_on': distractor_on}, landscape_mode=landscape_mode, is_recording=is_recording)
         
-        if logger:
-            logger.write_frame(feats, score, alert, block_id=block_id)
-        
         # フレームを表示解像度にリサイズ（横長モードではそのまま使用）
         h, w = vis.shape[:2]
         target_w, target_h = display_width, display_height
@@ -263,17 +325,14 @@ def run_measurement(args, settings=None, rotate_display=False):
         if key == ord('q'):
             break
         if key == ord('c'):
-            gaze.calibrate_center()
+            pipeline.calibrate_center()
             if logger:
                 logger.write_event('calibrate_center', block_id=block_id)
         if key == ord('s'):
             # 「記録開始」ボタンが押されたとき
             if not is_recording:
                 # カウントを初期化
-                blink.blinks = 0
-                blink.close_frames = 0
-                blink.long_close_frames = 0
-                blink.closed = False
+                pipeline.reset_blink_counts()
                 # loggerがまだ作成されていない場合は作成
                 if logger is None:
                     log_path = args.log if hasattr(args, 'log') and args.log else ('logs' if args.auto_log_name else None)
@@ -288,6 +347,10 @@ def run_measurement(args, settings=None, rotate_display=False):
                             'concentration_threshold': 1.0 - fusion.hi,  # 集中度閾値として記録
                         }, auto_name=args.auto_log_name if hasattr(args, 'auto_log_name') else True)
                         print(f"Logging started: {logger.path}")
+                        if getattr(args, 'record_frames', False) and not landmark_mode:
+                            recorder = FrameRecorder(os.path.splitext(logger.path)[0] + '.avi', fps=cam.fps,
+                                                     color_order=cam.color_order)
+                            print(f"Frame recording started: {recorder.path}")
                 # 最初のブロックを開始
                 block_id = 1
                 is_recording = True
@@ -318,6 +381,16 @@ def run_measurement(args, settings=None, rotate_display=False):
                 logger.write_event('distractor_start' if distractor_on else 'distractor_end', block_id=block_id)
     
     cam.release()
+    pipeline.finish(logger, block_id)
+    face = pipeline.face
+    if face is not None:
+        face.close()
+    if recorder is not None:
+        rec_stats = recorder.close()
+        print(f"Frame recording: {rec_stats['written']} written, {rec_stats['dropped']} dropped, "
+              f"{rec_stats['failed']} failed of {rec_stats['submitted']} frames")
+        if logger:
+            logger.write_event('recording_stats', info=str(rec_stats), block_id=block_id)
     cv2.destroyAllWindows()
     return True
 
@@ -332,9 +405,29 @@ def main_gui():
     parser.add_argument('--display-height', type=int, default=320)
     # 回転表示は無効化（問題が多いため）
     # parser.add_argument('--rotate-display', action='store_true', help='Display rotated 90 degrees clockwise (for landscape monitors)')
-    parser.add_argument('--backend', type=str, default='zmq', choices=['auto','opencv','picamera2','zmq'])
+    parser.add_argument('--backend', type=str, default='zmq', choices=['auto','opencv','picamera2','zmq','shm','landmarks'])
     parser.add_argument('--zmq-url', type=str, default='tcp://127.0.0.1:5555', help='ZMQ URL for camera proxy')
     parser.add_argument('--zmq-topic', type=str, default='frame', help='ZMQ topic for camera proxy')
+    parser.add_argument('--zmq-latest-only', action='store_true', help='Drain the ZMQ queue and decode only the newest frame')
+    parser.add_argument('--zmq-feedback-url', type=str, default=None, help='Report processing latency to cam_proxy.py --adaptive (e.g. tcp://127.0.0.1:5556)')
+    parser.add_argument('--zmq-decode-scale', type=str, default='1', choices=['1','2','4','auto'], help='Decode JPEG frames at 1/2 or 1/4 scale')
+    parser.add_argument('--record-frames', action='store_true', help='Record camera frames next to the CSV log (replayable with backend=replay)')
+    parser.add_argument('--face-roi', action='store_true', help='Run FaceMesh on a padded crop around the previous face')
+    parser.add_argument('--keyframe-interval', type=int, default=1, help='Run FaceMesh every N frames and track eye/iris points in between (1 = every frame)')
+    parser.add_argument('--face-backend', type=str, default='solutions', choices=['solutions','tasks'], help='Landmark inference: solutions (FaceMesh, sync) or tasks (FaceLandmarker, async LIVE_STREAM)')
+    parser.add_argument('--face-model', type=str, default=None, help='face_landmarker.task for --face-backend tasks (default: models/face_landmarker.task)')
+    parser.add_argument('--face-wait-ms', type=float, default=0.0, help='Max wait for a new async result (--face-backend tasks)')
+    parser.add_argument('--face-threads', type=int, default=0, help='Cap on OpenCV image-processing threads with --face-backend tasks (0 = no cap)')
+    parser.add_argument('--face-workers', type=int, default=0, help='Run FaceMesh in N worker processes (0 = in the main loop)')
+    parser.add_argument('--presence-interval', type=int, default=0, help='While no face is tracked, skip FaceMesh and check for a face every N frames (0 = off)')
+    parser.add_argument('--presence-mode', type=str, default='detector', choices=['detector','motion','both'], help='Check for --presence-interval: short-range face detector, frame difference, or difference then detector')
+    parser.add_argument('--max-faces', type=int, default=1, help='Track up to N faces, each with its own ID, detectors and log rows')
+    parser.add_argument('--track-max-error', type=float, default=1.5, help='Tracking error (pixels) that forces a FaceMesh keyframe')
+    parser.add_argument('--governor', action='store_true', help='Step capture resolution/fps down or up with processing latency')
+    parser.add_argument('--governor-levels', type=str, default=None, help='Capture levels, heaviest first (WxH@fps, comma separated; default: --width/--height, then 3/4 and 1/2 of it)')
+    parser.add_argument('--idle-after', type=float, default=0.0, help='Drop camera/redraw rate after N seconds with no face (0 = off)')
+    parser.add_argument('--idle-fps', type=float, default=2.0, help='Frame rate used to probe for a face while idle')
+    parser.add_argument('--threaded-capture', action='store_true', help='Read camera frames on a background thread (latest frame only)')
     parser.add_argument('--log-dir', type=str, default='logs')
     parser.add_argument('--config-dir', type=str, default='config')
     args = parser.parse_args()
@@ -383,6 +476,12 @@ def main_gui():
             last_click['ts'] = time.time()
     
     cv2.setMouseCallback(win_name, on_mouse)
+
+    def start_warmup():
+        return FaceWarmup(_face_kwargs(args), timer=STARTUP, frame_size=(args.width, args.height),
+                          build=_warms_face_processor(args)).start()
+
+    warmup = None
     
     while True:
         if current_screen == 'main':
@@ -419,6 +518,27 @@ def main_gui():
                 flip_v=False,
                 zmq_url=args.zmq_url,
                 zmq_topic=args.zmq_topic,
+                threaded_capture=args.threaded_capture,
+                record_frames=args.record_frames,
+                face_roi=args.face_roi,
+                keyframe_interval=args.keyframe_interval,
+                track_max_error=args.track_max_error,
+                face_workers=args.face_workers,
+                face_backend=args.face_backend,
+                face_model=args.face_model,
+                face_wait_ms=args.face_wait_ms,
+                face_threads=args.face_threads,
+                max_faces=args.max_faces,
+                presence_interval=args.presence_interval,
+                presence_mode=args.presence_mode,
+                idle_after=args.idle_after,
+                idle_fps=args.idle_fps,
+                governor=args.governor,
+                governor_levels=args.governor_levels,
+                zmq_latest_only=args.zmq_latest_only,
+                zmq_decode_scale=args.zmq_decode_scale,
+                zmq_feedback_url=args.zmq_feedback_url,
+                camera_cache=os.path.join(args.config_dir, 'camera_cache.json'),
                 session=None,
                 participant=None,
                 task=None,
@@ -433,7 +553,12 @@ def main_gui():
                 ear_threshold_ratio=options_menu.settings.get('ear_threshold_ratio', 0.90),
                 ear_baseline_init=options_menu.settings.get('ear_baseline_init', 0.45),
             )
-            run_measurement(measure_args, settings=options_menu.settings, rotate_display=False)
+            run_measurement(measure_args, settings=options_menu.settings, rotate_display=False,
+                            warmup=warmup, timer=STARTUP)
+            # 次の計測に備えて、新しい FaceProcessor を準備しておく（使われなかった前の分は閉じる）
+            if warmup is not None:
+                warmup.close()
+            warmup = start_warmup()
             current_screen = 'main'
             cv2.namedWindow(win_name, cv2.WINDOW_NORMAL)
             # フルスクリーンモードを先に設定（resizeWindowの前に）
@@ -516,9 +641,15 @@ def main_gui():
                     current_screen = 'main'
         
         key = cv2.waitKey(1) & 0xFF
+        if warmup is None:
+            # メニューを描画してから、mediapipe の読み込みと FaceMesh の初期化をバックグラウンドで始める
+            STARTUP.mark('menu shown')
+            warmup = start_warmup()
         if key == ord('q') and current_screen == 'main':
             break
     
+    if warmup is not None:
+        warmup.close()
     cv2.destroyAllWindows()
     # 終了時にシグナルを送って親プロセス（起動スクリプト）に通知
     # 起動スクリプト側でAPP_PIDの終了を監視しているため、ここで終了すれば自動的にカメラプロキシも終了する
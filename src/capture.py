@@ -1,8 +1,49 @@
+import collections
+import csv
+import glob
+import json
+import os
+import threading
+import time
+
 import cv2
 import numpy as np
 
+from orientation import Orientation
+from shm_ring import ShmFrameRing
+
+
+# scripts/probe_camera.py が書き出す「最速構成」のキャッシュの既定パス
+DEFAULT_CAMERA_CACHE = os.path.join('config', 'camera_cache.json')
+
+
+def load_camera_cache(path):
+    """キャッシュから最速構成（dict）を読む。無い・壊れている場合は None"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get('best')
+    except Exception as e:
+        print(f"Warning: Failed to read camera cache {path}: {e}")
+        return None
+
+
+def save_camera_cache(path, best, results=None):
+    """最速構成と、計測結果の一覧をキャッシュに保存する"""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'probed_at': time.time(), 'best': best, 'results': results or []}, f, ensure_ascii=False, indent=2)
+
+
+def _clock_to_wall(ts_sec, clock_id):
+    """clock_id の時計で測った時刻（秒）を time.time() 基準の時刻に換算する"""
+    return time.time() - (time.clock_gettime(clock_id) - ts_sec)
+
 class _OpenCVCamera:
-    def __init__(self, index=0, width=640, height=480, fps=30, rotate=0, flip_h=False, flip_v=False):
+    def __init__(self, index=0, width=640, height=480, fps=30, rotate=0, flip_h=False, flip_v=False, color_order='bgr',
+                 fourcc=None):
         self.index = index
         self.width = width
         self.height = height
@@ -10,13 +51,22 @@ class _OpenCVCamera:
         self.rotate = rotate
         self.flip_h = flip_h
         self.flip_v = flip_v
+        self.color_order = color_order
+        self.fourcc = fourcc  # 例: 'MJPG', 'YUYV'（None ならドライバ既定）
+        # 回転・反転は1回の変換にまとめておく
+        self.orientation = Orientation(rotate, flip_h, flip_v)
+        self._raw = None  # 向きを変換する場合の読み出し用バッファ（外に渡さないので使い回せる）
         self.cap = None
+        self.last_ts = None  # 直近フレームの取得時刻（time.time() 基準）
 
     def open(self):
         # Windows では CAP_DSHOW を使うことがありますが、まずは汎用的な方法を試します（Linux では V4L2 が既定）。
         self.cap = cv2.VideoCapture(self.index)
         if not self.cap.isOpened():
             self.cap = cv2.VideoCapture(self.index, cv2.CAP_DSHOW)
+        if self.fourcc:
+            # ピクセル形式は解像度より先に指定する（後から変えると解像度が戻るドライバがある）
+            self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.fourcc))
         self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
         self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
         self.cap.set(cv2.CAP_PROP_FPS, self.fps)
@@ -42,31 +92,62 @@ class _OpenCVCamera:
         
         return self
 
+    def reconfigure(self, width, height, fps):
+        """解像度と fps を変更する（解像度が反映されなければデバイスを開き直す）
+
+        fps の指定を黙って無視する UVC ドライバが多いので、設定後に読み戻し、
+        要求した fps になっていなければ False を返します（解像度の変更は反映済み）。
+        """
+        self.width, self.height, self.fps = width, height, fps
+        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+        self.cap.set(cv2.CAP_PROP_FPS, fps)
+        if (int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)) != width
+                or int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) != height):
+            self.cap.release()
+            self.open()
+        actual = self.cap.get(cv2.CAP_PROP_FPS)
+        if actual > 0:
+            self.fps = actual
+        return abs(actual - fps) <= 0.5
+
     def read(self):
-        ok, frame = self.cap.read()
+        if self.orientation.identity:
+            ok, frame = self.cap.read()
+        else:
+            # 読み出しは使い回しのバッファへ行い、向きの変換で新しいフレームを1枚だけ作る
+            # （変換後のフレームは後段がキューに保持することがあるため、出力側は使い回さない）
+            ok, frame = self.cap.read(self._raw)
+            if ok:
+                self._raw = frame
         if not ok:
             return ok, frame
-        # 画像の向きを調整（回転・反転）
-        if self.rotate in (90, 180, 270):
-            if self.rotate == 90:
-                frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
-            elif self.rotate == 180:
-                frame = cv2.rotate(frame, cv2.ROTATE_180)
-            else:
-                frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-        if self.flip_h:
-            frame = cv2.flip(frame, 1)
-        if self.flip_v:
-            frame = cv2.flip(frame, 0)
+        self.last_ts = self._frame_timestamp()
+        # 画像の向きを調整（回転・反転を1パスで）
+        frame = self.orientation.apply(frame)
+        if self.color_order == 'rgb':
+            # チャンネル入れ替えはその場で行い、新しいフレームを確保しない
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
         return True, frame
 
+    def _frame_timestamp(self):
+        # V4L2 では CAP_PROP_POS_MSEC がドライバのバッファ時刻（CLOCK_MONOTONIC, ミリ秒）になる。
+        # 取得できない・明らかにずれているバックエンドでは読み出し完了時刻で代用する
+        now = time.time()
+        msec = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+        if msec and msec > 0:
+            ts = _clock_to_wall(msec / 1000.0, time.CLOCK_MONOTONIC)
+            if 0.0 <= now - ts < 1.0:
+                return ts
+        return now
+
     def release(self):
         if self.cap is not None:
             self.cap.release()
 
 
 class _PiCamera2Camera:
-    def __init__(self, width=640, height=480, fps=30, rotate=0, flip_h=False, flip_v=False):
+    def __init__(self, width=640, height=480, fps=30, rotate=0, flip_h=False, flip_v=False, color_order='bgr'):
         # Picamera2 を読み込む。失敗した場合のみシステムの dist-packages を末尾に追加し、
         # venv（仮想環境）側の numpy/opencv を優先したままにします。
         try:
@@ -84,11 +165,26 @@ class _PiCamera2Camera:
         self.rotate = rotate
         self.flip_h = flip_h
         self.flip_v = flip_v
+        self.color_order = color_order
         self.cam = None
+        self.last_ts = None
+        # Transform で向きを指定できなかった場合のソフトウェア変換（None ならセンサー側で適用済み）
+        self.sw_orientation = None
 
     def open(self):
         self.cam = self.Picamera2()
-        config = self.cam.create_preview_configuration(main={"size": (self.width, self.height), "format": "RGB888"})
+        self._configure()
+        self.cam.start()
+        return self
+
+    def _pixel_format(self):
+        # Picamera2 の形式名は libcamera 流で、メモリ上の並びとは逆（"RGB888" は B,G,R、"BGR888" は R,G,B）。
+        # 要求された色の並びで取得し、読み出し後の並び替えを不要にする
+        return "BGR888" if self.color_order == 'rgb' else "RGB888"
+
+    def _configure(self):
+        fmt = self._pixel_format()
+        config = self.cam.create_preview_configuration(main={"size": (self.width, self.height), "format": fmt})
         self.cam.configure(config)
         # 向き（回転・反転）の指定
         transform = 0
@@ -108,18 +204,43 @@ class _PiCamera2Camera:
                     transform |= Transform.ROT180
                 else:
                     transform |= Transform.ROT270
-            self.cam.configure(self.cam.create_preview_configuration(main={"size": (self.width, self.height), "format": "RGB888"}, transform=transform))
+            self.cam.configure(self.cam.create_preview_configuration(main={"size": (self.width, self.height), "format": fmt}, transform=transform))
+            self.sw_orientation = None
+        except Exception:
+            # センサーが対応していない向き（90/270度回転など）は、読み出し後に1パスで変換する
+            orientation = Orientation(self.rotate, self.flip_h, self.flip_v)
+            self.sw_orientation = None if orientation.identity else orientation
+        try:
+            self.cam.set_controls({"FrameRate": self.fps})
         except Exception:
             pass
+
+    def reconfigure(self, width, height, fps):
+        """カメラを止めて解像度と fps を設定し直す（Picamera2 は起動中に構成を変えられない）"""
+        self.width, self.height, self.fps = width, height, fps
+        self.cam.stop()
+        self._configure()
         self.cam.start()
-        return self
+        return True
 
     def read(self):
-        # 取得画像は RGB888 なので、OpenCV で扱いやすいよう BGR に変換します。
-        import numpy as np
-        arr = self.cam.capture_array()
-        frame = arr[:, :, ::-1].copy()
-        return True, frame
+        # メタデータの SensorTimestamp（CLOCK_BOOTTIME, ナノ秒）を取得時刻として使う
+        request = self.cam.capture_request()
+        try:
+            arr = request.make_array('main')
+            metadata = request.get_metadata()
+        finally:
+            request.release()
+        sensor_ns = metadata.get('SensorTimestamp')
+        if sensor_ns:
+            self.last_ts = _clock_to_wall(sensor_ns / 1e9, time.CLOCK_BOOTTIME)
+        else:
+            self.last_ts = time.time()
+        if self.sw_orientation is not None:
+            # 色は要求どおりの並びで取得済みなので、向きの変換だけを行う
+            return True, self.sw_orientation.apply(arr)
+        # 要求された並び（rgb なら "BGR888"、bgr なら "RGB888"）で取得しているので、変換もコピーもしない
+        return True, arr
 
     def release(self):
         try:
@@ -129,14 +250,71 @@ class _PiCamera2Camera:
             pass
 
 
+def _recv_topic(sub, topic, zmq, drain=False):
+    """topic と完全に一致するメッセージを1件受け取る（受信可能な状態で呼ぶ）
+
+    SUB の購読は前方一致なので、'frame' を購読すると 'frame_preview' なども届きます。
+    一致しないメッセージは読み捨てます。drain=True なら溜まっている分を全て読み、最後の1件を返します。
+    戻り値は (parts または None, 一致したメッセージ数)。
+    """
+    parts = None
+    n = 0
+    flags = 0
+    while True:
+        try:
+            msg = sub.recv_multipart(flags)
+        except zmq.Again:
+            break
+        flags = zmq.NOBLOCK
+        if msg[0] != topic:
+            continue
+        parts = msg
+        n += 1
+        if not drain:
+            break
+    return parts, n
+
+
+# JPEG を縮小デコードする際の imdecode フラグ（1/2, 1/4 のみ対応）
+_ZMQ_DECODE_FLAGS = {
+    1: cv2.IMREAD_COLOR,
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+}
+
+
 class _ZmqCamera:
-    def __init__(self, url='tcp://127.0.0.1:5555', topic='frame'):
+    def __init__(self, url='tcp://127.0.0.1:5555', topic='frame', color_order='bgr',
+                 latest_only=False, decode_scale=1, target_size=None, feedback_url=None):
         import zmq  # 遅延インポート（必要になってから読み込む）
         self.zmq = zmq
         self.url = url
         self.topic = topic.encode('utf-8')
+        self.color_order = color_order
+        # True の場合、受信キューを空にして最新の1枚だけをデコードする
+        self.latest_only = latest_only
+        # 1/2/4 で縮小デコード。'auto' は target_size を下回らない最大の縮小率を選ぶ
+        if decode_scale != 'auto' and int(decode_scale) not in _ZMQ_DECODE_FLAGS:
+            raise ValueError(f"decode_scale must be 1, 2, 4 or 'auto': {decode_scale}")
+        self.decode_scale = decode_scale if decode_scale == 'auto' else int(decode_scale)
+        self.target_size = target_size  # (幅, 高さ)
+        # cam_proxy.py --adaptive へ処理の遅れを報告する副チャネル（ZMQ PUSH）
+        self.feedback_url = feedback_url
+        self.feedback = None
+        self.feedback_interval = 0.2  # 報告の最短間隔（秒）
+        self._last_report = 0.0
+        self._report_id = f'{os.getpid()}'
+        # プロキシが付けたエンコード条件（JPEG 品質・縮小率）。変わったらイベントにする
+        self.stream_quality = None
+        self._events = collections.deque()  # 取得スレッドから積まれることがあるので deque を使う
         self.ctx = None
         self.sub = None
+        # 受信統計（latest_only 時に読み捨てたメッセージ数など）
+        self.received = 0
+        self.drained = 0
+        self.skipped = 0
+        self.last_skipped = 0
+        self.last_ts = None
 
     def open(self):
         self.ctx = self.zmq.Context.instance()
@@ -146,38 +324,484 @@ class _ZmqCamera:
         # ノンブロッキングで受信可否を監視するポーラ
         self.poller = self.zmq.Poller()
         self.poller.register(self.sub, self.zmq.POLLIN)
+        if self.feedback_url:
+            self.feedback = self.ctx.socket(self.zmq.PUSH)
+            # プロキシが居なくても溜め込まない
+            self.feedback.setsockopt(self.zmq.SNDHWM, 4)
+            self.feedback.setsockopt(self.zmq.LINGER, 0)
+            self.feedback.connect(self.feedback_url)
         return self
 
+    def report_latency(self, latency_ms, proc_ms=None):
+        """受信から処理完了までの遅延をプロキシに報告する（間引いて送り、送れなければ捨てる）"""
+        if self.feedback is None or latency_ms is None:
+            return
+        now = time.time()
+        if now - self._last_report < self.feedback_interval:
+            return
+        self._last_report = now
+        msg = {'id': self._report_id, 'ts': now, 'latency_ms': latency_ms, 'proc_ms': proc_ms}
+        try:
+            self.feedback.send_json(msg, self.zmq.NOBLOCK)
+        except self.zmq.Again:
+            pass
+
+    def _update_quality(self, part):
+        try:
+            meta = json.loads(part.decode('utf-8'))
+            quality = (meta.get('quality'), meta.get('scale'))
+        except (ValueError, AttributeError):
+            return
+        if quality != self.stream_quality:
+            self.stream_quality = quality
+            self._events.append(('proxy_quality', f'quality={quality[0]} scale={quality[1]}'))
+
+    def pop_events(self):
+        events = []
+        while self._events:
+            events.append(self._events.popleft())
+        return events
+
+    def _recv_latest(self):
+        # キューに溜まっているメッセージを全て受け取り、最後の1件だけを残す
+        parts, n = _recv_topic(self.sub, self.topic, self.zmq, drain=True)
+        if parts is None:
+            return None
+        self.drained += n
+        self.last_skipped = n - 1
+        self.skipped += n - 1
+        return parts
+
+    def _resolve_scale(self, arr):
+        # 'auto' の場合は最初のフレームのサイズを見て縮小率を一度だけ決める
+        frame = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        scale = 1
+        if frame is not None and self.target_size is not None:
+            h, w = frame.shape[:2]
+            tw, th = self.target_size
+            for s in (4, 2):
+                if w // s >= tw and h // s >= th:
+                    scale = s
+                    break
+        self.decode_scale = scale
+        if frame is not None and scale != 1:
+            frame = cv2.imdecode(arr, _ZMQ_DECODE_FLAGS[scale])
+        return frame
+
     def read(self):
-        # 受信形式は [topic, jpg_bytes]
+        # 受信形式は [topic, jpg_bytes, 取得時刻, エンコード条件]（取得時刻・条件は無い場合がある）
         socks = dict(self.poller.poll(1000))  # タイムアウト 1 秒
         if self.sub not in socks:
             return False, None
-        parts = self.sub.recv_multipart()
+        if self.latest_only:
+            parts = self._recv_latest()
+        else:
+            parts, _ = _recv_topic(self.sub, self.topic, self.zmq)
+        if parts is None:
+            # 同じ接頭辞を持つ別ストリームのメッセージだけだった
+            return False, None
+        self.received += 1
         if len(parts) < 2:
             return False, None
         jpg = parts[1]
+        # プロキシ側で付けた取得時刻。無ければ受信時刻で代用
+        self.last_ts = float(parts[2]) if len(parts) >= 3 else time.time()
+        if len(parts) >= 4:
+            self._update_quality(parts[3])
         arr = np.frombuffer(jpg, dtype=np.uint8)
         # cv2.imdecodeはJPEGをBGR形式でデコードする
         # 送信側でRGB→BGRに変換してからエンコードしているため、デコード後は既にBGR形式
-        frame = cv2.imdecode(arr, cv2.IMREAD_COLOR)
+        if self.decode_scale == 'auto':
+            frame = self._resolve_scale(arr)
+        else:
+            frame = cv2.imdecode(arr, _ZMQ_DECODE_FLAGS[self.decode_scale])
         if frame is None:
             return False, None
+        if self.color_order == 'rgb':
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
         return True, frame
 
+    def get_stats(self):
+        return {
+            'zmq_received': self.received,
+            'zmq_drained': self.drained,
+            'zmq_skipped': self.skipped,
+            'zmq_last_skipped': self.last_skipped,
+            'zmq_decode_scale': self.decode_scale,
+            'zmq_quality': self.stream_quality[0] if self.stream_quality else None,
+            'zmq_scale': self.stream_quality[1] if self.stream_quality else None,
+        }
+
+    def release(self):
+        try:
+            if self.feedback is not None:
+                self.feedback.close(0)
+            # Context.instance() は同じプロセス内の他のストリームと共有しているので、ソケットだけ閉じる
+            if self.sub is not None:
+                self.sub.close(0)
+        except Exception:
+            pass
+
+
+class _ShmCamera:
+    """cam_proxy.py --transport shm が共有メモリに書いた生フレームを読む
+
+    ZMQ では [topic, JSON] の小さな通知だけを受け取り、画素は共有メモリから直接コピーします。
+    通知は常に最新の1件だけを使い、古い通知は読み捨てます。
+    """
+
+    def __init__(self, url='tcp://127.0.0.1:5555', topic='frame', color_order='bgr'):
+        import zmq  # 遅延インポート（必要になってから読み込む）
+        self.zmq = zmq
+        self.url = url
+        self.topic = topic.encode('utf-8')
+        self.color_order = color_order
+        self.ctx = None
+        self.sub = None
+        self.ring = None
+        self.received = 0
+        self.skipped = 0
+        self.torn = 0  # コピー中に上書きされて捨てたフレーム数
+        self.last_ts = None
+
+    def open(self):
+        self.ctx = self.zmq.Context.instance()
+        self.sub = self.ctx.socket(self.zmq.SUB)
+        self.sub.connect(self.url)
+        self.sub.setsockopt(self.zmq.SUBSCRIBE, self.topic)
+        self.poller = self.zmq.Poller()
+        self.poller.register(self.sub, self.zmq.POLLIN)
+        return self
+
+    def read(self):
+        socks = dict(self.poller.poll(1000))  # タイムアウト 1 秒
+        if self.sub not in socks:
+            return False, None
+        parts, n = _recv_topic(self.sub, self.topic, self.zmq, drain=True)
+        if parts is None:
+            return False, None
+        self.skipped += n - 1
+        self.received += 1
+        if len(parts) < 2:
+            return False, None
+        note = json.loads(parts[1])
+        # プロキシの再起動で共有メモリ名が変わった場合は付け直す
+        if self.ring is None or self.ring.name.lstrip('/') != note['shm'].lstrip('/'):
+            if self.ring is not None:
+                self.ring.close()
+            self.ring = ShmFrameRing.attach(note['shm'])
+        frame, ts = self.ring.read(note['slot'], note['seq'])
+        if frame is None:
+            self.torn += 1
+            return False, None
+        self.last_ts = ts
+        if note.get('order', 'bgr') != self.color_order:
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+        return True, frame
+
+    def get_stats(self):
+        return {
+            'shm_received': self.received,
+            'shm_skipped': self.skipped,
+            'shm_torn': self.torn,
+        }
+
+    def release(self):
+        try:
+            if self.ring is not None:
+                self.ring.close()
+            # Context.instance() は同じプロセス内の他のストリームと共有しているので、ソケットだけ閉じる
+            if self.sub is not None:
+                self.sub.close(0)
+        except Exception:
+            pass
+
+
+class _LandmarkCamera:
+    """cam_proxy.py --transport landmarks が送る顔ランドマークを受け取る
+
+    受信形式は [topic, (N, 3) float32 のバイト列, 取得時刻, JSON]。顔が無いフレームはバイト列が空です。
+    read() は (True, (N, 3) の配列または None) を返し、画素は返しません。
+    JSON の size（送信側の画像の幅・高さ）は frame_size に保持します。
+    まばたきの検出に全フレームが要るので、latest_only のような読み捨てはしません。
+    """
+
+    def __init__(self, url='tcp://127.0.0.1:5555', topic='frame'):
+        import zmq  # 遅延インポート（必要になってから読み込む）
+        self.zmq = zmq
+        self.url = url
+        self.topic = topic.encode('utf-8')
+        self.ctx = None
+        self.sub = None
+        self.frame_size = None  # (幅, 高さ)
+        self.received = 0
+        self.no_face = 0
+        self.bytes = 0
+        self.last_ts = None
+
+    def open(self):
+        self.ctx = self.zmq.Context.instance()
+        self.sub = self.ctx.socket(self.zmq.SUB)
+        self.sub.connect(self.url)
+        self.sub.setsockopt(self.zmq.SUBSCRIBE, self.topic)
+        self.poller = self.zmq.Poller()
+        self.poller.register(self.sub, self.zmq.POLLIN)
+        return self
+
+    def read(self):
+        socks = dict(self.poller.poll(1000))  # タイムアウト 1 秒
+        if self.sub not in socks:
+            return False, None
+        parts, _ = _recv_topic(self.sub, self.topic, self.zmq)
+        if parts is None or len(parts) < 4:
+            return False, None
+        self.received += 1
+        self.bytes += sum(len(p) for p in parts)
+        self.last_ts = float(parts[2])
+        try:
+            meta = json.loads(parts[3].decode('utf-8'))
+        except ValueError:
+            return False, None
+        if meta.get('size'):
+            self.frame_size = tuple(meta['size'])
+        if not parts[1]:
+            self.no_face += 1
+            return True, None
+        arr = np.frombuffer(parts[1], dtype=np.float32).reshape(meta.get('shape', (-1, 3)))
+        return True, arr
+
+    def get_stats(self):
+        return {
+            'landmark_received': self.received,
+            'landmark_no_face': self.no_face,
+            'landmark_bytes_per_msg': (self.bytes / self.received) if self.received else 0.0,
+        }
+
     def release(self):
         try:
+            # Context.instance() は同じプロセス内の他のストリームと共有しているので、ソケットだけ閉じる
             if self.sub is not None:
                 self.sub.close(0)
-            if self.ctx is not None:
-                self.ctx.term()
         except Exception:
             pass
 
 
+class _ReplayCamera:
+    """録画済みの動画ファイル、またはフレームの連番画像ディレクトリを再生する
+
+    pace='recorded' は記録時のタイムスタンプ間隔で、'fps' は固定 fps で、
+    'fast' は待たずにできるだけ速くフレームを返します（ベンチマーク用）。
+    タイムスタンプは索引 CSV（連番画像は file 列付きの frames.csv、動画は
+    recorder.FrameRecorder が書く <名前>_frames.csv）の ts 列があればそれを使い、
+    無ければ動画は CAP_PROP_POS_MSEC、連番画像は fps から求めます。
+    連番画像で読めない・壊れたファイルは飛ばして skipped に数え、最後のファイルまで再生を続けます。
+    """
+
+    IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+    def __init__(self, path, pace='recorded', fps=30, loop=False, color_order='bgr'):
+        if pace not in ('recorded', 'fps', 'fast'):
+            raise ValueError(f"pace must be 'recorded', 'fps' or 'fast': {pace}")
+        self.path = path
+        self.pace = pace
+        self.fps = fps
+        self.loop = loop
+        self.color_order = color_order
+        self.cap = None
+        self.files = None
+        self.timestamps = None
+        self.index = 0
+        self.skipped = 0  # 読めずに飛ばした連番画像の数
+        self.eof = False
+        self.t_start = None
+        self.ts_first = None
+        self.last_ts = None
+        self.last_recorded_ts = None  # 記録時の取得時刻
+
+    @staticmethod
+    def _load_index(csv_path):
+        rows = []
+        with open(csv_path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                rows.append(row)
+        return rows
+
+    def open(self):
+        if os.path.isdir(self.path):
+            index_path = os.path.join(self.path, 'frames.csv')
+            if os.path.exists(index_path):
+                rows = self._load_index(index_path)
+                self.files = [os.path.join(self.path, r['file']) for r in rows]
+                self.timestamps = [float(r['ts']) for r in rows]
+            else:
+                self.files = sorted(p for p in glob.glob(os.path.join(self.path, '*'))
+                                    if p.lower().endswith(self.IMAGE_EXTS))
+            if not self.files:
+                raise RuntimeError(f"No frames found in {self.path}")
+        else:
+            self.cap = cv2.VideoCapture(self.path)
+            if not self.cap.isOpened():
+                raise RuntimeError(f"Cannot open replay file: {self.path}")
+            index_path = os.path.splitext(self.path)[0] + '_frames.csv'
+            if os.path.exists(index_path):
+                self.timestamps = [float(r['ts']) for r in self._load_index(index_path)]
+        return self
+
+    def _next(self):
+        # (フレーム, 記録時刻) を返す。末尾なら (None, None)
+        i = self.index
+        if self.files is not None:
+            while True:
+                if i >= len(self.files):
+                    self.index = i
+                    return None, None
+                frame = cv2.imread(self.files[i], cv2.IMREAD_COLOR)
+                if frame is not None:
+                    break
+                if self.skipped == 0:
+                    print(f"Warning: Cannot read replay frame {self.files[i]}; skipping unreadable frames")
+                self.skipped += 1
+                i += 1
+            self.index = i
+            ts = self.timestamps[i] if self.timestamps is not None else i / float(self.fps)
+        else:
+            ok, frame = self.cap.read()
+            if not ok:
+                return None, None
+            if self.timestamps is not None and i < len(self.timestamps):
+                ts = self.timestamps[i]
+            else:
+                ts = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        self.index += 1
+        return frame, ts
+
+    def _rewind(self):
+        self.index = 0
+        self.t_start = None
+        if self.cap is not None:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def read(self):
+        frame, ts = self._next()
+        if frame is None and self.loop:
+            self._rewind()
+            frame, ts = self._next()
+        if frame is None:
+            self.eof = True
+            return False, None
+        # 再生速度の調整
+        now = time.time()
+        if self.t_start is None:
+            self.t_start = now
+            self.ts_first = ts
+        if self.pace == 'recorded':
+            due = self.t_start + (ts - self.ts_first)
+        elif self.pace == 'fps':
+            due = self.t_start + (self.index - 1) / float(self.fps)
+        else:
+            due = now
+        if due > now:
+            time.sleep(due - now)
+        # 再生では「今取得された」ものとして扱う（記録時の時刻は last_recorded_ts）
+        self.last_ts = time.time()
+        self.last_recorded_ts = ts
+        if self.color_order == 'rgb':
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=frame)
+        return True, frame
+
+    def get_stats(self):
+        return {
+            'replay_frames': self.index,
+            'replay_skipped': self.skipped,
+            'eof': self.eof,
+        }
+
+    def release(self):
+        if self.cap is not None:
+            self.cap.release()
+
+
+class _FrameGrabber:
+    """バックグラウンドスレッドでカメラを読み続け、最新フレームだけを保持する
+
+    リングバッファには (連番, 取得時刻, フレーム) を最大 ring_size 件だけ残し、
+    処理側は常に最新の1枚を受け取ります。処理が追いつかずに読み飛ばされた
+    フレーム数は dropped に数えます。
+    """
+
+    def __init__(self, impl, ring_size=2, wait_timeout=1.0):
+        self.impl = impl
+        self.ring = collections.deque(maxlen=max(1, int(ring_size)))
+        self.wait_timeout = wait_timeout
+        self.cond = threading.Condition()
+        self.seq = 0            # 取得済みフレームの通し番号
+        self.delivered_seq = 0  # 最後に処理側へ渡したフレームの番号
+        self.dropped = 0
+        self.last_ok = False
+        self.consecutive_failures = 0
+        self.last_error = None
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='camera-grabber', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        while self._running:
+            try:
+                ok, frame = self.impl.read()
+            except Exception as e:
+                ok, frame = False, None
+                self.last_error = e
+            ts = getattr(self.impl, 'last_ts', None) or time.time()
+            with self.cond:
+                self.last_ok = ok
+                if ok and frame is not None:
+                    self.seq += 1
+                    self.ring.append((self.seq, ts, frame))
+                    self.consecutive_failures = 0
+                    self.cond.notify_all()
+                else:
+                    self.consecutive_failures += 1
+            if not ok:
+                # 失敗時の空回りを防ぐ
+                time.sleep(0.01)
+
+    def read(self):
+        """まだ渡していない最新フレームを返す（無ければ wait_timeout まで待つ）"""
+        with self.cond:
+            if not self.ring or self.ring[-1][0] <= self.delivered_seq:
+                self.cond.wait_for(lambda: (self.ring and self.ring[-1][0] > self.delivered_seq)
+                                   or not self._running, timeout=self.wait_timeout)
+            if not self.ring or self.ring[-1][0] <= self.delivered_seq:
+                return False, None, None
+            seq, ts, frame = self.ring[-1]
+            if self.delivered_seq:
+                self.dropped += seq - self.delivered_seq - 1
+            self.delivered_seq = seq
+            return True, frame, ts
+
+    def stop(self):
+        self._running = False
+        with self.cond:
+            self.cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+
 class Camera:
     def __init__(self, index=0, width=640, height=480, fps=30, backend='auto', rotate=0, flip_h=False, flip_v=False,
-                 zmq_url='tcp://127.0.0.1:5555', zmq_topic='frame'):
+                 zmq_url='tcp://127.0.0.1:5555', zmq_topic='frame', threaded=False, ring_size=2,
+                 color_order='bgr', zmq_latest_only=False, zmq_decode_scale=1,
+                 replay_path=None, replay_pace='recorded', replay_loop=False,
+                 auto_reconnect=False, reconnect_after=3.0, backoff_initial=0.5, backoff_max=30.0,
+                 cache_path=None, orient_pixels=True, zmq_feedback_url=None):
+        if color_order not in ('bgr', 'rgb'):
+            raise ValueError(f"color_order must be 'bgr' or 'rgb': {color_order}")
         self.index = index
         self.width = width
         self.height = height
@@ -186,40 +810,134 @@ class Camera:
         self.rotate = rotate
         self.flip_h = flip_h
         self.flip_v = flip_v
+        # orient_pixels=False なら画素は回転・反転せず、landmark_orientation でランドマーク座標だけを変換する
+        # （向きの指定を使うのは opencv / picamera2 のみ。zmq などはプロキシ側で向きを整える）
+        self.orient_pixels = orient_pixels
+        self.landmark_orientation = None
+        if not orient_pixels and backend not in ('zmq', 'shm', 'landmarks', 'replay'):
+            orientation = Orientation(rotate, flip_h, flip_v)
+            self.landmark_orientation = None if orientation.identity else orientation
         self.impl = None
         self.zmq_url = zmq_url
         self.zmq_topic = zmq_topic
+        self.zmq_latest_only = zmq_latest_only
+        self.zmq_decode_scale = zmq_decode_scale
+        self.zmq_feedback_url = zmq_feedback_url
+        self.replay_path = replay_path
+        self.replay_pace = replay_pace
+        self.replay_loop = replay_loop
         self._last_read_ok = False
         self._consecutive_failures = 0
+        # 別スレッドでの取得（最新フレームのみ保持）を使うかどうか
+        self.threaded = threaded
+        self.ring_size = ring_size
+        self.grabber = None
+        self.last_capture_ts = None
+        # read() が返すフレームのチャンネル順（'bgr' または 'rgb'）
+        self.color_order = color_order
+        # 自動再接続: reconnect_after 秒フレームが取れなければ、別スレッドで開き直す
+        # （待ち時間は backoff_initial から倍々に増やし、backoff_max で頭打ち）
+        self.auto_reconnect = auto_reconnect and backend != 'replay'
+        self.reconnect_after = reconnect_after
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self._last_ok_ts = None
+        self._reconnect_thread = None
+        self._reconnecting = False
+        self._closing = False
+        self._down_since = None
+        self.reconnect_attempts = 0
+        self.reconnect_count = 0        # 復帰に成功した回数
+        self.total_downtime = 0.0       # 切断していた時間の合計（秒）
+        self.last_recovery_sec = None   # 直近の切断から復帰までの時間（秒）
+        # アプリ側でログに書くためのイベント（(イベント名, 詳細) のリスト）
+        self._events = []
+        # probe_camera.py で求めた最速構成。解像度が一致する場合のみ使う
+        self.cached = load_camera_cache(cache_path)
+        if self.cached and (self.cached.get('width'), self.cached.get('height')) != (width, height):
+            self.cached = None
 
     def open(self):
+        self.impl = self._create_impl()
+        self._last_ok_ts = time.time()
+        if self.threaded:
+            self.grabber = _FrameGrabber(self.impl, ring_size=self.ring_size).start()
+        return self
+
+    def _create_impl(self):
+        """バックエンドを開いて返す（self.impl にはまだ設定しない）"""
         try:
             if self.backend == 'zmq':
-                self.impl = _ZmqCamera(url=self.zmq_url, topic=self.zmq_topic).open()
-                return self
-            if self.backend in ('picamera2', 'auto'):
+                return _ZmqCamera(url=self.zmq_url, topic=self.zmq_topic,
+                                  color_order=self.color_order,
+                                  latest_only=self.zmq_latest_only,
+                                  decode_scale=self.zmq_decode_scale,
+                                  target_size=(self.width, self.height),
+                                  feedback_url=self.zmq_feedback_url).open()
+            if self.backend == 'replay':
+                return _ReplayCamera(self.replay_path, pace=self.replay_pace, fps=self.fps,
+                                     loop=self.replay_loop, color_order=self.color_order).open()
+            if self.backend == 'shm':
+                return _ShmCamera(url=self.zmq_url, topic=self.zmq_topic,
+                                  color_order=self.color_order).open()
+            if self.backend == 'landmarks':
+                return _LandmarkCamera(url=self.zmq_url, topic=self.zmq_topic).open()
+            if self.orient_pixels:
+                rotate, flip_h, flip_v = self.rotate, self.flip_h, self.flip_v
+            else:
+                rotate, flip_h, flip_v = 0, False, False
+            cached = self.cached or {}
+            fourcc = None
+            if cached.get('backend') == 'opencv' and cached.get('index', self.index) == self.index:
+                fourcc = cached.get('fourcc')
+            # キャッシュで OpenCV が最速と分かっていれば、Picamera2 の試行を省く
+            skip_picamera2 = (self.backend == 'auto' and cached.get('backend') == 'opencv')
+            if self.backend in ('picamera2', 'auto') and not skip_picamera2:
                 try:
-                    self.impl = _PiCamera2Camera(width=self.width, height=self.height, fps=self.fps,
-                                                 rotate=self.rotate, flip_h=self.flip_h, flip_v=self.flip_v).open()
-                    return self
+                    return _PiCamera2Camera(width=self.width, height=self.height, fps=self.fps,
+                                            rotate=rotate, flip_h=flip_h, flip_v=flip_v,
+                                            color_order=self.color_order).open()
                 except Exception as e:
                     if self.backend == 'picamera2':
                         raise
                     print(f"Warning: Picamera2 failed, falling back to OpenCV: {e}")
             # 最後の手段として OpenCV カメラにフォールバック
-            self.impl = _OpenCVCamera(index=self.index, width=self.width, height=self.height, fps=self.fps,
-                                       rotate=self.rotate, flip_h=self.flip_h, flip_v=self.flip_v).open()
-            return self
+            return _OpenCVCamera(index=self.index, width=self.width, height=self.height, fps=self.fps,
+                                 rotate=rotate, flip_h=flip_h, flip_v=flip_v,
+                                 color_order=self.color_order, fourcc=fourcc).open()
         except Exception as e:
             print(f"Error opening camera: {e}")
             raise
 
     def read(self):
-        if self.impl is None:
+        if self.impl is None or self._reconnecting:
+            # 再接続中は待たずにすぐ返す（UI 側は軽い表示を続ける）
             return False, None
+        ok, frame = self._read_impl()
+        if ok:
+            self._last_ok_ts = time.time()
+        elif (self.auto_reconnect and self._last_ok_ts is not None
+              and time.time() - self._last_ok_ts >= self.reconnect_after):
+            self._start_reconnect()
+        return ok, frame
+
+    def _read_impl(self):
+        if self.grabber is not None:
+            ok, frame, ts = self.grabber.read()
+            self._last_read_ok = ok
+            if ok:
+                self._consecutive_failures = 0
+                self.last_capture_ts = ts
+            else:
+                self._consecutive_failures += 1
+            return ok, frame
         try:
             ok, frame = self.impl.read()
             self._last_read_ok = ok
+            if ok:
+                # バックエンドが取得時刻を持っていればそれを、無ければ読み出し完了時刻を使う
+                self.last_capture_ts = getattr(self.impl, 'last_ts', None) or time.time()
             if ok:
                 self._consecutive_failures = 0
             else:
@@ -231,20 +949,145 @@ class Camera:
             print(f"Error reading camera frame: {e}")
             return False, None
 
+    def _add_event(self, event, info=None):
+        with self._lock:
+            self._events.append((event, info))
+
+    def pop_events(self):
+        """溜まっている再接続関連のイベント（とバックエンド固有のイベント）を取り出す"""
+        with self._lock:
+            events, self._events = self._events, []
+        impl = self.impl
+        if impl is not None and hasattr(impl, 'pop_events'):
+            events.extend(impl.pop_events())
+        return events
+
+    def report_latency(self, latency_ms, proc_ms=None):
+        """処理の遅れを送信元に報告する（対応するバックエンドのみ）"""
+        impl = self.impl
+        if impl is not None and not self._reconnecting and hasattr(impl, 'report_latency'):
+            impl.report_latency(latency_ms, proc_ms)
+
+    def _start_reconnect(self):
+        if self._reconnecting:
+            return
+        self._reconnecting = True
+        self._down_since = time.time()
+        self._add_event('camera_lost', f'backend={self.backend} failures={self._consecutive_failures}')
+        print("Warning: Camera lost, reconnecting in background...")
+        self._reconnect_thread = threading.Thread(target=self._reconnect_loop, name='camera-reconnect', daemon=True)
+        self._reconnect_thread.start()
+
+    def _close_impl(self):
+        if self.grabber is not None:
+            self.grabber.stop()
+            self.grabber = None
+        impl, self.impl = self.impl, None
+        if impl is not None:
+            try:
+                impl.release()
+            except Exception as e:
+                print(f"Error releasing camera: {e}")
+
+    def _reconnect_loop(self):
+        self._close_impl()
+        delay = self.backoff_initial
+        attempt = 0
+        while not self._closing:
+            attempt += 1
+            self.reconnect_attempts += 1
+            impl = None
+            try:
+                impl = self._create_impl()
+                # 開けても映像が来ないことがあるので、1枚読めたら復帰とみなす
+                ok, _ = impl.read()
+            except Exception as e:
+                ok = False
+                print(f"Camera reconnect attempt {attempt} failed: {e}")
+            if ok:
+                self.impl = impl
+                if self.threaded:
+                    self.grabber = _FrameGrabber(self.impl, ring_size=self.ring_size).start()
+                downtime = time.time() - self._down_since
+                self.last_recovery_sec = downtime
+                self.total_downtime += downtime
+                self.reconnect_count += 1
+                self._last_ok_ts = time.time()
+                self._consecutive_failures = 0
+                self._add_event('camera_recovered', f'attempts={attempt} downtime={downtime:.1f}s')
+                print(f"Camera recovered after {attempt} attempts ({downtime:.1f}s)")
+                self._reconnecting = False
+                return
+            if impl is not None:
+                try:
+                    impl.release()
+                except Exception:
+                    pass
+            self._add_event('camera_reconnect_failed', f'attempt={attempt} next_retry={delay:.1f}s')
+            # 待機中も release() ですぐ抜けられるよう細かく区切って待つ
+            end = time.time() + delay
+            while not self._closing and time.time() < end:
+                time.sleep(0.1)
+            delay = min(delay * 2.0, self.backoff_max)
+
+    def reconfigure(self, width, height, fps):
+        """アプリを止めずに取得解像度と fps を変更する（対応していないバックエンドでは False）"""
+        if self.impl is None or not hasattr(self.impl, 'reconfigure'):
+            return False
+        # 取得スレッドが動いていると設定変更中に read() が走るため、一旦止める
+        threaded = self.grabber is not None
+        dropped = 0
+        if threaded:
+            self.grabber.stop()
+            dropped = self.grabber.dropped
+            self.grabber = None
+        try:
+            ok = self.impl.reconfigure(width, height, fps)
+        except Exception as e:
+            print(f"Error reconfiguring camera: {e}")
+            ok = False
+        if ok:
+            self.width, self.height, self.fps = width, height, fps
+        elif self.impl is not None:
+            # 一部だけ反映された場合（OpenCV で fps が無視されたなど）は、実際の値に合わせる
+            self.width = getattr(self.impl, 'width', self.width)
+            self.height = getattr(self.impl, 'height', self.height)
+            self.fps = getattr(self.impl, 'fps', self.fps)
+        if threaded:
+            self.grabber = _FrameGrabber(self.impl, ring_size=self.ring_size).start()
+            self.grabber.dropped = dropped
+        return ok
+
     def get_status(self):
         """カメラの状態を取得"""
-        return {
-            'connected': self.impl is not None,
+        status = {
+            'connected': self.impl is not None and not self._reconnecting,
+            'reconnecting': self._reconnecting,
+            'reconnect_attempts': self.reconnect_attempts,
+            'reconnect_count': self.reconnect_count,
+            'downtime_sec': (time.time() - self._down_since) if self._reconnecting else 0.0,
+            'total_downtime_sec': self.total_downtime,
+            'last_recovery_sec': self.last_recovery_sec,
             'last_read_ok': self._last_read_ok,
             'consecutive_failures': self._consecutive_failures,
             'backend': self.backend,
+            'camera_cache': self.cached,
+            'width': self.width,
+            'height': self.height,
+            'fps': self.fps,
+            'threaded': self.grabber is not None,
+            'dropped_frames': self.grabber.dropped if self.grabber is not None else 0,
+            'last_capture_ts': self.last_capture_ts,
         }
+        # バックエンド固有の統計（受信・破棄数など）があれば併せて返す
+        impl = self.impl
+        if impl is not None and hasattr(impl, 'get_stats'):
+            status.update(impl.get_stats())
+        return status
 
     def release(self):
-        if self.impl is not None:
-            try:
-                self.impl.release()
-            except Exception as e:
-                print(f"Error releasing camera: {e}")
-            finally:
-                self.impl = None
+        self._closing = True
+        if self._reconnect_thread is not None:
+            self._reconnect_thread.join(timeout=5.0)
+            self._reconnect_thread = None
+        self._close_impl()
@@ -0,0 +1,193 @@
+"""
+FaceProcessor（FaceMesh）を別プロセスで動かすワーカープール
+メインループ（取得・特徴量・描画・ログ・表示）と FaceMesh を別々のコアで並行に処理する
+
+フレームは共有メモリ（shm_ring.ShmFrameRing）に書いてスロット番号だけを渡し、
+結果はランドマーク配列（(N, 3) float32）として受け取ります。
+ワーカーが複数ある場合は結果が前後して届くので、取得順に並べ直してから返します。
+"""
+import multiprocessing
+import os
+import queue
+import time
+
+from shm_ring import ShmFrameRing
+
+
+def _worker_main(index, tasks, results, face_kwargs):
+    # mediapipe は子プロセスの中で読み込む（親プロセスの状態を引き継がない）
+    from mediapipe_wrappers import FaceProcessor
+    face = FaceProcessor(**face_kwargs)
+    rings = {}
+    results.put(('ready', index, None, 0.0))
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        seq, ring_name, slot, ring_seq = task
+        ring = rings.get(ring_name)
+        if ring is None:
+            ring = rings[ring_name] = ShmFrameRing.attach(ring_name, shared_tracker=True)
+        t0 = time.perf_counter()
+        try:
+            frame = ring.view(slot, ring_seq)
+            if frame is None:
+                raise RuntimeError(f"frame {seq} was overwritten before processing")
+            fm = face.process(frame)
+            del frame
+        except Exception as e:
+            fm = {'error': str(e)}
+        results.put(('result', seq, fm, time.perf_counter() - t0))
+    for ring in rings.values():
+        ring.close()
+
+
+class FaceWorkerPool:
+    """FaceProcessor を workers 個の子プロセスで実行する
+
+    submit() でフレームを渡し、get() で取得順に (ctx, fm) を受け取ります。fm は
+    FaceProcessor.process() と同じ形の辞書です（処理に失敗したフレームは None）。
+    処理中のフレームは最大 depth 枚で、満杯の間 submit() は False を返します。
+
+    フレームは通し番号の順に各ワーカーへ順番に割り当てるので、各ワーカーの FaceMesh は
+    workers フレームおきの一定間隔の映像を見ることになります（追跡状態はワーカーごと）。
+    orientation（orientation.Orientation）はランドマーク座標の変換で、受け取り側で適用します。
+    """
+
+    def __init__(self, workers=2, depth=None, orientation=None, **face_kwargs):
+        self.workers = max(1, int(workers))
+        self.depth = max(1, int(depth)) if depth else self.workers + 1
+        self.orientation = orientation
+        self.face_kwargs = face_kwargs
+        # fork だと親の mediapipe・GUI のスレッド状態を引き継ぐので spawn で起動する
+        self._mp = multiprocessing.get_context('spawn')
+        self.procs = []
+        self.tasks = []
+        self.results = None
+        self.ring = None
+        self._old_rings = []  # 解像度が上がって作り直す前のリング（処理中のフレームが残るため閉じるのは終了時）
+        self._ring_count = 0
+        self._seq = 0
+        self._next = 1  # 次に返すフレームの通し番号
+        self._pending = {}  # 通し番号 → (submit() の ctx, 幅, 高さ)
+        self._done = {}  # 通し番号 → 届いた結果（取得順が来るまで保持）
+        self.proc_sec = 0.0
+        self.processed = 0
+        self.failed = 0
+
+    def start(self, timeout=60.0):
+        self.results = self._mp.Queue()
+        for i in range(self.workers):
+            q = self._mp.Queue()
+            p = self._mp.Process(target=_worker_main, args=(i, q, self.results, self.face_kwargs),
+                                 name=f'face-worker-{i}', daemon=True)
+            p.start()
+            self.tasks.append(q)
+            self.procs.append(p)
+        # 全ワーカーで FaceMesh の初期化が終わるまで待つ
+        ready = 0
+        deadline = time.time() + timeout
+        while ready < self.workers:
+            try:
+                kind = self.results.get(timeout=max(0.1, deadline - time.time()))[0]
+            except queue.Empty:
+                self.close()
+                raise RuntimeError("FaceMesh worker did not start in time")
+            if kind == 'ready':
+                ready += 1
+        return self
+
+    @property
+    def in_flight(self):
+        return len(self._pending)
+
+    def full(self):
+        return self.in_flight >= self.depth
+
+    def _ensure_ring(self, frame):
+        if self.ring is not None and frame.nbytes <= self.ring.slot_bytes:
+            return
+        if self.ring is not None:
+            self._old_rings.append(self.ring)
+        h, w = frame.shape[:2]
+        c = frame.shape[2] if frame.ndim == 3 else 1
+        self._ring_count += 1
+        name = f'focus_alert_face_{os.getpid()}_{self._ring_count}'
+        # 処理中のフレームは depth 枚までなので、スロットが上書きされることはない
+        self.ring = ShmFrameRing.create(name, w, h, channels=c, slots=self.depth)
+
+    def submit(self, frame, ctx=None):
+        """フレームをワーカーに渡す（処理中が depth 枚に達していれば渡さずに False）"""
+        if self.full():
+            return False
+        self._ensure_ring(frame)
+        slot, ring_seq = self.ring.write(frame, time.time())
+        self._seq += 1
+        self._pending[self._seq] = (ctx, frame.shape[1], frame.shape[0])
+        self.tasks[self._seq % self.workers].put((self._seq, self.ring.name, slot, ring_seq))
+        return True
+
+    def _check_alive(self):
+        for p in self.procs:
+            if not p.is_alive():
+                raise RuntimeError(f"FaceMesh worker {p.name} exited (code {p.exitcode})")
+
+    def get(self, block=False, timeout=None):
+        """取得順で次のフレームの (ctx, fm) を返す（結果がまだ無ければ None）"""
+        if not self._pending:
+            return None
+        deadline = None if timeout is None else time.time() + timeout
+        while self._next not in self._done:
+            wait = 1.0 if deadline is None else max(0.0, deadline - time.time())
+            try:
+                if block:
+                    _, seq, fm, elapsed = self.results.get(timeout=min(1.0, wait))
+                else:
+                    _, seq, fm, elapsed = self.results.get_nowait()
+            except queue.Empty:
+                if not block or (deadline is not None and time.time() >= deadline):
+                    return None
+                # 待っている間にワーカーが落ちていたら、いつまでも結果は来ない
+                self._check_alive()
+                continue
+            self.proc_sec += elapsed
+            self.processed += 1
+            self._done[seq] = fm
+        seq = self._next
+        self._next += 1
+        fm = self._done.pop(seq)
+        ctx, w, h = self._pending.pop(seq)
+        if fm is not None and 'error' in fm:
+            self.failed += 1
+            print(f"Error processing frame: {fm['error']}")
+            fm = None
+        if fm is not None and fm.get('landmarks') is not None and self.orientation is not None:
+            # 'faces'（複数人）の先頭は 'landmarks' と同じ配列なので、変換はどちらか一方に対して行う
+            for lms in fm.get('faces') or [fm['landmarks']]:
+                self.orientation.apply_landmarks(lms, w, h)
+        return ctx, fm
+
+    def get_stats(self):
+        return {
+            'face_workers': self.workers,
+            'face_in_flight': self.in_flight,
+            'face_worker_ms': (1000.0 * self.proc_sec / self.processed) if self.processed else 0.0,
+            'face_failed': self.failed,
+        }
+
+    def close(self):
+        for q in self.tasks:
+            try:
+                q.put(None)
+            except Exception:
+                pass
+        for p in self.procs:
+            p.join(timeout=2.0)
+            if p.is_alive():
+                p.terminate()
+        self.procs = []
+        self.tasks = []
+        for ring in self._old_rings + ([self.ring] if self.ring is not None else []):
+            ring.close()
+        self._old_rings = []
+        self.ring = None
@@ -1,75 +1,87 @@
 import numpy as np
 
+from temporal import FrameClock, ewma_alpha
+
 # FaceMesh（MediaPipe）の目のランドマーク番号
 # EAR（まばたき指標）計算に使う左右の主要点
 LEFT = [33, 160, 158, 133, 153, 144]
 RIGHT = [263, 387, 385, 362, 380, 373]
+# EAR の距離を測る点の組（各目の6点 [外側, 上まぶた1, 下まぶた1, 内側, 下まぶた2, 上まぶた2] 内の位置）
+# 縦 p2-p5, 縦 p3-p6, 横 p1-p4 の3本。左右の目の分をランドマーク番号の (2, 3) 配列にしておく
+_EYES = np.array([LEFT, RIGHT])
+_EAR_A = _EYES[:, [1, 2, 0]]
+_EAR_B = _EYES[:, [4, 5, 3]]
+
+
+def eye_aspect_ratios(lms):
+    """(N, 3) のランドマーク配列から左右の EAR を (左, 右) で返す"""
+    d = lms[_EAR_A, :2].astype(np.float64) - lms[_EAR_B, :2]
+    dist = np.sqrt((d * d).sum(axis=2))  # (2, 3)
+    horiz = dist[:, 2]
+    if horiz.min() <= 1e-6:
+        return tuple(float((v0 + v1) / (2.0 * hz)) if hz > 1e-6 else 0.0 for v0, v1, hz in dist)
+    ear = (dist[:, 0] + dist[:, 1]) / (2.0 * horiz)
+    return float(ear[0]), float(ear[1])
 
 class BlinkDetector:
     def __init__(self):
         self.ear_smooth = 0.0
-        self.alpha = 0.2
+        self.alpha = 0.2  # 30fps時の1フレームあたりの係数（実際のフレーム間隔に合わせて換算）
         self.closed = False
-        self.close_frames = 0
+        self.close_sec = 0.0  # 閉眼が続いている時間（秒）
         self.blinks = 0
-        self.long_close_frames = 0
-        self.long_close_threshold_frames = 12  # 30fps時におよそ400ms
+        self.long_close_sec = 0.4  # この時間以上の閉眼を長い閉眼とする
+        self.blink_max_sec = 0.67  # 瞬目とみなす閉眼の最大時間（30fps時の20フレーム）
+        self.clock = FrameClock()
         # 開眼時 EAR の基準値（EWMAでゆっくり更新）
         self.open_baseline = 0.45
-        self.base_alpha = 0.05
+        self.base_alpha = 0.05  # 30fps時の係数
         # セッション中の基準値の適応を無効化できるフラグ（評価フェーズなど）
         self.adapt_enabled = True
         # EAR閾値の比率（基準値の何%で閉眼と判定するか）
         self.ear_threshold_ratio = 0.90
 
-    @staticmethod
-    def _ear(pts):
-        # pts: [p1,p2,p3,p4,p5,p6] = [外側, 上まぶた1, 下まぶた1, 内側, 下まぶた2, 上まぶた2]
-        p1,p2,p3,p4,p5,p6 = pts
-        # numpy を用いて距離を計算
-        def d(a,b):
-            return np.hypot(a.x - b.x, a.y - b.y)
-        vert = d(p2,p5) + d(p3,p6)
-        horiz = d(p1,p4)
-        if horiz <= 1e-6:
-            return 0.0
-        return vert / (2.0 * horiz)
-
-    def _eye_ear(self, lms, idxs):
-        pts = [lms[i] for i in idxs]
-        return self._ear(pts)
+    def reset(self):
+        """計測中に変わる状態（平滑値・閉眼の継続・瞬目数・開眼基準値・時刻）を初期値に戻す。係数・しきい値の設定は残す"""
+        self.ear_smooth = 0.0
+        self.closed = False
+        self.close_sec = 0.0
+        self.blinks = 0
+        self.open_baseline = 0.45
+        self.clock = FrameClock()
 
-    def update(self, landmarks):
-        le = self._eye_ear(landmarks, LEFT)
-        re = self._eye_ear(landmarks, RIGHT)
+    def update(self, landmarks, ts=None):
+        """ts はフレームの時刻（秒）。省略すると 30fps で1フレーム進んだものとして扱う"""
+        dt = self.clock.tick(ts)
+        le, re = eye_aspect_ratios(landmarks)
         ear = (le + re) * 0.5
         # 平滑化（指数移動平均）
         if self.ear_smooth == 0.0:
             self.ear_smooth = ear
         else:
-            self.ear_smooth = self.alpha * ear + (1 - self.alpha) * self.ear_smooth
+            a = ewma_alpha(self.alpha, dt)
+            self.ear_smooth = a * ear + (1 - a) * self.ear_smooth
 
         # 閉眼していない時に開眼基準値を更新（保守的）
         # 瞬目中に基準値が下がりすぎないよう、現在値と平滑値の大きい方を採用
         if self.adapt_enabled:
             candidate = max(ear, self.ear_smooth)
             if not self.closed:
-                self.open_baseline = (1 - self.base_alpha) * self.open_baseline + self.base_alpha * candidate
+                a = ewma_alpha(self.base_alpha, dt)
+                self.open_baseline = (1 - a) * self.open_baseline + a * candidate
 
         # 相対しきい値: 基準値の指定比率未満で「閉眼」とみなす
         thresh = self.open_baseline * self.ear_threshold_ratio
 
         if ear < thresh:
-            self.close_frames += 1
-            self.long_close_frames += 1
+            self.close_sec += dt
             now_closed = True
         else:
             now_closed = False
-            # 閉→開の遷移時に、一定範囲の継続フレーム数なら「瞬目」とカウント
-            if self.closed and 1 <= self.close_frames <= 20:
+            # 閉→開の遷移時に、閉眼の継続時間が一定範囲なら「瞬目」とカウント
+            if self.closed and self.close_sec <= self.blink_max_sec + 1e-6:
                 self.blinks += 1
-            self.close_frames = 0
-            self.long_close_frames = 0
+            self.close_sec = 0.0
 
         self.closed = now_closed
 
@@ -80,14 +92,15 @@ class BlinkDetector:
             'ear_thresh': float(thresh),
             'blink_count': int(self.blinks),
             'is_closed': bool(self.closed),
-            'long_close': bool(self.long_close_frames >= self.long_close_threshold_frames)
+            # 30fps で 1/30 秒ずつ積み上げた和が 0.4 をわずかに下回らないよう、許容誤差を入れて比べる
+            'long_close': bool(self.close_sec >= self.long_close_sec - 1e-6)
         }
 
-    def miss(self):
+    def miss(self, ts=None):
         # 顔を見失った時: 平滑値を基準値へ緩やかに戻し、カウントはしない
-        self.ear_smooth = self.alpha * self.open_baseline + (1 - self.alpha) * self.ear_smooth
-        self.close_frames = 0
-        self.long_close_frames = 0
+        a = ewma_alpha(self.alpha, self.clock.tick(ts))
+        self.ear_smooth = a * self.open_baseline + (1 - a) * self.ear_smooth
+        self.close_sec = 0.0
         self.closed = False
         return {
             'ear': float(self.ear_smooth),
@@ -1,13 +1,22 @@
 import time
 
+from temporal import FrameClock, ewma_alpha
+
 class FusionScorer:
     def __init__(self):
         self.score = 0.0
-        self.alpha = 0.3
+        self.alpha = 0.3  # 30fps時の1フレームあたりの係数（フレーム間隔に合わせて換算）
+        self.clock = FrameClock()
         self.hi = 0.55  # アラートのしきい値
         self.lo = 0.35  # 今は未使用（将来の解除ヒステリシス用）
 
-    def update(self, feats, perso):
+    def reset(self):
+        """スコアと時刻を初期値に戻す。しきい値の設定は残す"""
+        self.score = 0.0
+        self.clock = FrameClock()
+
+    def update(self, feats, perso, ts=None):
+        # ts はフレームの時刻（秒）。省略すると 30fps で1フレーム進んだものとして扱う
         # ヒューリスティック: 長時間の閉眼と継続的な視線逸脱を強めに評価
         blink = feats['blink']
         gaze = feats['gaze']
@@ -16,7 +25,8 @@ class FusionScorer:
         off_lvl = float(gaze.get('gaze_off_level', 1.0 if gaze.get('gaze_off', False) else 0.0))
 
         raw = 0.7 * long_close + 0.2 * off_lvl + 0.1 * closed_now
-        self.score = self.alpha * raw + (1 - self.alpha) * self.score
+        a = ewma_alpha(self.alpha, self.clock.tick(ts))
+        self.score = a * raw + (1 - a) * self.score
         return self.score
 
     def get_concentration_score(self):
@@ -0,0 +1,116 @@
+"""
+処理の遅れに応じてカメラの取得解像度・fps を段階的に切り替える
+"""
+
+
+def parse_levels(text):
+    """'640x480@30,480x360@20' の形式を [(幅, 高さ, fps), ...] に変換する"""
+    levels = []
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        size, fps = item.split('@')
+        w, h = size.lower().split('x')
+        levels.append((int(w), int(h), float(fps)))
+    if not levels:
+        raise ValueError(f"No capture levels in: {text}")
+    return levels
+
+
+def default_levels(width, height, fps=30.0):
+    """要求された解像度を最上段に、幅・高さを 3/4・1/2 に縮めた3段のレベルを作る（--governor-levels 省略時）"""
+    return [(int(width), int(height), float(fps)),
+            (int(width * 3 // 4), int(height * 3 // 4), float(fps) * 2 / 3),
+            (int(width // 2), int(height // 2), float(fps) / 2)]
+
+
+class CaptureGovernor:
+    """1フレームの処理時間を監視して、取得レベルを上げ下げする
+
+    levels は負荷の重い順（高解像度・高fps が先頭）に並べます。
+    処理時間の平滑値が現在レベルのフレーム間隔の high 倍を down_hold 秒超え続けたら1段下げ、
+    1段上のレベルのフレーム間隔の low 倍を up_hold 秒下回り続けたら1段上げます。
+    上げ下げの閾値と保持時間を分けることで、レベルが行き来し続けないようにしています。
+    """
+
+    def __init__(self, levels, start_level=0, high=0.9, low=0.5, down_hold=2.0, up_hold=10.0, alpha=0.1):
+        self.levels = list(levels)
+        self.level = max(0, min(start_level, len(self.levels) - 1))
+        self.high = high
+        self.low = low
+        self.down_hold = down_hold
+        self.up_hold = up_hold
+        self.alpha = alpha
+        self.latency = None  # 処理時間の平滑値（秒）
+        self._over_since = None
+        self._under_since = None
+
+    @property
+    def current(self):
+        return self.levels[self.level]
+
+    def _interval(self, level):
+        return 1.0 / max(1e-3, self.levels[level][2])
+
+    def _set_level(self, level):
+        self.level = level
+        # 切り替え直後は新しいレベルで測り直す
+        self.latency = None
+        self._over_since = None
+        self._under_since = None
+        return self.current
+
+    def update(self, latency, now):
+        """処理時間（秒）を1件反映する。レベルを変えたときだけ新しい (幅, 高さ, fps) を返す"""
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = self.alpha * latency + (1 - self.alpha) * self.latency
+
+        if self.latency > self.high * self._interval(self.level):
+            self._under_since = None
+            if self._over_since is None:
+                self._over_since = now
+            if now - self._over_since >= self.down_hold and self.level < len(self.levels) - 1:
+                return self._set_level(self.level + 1)
+        elif self.level > 0 and self.latency < self.low * self._interval(self.level - 1):
+            self._over_since = None
+            if self._under_since is None:
+                self._under_since = now
+            if now - self._under_since >= self.up_hold:
+                return self._set_level(self.level - 1)
+        else:
+            self._over_since = None
+            self._under_since = None
+        return None
+
+
+def parse_quality_levels(text):
+    """'85@1.0,70@1.0,55@0.75' の形式を [(JPEG 品質, 縮小率), ...] に変換する"""
+    levels = []
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        quality, scale = item.split('@')
+        levels.append((int(quality), float(scale)))
+    if not levels:
+        raise ValueError(f"No quality levels in: {text}")
+    return levels
+
+
+class LatencyTargetGovernor(CaptureGovernor):
+    """遅延の目標値（秒）を基準に、レベルを上げ下げする
+
+    CaptureGovernor と同じ上げ下げの規則で、閾値をフレーム間隔ではなく固定の target にしたものです。
+    cam_proxy.py が受信側から報告された遅延に応じて JPEG 品質・縮小率を切り替えるのに使います。
+    """
+
+    def __init__(self, levels, target, start_level=0, high=1.0, low=0.6, down_hold=1.0, up_hold=5.0, alpha=0.2):
+        super().__init__(levels, start_level=start_level, high=high, low=low,
+                         down_hold=down_hold, up_hold=up_hold, alpha=alpha)
+        self.target = target
+
+    def _interval(self, level):
+        return self.target
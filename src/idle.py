@@ -0,0 +1,131 @@
+"""
+長時間の不在（席に誰もいない）のときの省電力状態を管理する
+顔が idle_after 秒見つからなければアイドル状態に入り、カメラの fps とメインループ・描画の頻度を
+idle_fps まで下げる。アイドル中のフレームは顔が戻ったかを調べるためのもの（プローブ）で、
+顔を捉えたら通常の取得に戻し、そのフレームの取得から通常の処理に戻るまでの時間（復帰遅延）を測る
+"""
+import time
+
+
+class IdleController:
+    """顔の有無からアイドル状態への出入りを判定し、不在の区間と復帰遅延を記録する
+
+    update() はアイドルに入ったフレームで 'idle'、顔が戻ったフレームで 'wake' を返します。
+    'wake' の後、通常の取得に戻して最初のフレームを処理したら wake_done() を呼ぶと、
+    顔を捉えたフレームの取得時刻からの経過時間を復帰遅延として記録します。
+    復帰遅延は最大でもプローブの間隔（1 / idle_fps）とカメラの設定変更の時間の和に収まる想定です。
+    'idle' の後にカメラの fps を下げられたかを camera_applied() で知らせると、カメラ側の省電力が
+    実際に効いた不在の回数と、その場合の復帰遅延を分けて記録します（ドライバが fps の指定を
+    無視した場合は、メインループの間引きだけの省電力です）。
+    計測ループからは step() を毎フレーム呼べば、カメラの取得設定の切り替えまで行います。
+    """
+
+    def __init__(self, idle_after=60.0, idle_fps=2.0):
+        self.idle_after = idle_after
+        self.idle_fps = max(0.1, float(idle_fps))
+        self.idle = False
+        self.last_face_ts = None  # 最後に顔があった時刻
+        self.absent_since = None  # アイドル中の不在の開始時刻（最後に顔があった時刻）
+        self._wake_from = None  # 顔が戻ったプローブフレームの取得時刻
+        self.absences = 0
+        self.idle_sec = 0.0  # アイドル状態で過ごした時間の合計
+        self._idle_start = None
+        self.wake_ms = []
+        self.camera_slowed = 0  # カメラの fps を実際に下げられた不在の回数
+        self._slowed = False  # 今の不在でカメラの fps を下げられたか
+        self.slowed_wake_ms = []  # カメラの fps を下げていた不在からの復帰遅延
+        self._full_level = None  # アイドルに入る前の取得設定（カメラの設定が変わった場合のみ）
+        self._events = []
+
+    @property
+    def interval(self):
+        """アイドル中のフレーム（プローブ）の間隔（秒）"""
+        return 1.0 / self.idle_fps
+
+    @property
+    def waking(self):
+        return self._wake_from is not None
+
+    def update(self, has_face, now=None, capture_ts=None):
+        """このフレームの顔の有無を反映し、状態が変わったら 'idle' / 'wake' を返す"""
+        now = time.time() if now is None else now
+        if self.last_face_ts is None or has_face:
+            prev_face_ts = self.last_face_ts
+            self.last_face_ts = now
+            if has_face and self.idle:
+                self.idle = False
+                self.absent_since = prev_face_ts
+                self._wake_from = capture_ts if capture_ts else now
+                self.idle_sec += now - self._idle_start
+                return 'wake'
+            return None
+        if not self.idle and now - self.last_face_ts >= self.idle_after:
+            self.idle = True
+            self._idle_start = now
+            self.absences += 1
+            self._slowed = False
+            return 'idle'
+        return None
+
+    def camera_applied(self, applied):
+        """'idle' の後に呼び、カメラの fps を idle_fps に下げられたか（設定を読み戻した結果）を記録する"""
+        self._slowed = bool(applied)
+        if applied:
+            self.camera_slowed += 1
+
+    def wake_done(self, now=None):
+        """通常の取得に戻って最初のフレームを処理した時点で呼び、復帰遅延（ミリ秒）を返す"""
+        if self._wake_from is None:
+            return None
+        now = time.time() if now is None else now
+        ms = (now - self._wake_from) * 1000.0
+        self._wake_from = None
+        self.wake_ms.append(ms)
+        if self._slowed:
+            self.slowed_wake_ms.append(ms)
+        return ms
+
+    def step(self, cam, has_face, now=None, capture_ts=None):
+        """1フレームごとに呼び、アイドルへの出入りに合わせてカメラ（capture.Camera）の取得設定を切り替える
+
+        不在の開始・終了は pop_events() で（イベント名, 詳細）として取り出せます。
+        """
+        now = time.time() if now is None else now
+        if self.waking:
+            # 顔が戻ってから最初の通常のフレームまでを処理した
+            wake_ms = self.wake_done(now)
+            info = f'absent_sec={now - self.absent_since:.1f} wake_ms={wake_ms:.0f}'
+            print(f"Face is back, full rate resumed: {info}")
+            self._events.append(('absence_end', info))
+        change = self.update(has_face, now, capture_ts)
+        if change == 'idle':
+            level = (cam.width, cam.height, cam.fps)
+            applied = cam.reconfigure(cam.width, cam.height, self.idle_fps)
+            self.camera_applied(cam.fps < level[2])
+            # 要求どおりの fps にならなくても（ドライバが丸めた場合など）設定が変わっていれば、復帰時に戻す
+            self._full_level = level if (cam.width, cam.height, cam.fps) != level else None
+            info = (f'no_face_sec={now - self.last_face_ts:.1f} idle_fps={self.idle_fps:g} '
+                    f'camera_fps_applied={applied} camera_fps={cam.fps:g}')
+            print(f"Idle (no face): {info}")
+            self._events.append(('absence_start', info))
+        elif change == 'wake' and self._full_level is not None:
+            cam.reconfigure(*self._full_level)
+            self._full_level = None
+        return change
+
+    def pop_events(self):
+        """不在の開始・終了のイベント（イベント名, 詳細）を取り出す"""
+        events, self._events = self._events, []
+        return events
+
+    def get_stats(self):
+        idle_sec = self.idle_sec + ((time.time() - self._idle_start) if self.idle else 0.0)
+        return {
+            'idle_absences': self.absences,
+            'idle_sec': idle_sec,
+            'idle_wake_ms_mean': (sum(self.wake_ms) / len(self.wake_ms)) if self.wake_ms else None,
+            'idle_wake_ms_max': max(self.wake_ms) if self.wake_ms else None,
+            'idle_camera_slowed': self.camera_slowed,
+            'idle_slowed_wake_ms_mean': (sum(self.slowed_wake_ms) / len(self.slowed_wake_ms))
+            if self.slowed_wake_ms else None,
+        }
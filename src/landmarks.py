@@ -0,0 +1,25 @@
+"""
+FaceMesh のランドマークを (N, 3) の float32 配列（正規化座標 x, y, z）として扱うための補助
+FaceProcessor.process() の戻り値、cam_proxy.py --transport landmarks の送信データ、
+capture.Camera の backend=landmarks の受信データはすべてこの形です
+"""
+import itertools
+
+import numpy as np
+
+# refine_landmarks=True のときの点数（顔 468 点 + 虹彩 10 点）
+NUM_LANDMARKS = 478
+
+
+def landmarks_to_array(lms, out=None):
+    """MediaPipe のランドマーク列を (N, 3) の float32 配列に1回で変換する
+
+    out に同じ形の配列を渡すと、そこへ書き込んで返します（返す配列を呼び出し側で使い回せる）。
+    """
+    n = len(lms)
+    flat = np.fromiter(itertools.chain.from_iterable((p.x, p.y, p.z) for p in lms),
+                       dtype=np.float32, count=3 * n)
+    if out is None or out.shape != (n, 3):
+        return flat.reshape(n, 3)
+    out.reshape(-1)[:] = flat
+    return out
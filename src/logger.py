@@ -1,6 +1,19 @@
 import csv, time, os
 from datetime import datetime
 
+# 共通ヘッダ（行は常にこの列数にそろえて書く）
+HEADER = [
+    'ts','row_type','session','participant','task','phase','block_id',
+    'ear','ear_base','ear_thr','blink_count','is_closed','long_close',
+    'gaze','gaze_thr','gaze_bias','gaze_y','gaze_y_thr','gaze_bias_y','gaze_offlvl',
+    'risk','alert','event','info',
+    # フレームの取得時刻と、取得から処理開始まで / 判定までの経過時間
+    'capture_ts','frame_age_ms','latency_ms',
+    # 複数人モード（--max-faces 2 以上）の追跡 ID。1人のときは空
+    'face_id',
+]
+
+
 class CSVLogger:
     def __init__(self, path, meta=None, auto_name=True):
         self.path = path
@@ -19,53 +32,64 @@ class CSVLogger:
             os.makedirs(os.path.dirname(self.path), exist_ok=True) if os.path.dirname(self.path) else None
         self._init()
 
+    def _row(self, ts, row_type, block_id=None, **values):
+        # 列名で値を受け取り、ヘッダ順に並べる（列のずれを防ぐ）
+        row = dict.fromkeys(HEADER)
+        row.update({
+            'ts': ts, 'row_type': row_type,
+            'session': self.meta.get('session'), 'participant': self.meta.get('participant'),
+            'task': self.meta.get('task'), 'phase': self.meta.get('phase'), 'block_id': block_id,
+        })
+        row.update(values)
+        return [row[k] for k in HEADER]
+
     def _init(self):
         with open(self.path, 'w', newline='', encoding='utf-8') as f:
             w = csv.writer(f)
             # 共通ヘッダ
-            w.writerow([
-                'ts','row_type','session','participant','task','phase','block_id',
-                'ear','ear_base','ear_thr','blink_count','is_closed','long_close',
-                'gaze','gaze_thr','gaze_bias','gaze_y','gaze_y_thr','gaze_bias_y','gaze_offlvl',
-                'risk','alert','event','info'
-            ])
+            w.writerow(HEADER)
             # 必要に応じてメタ行を書き込む
             # 日時情報を追加
             meta_with_time = self.meta.copy()
             meta_with_time['start_time'] = datetime.now().isoformat()
             meta_with_time['start_timestamp'] = time.time()
-            w.writerow([
-                time.time(),'meta',
-                self.meta.get('session'), self.meta.get('participant'), self.meta.get('task'), self.meta.get('phase'), None,
-                None,None,None,None,None,None,
-                None,None,None,None,None,None,None,
-                None,None,'meta', str(meta_with_time)
-            ])
+            w.writerow(self._row(time.time(), 'meta', event='meta', info=str(meta_with_time)))
+
+    def write_frame(self, feats, score, alert, block_id=None, ts=None, capture_ts=None, processed_ts=None,
+                    face_id=None):
+        """フレーム行を書き込み、行に記録した ts を返す（録画との突き合わせ用）
 
-    def write_frame(self, feats, score, alert, block_id=None):
+        capture_ts はカメラでの取得時刻、processed_ts は処理を始めた時刻。
+        frame_age_ms は取得から処理開始まで、latency_ms は取得から判定（行の ts）までの時間。
+        複数人モードでは同じ ts で顔ごとに1行ずつ書き、face_id に追跡 ID を入れる。
+        """
+        ts = time.time() if ts is None else ts
+        b = feats.get('blink', {})
+        g = feats.get('gaze', {})
+        frame_age_ms = latency_ms = None
+        if capture_ts is not None:
+            latency_ms = (ts - capture_ts) * 1000.0
+            if processed_ts is not None:
+                frame_age_ms = (processed_ts - capture_ts) * 1000.0
         with open(self.path, 'a', newline='', encoding='utf-8') as f:
             w = csv.writer(f)
-            b = feats.get('blink', {})
-            g = feats.get('gaze', {})
-            w.writerow([
-                time.time(),'frame',
-                self.meta.get('session'), self.meta.get('participant'), self.meta.get('task'), self.meta.get('phase'), block_id,
-                b.get('ear'), b.get('ear_baseline'), b.get('ear_thresh'), b.get('blink_count'), b.get('is_closed'), b.get('long_close'),
-                g.get('gaze_horiz'), g.get('gaze_thresh'), g.get('gaze_bias'),
-                g.get('gaze_y'), g.get('gaze_y_thresh'), g.get('gaze_bias_y'), g.get('gaze_off_level'),
-                score, int(alert), None, None
-            ])
+            w.writerow(self._row(
+                ts, 'frame', block_id,
+                ear=b.get('ear'), ear_base=b.get('ear_baseline'), ear_thr=b.get('ear_thresh'),
+                blink_count=b.get('blink_count'), is_closed=b.get('is_closed'), long_close=b.get('long_close'),
+                gaze=g.get('gaze_horiz'), gaze_thr=g.get('gaze_thresh'), gaze_bias=g.get('gaze_bias'),
+                gaze_y=g.get('gaze_y'), gaze_y_thr=g.get('gaze_y_thresh'), gaze_bias_y=g.get('gaze_bias_y'),
+                gaze_offlvl=g.get('gaze_off_level'),
+                risk=score, alert=int(alert),
+                capture_ts=capture_ts, frame_age_ms=frame_age_ms, latency_ms=latency_ms,
+                face_id=face_id,
+            ))
+        return ts
 
     def write_event(self, event, info=None, block_id=None):
         with open(self.path, 'a', newline='', encoding='utf-8') as f:
             w = csv.writer(f)
-            w.writerow([
-                time.time(),'event',
-                self.meta.get('session'), self.meta.get('participant'), self.meta.get('task'), self.meta.get('phase'), block_id,
-                None,None,None,None,None,None,
-                None,None,None,None,
-                None,None,event, info
-            ])
+            w.writerow(self._row(time.time(), 'event', block_id, event=event, info=info))
     
     def write_note(self, note_text):
         """メモを記録"""
@@ -1,8 +1,109 @@
+import os
+import threading
+import time
+
+import cv2
 import mediapipe as mp
+import numpy as np
+
+from features.blink import LEFT as LEFT_EYE, RIGHT as RIGHT_EYE, eye_aspect_ratios
+from features.gaze import LEFT_INNER, LEFT_OUTER, RIGHT_INNER, RIGHT_OUTER
+from landmarks import NUM_LANDMARKS, landmarks_to_array
+
+# キーフレームの間にオプティカルフローで追跡する点（blink.py / gaze.py が参照する目と虹彩の点）
+# 468〜477 は refine_landmarks=True のときの虹彩（中心と輪郭）
+TRACK_INDICES = sorted(set(LEFT_EYE) | set(RIGHT_EYE) |
+                       {LEFT_INNER, LEFT_OUTER, RIGHT_INNER, RIGHT_OUTER} | set(range(468, 478)))
+
+_LK_PARAMS = dict(winSize=(15, 15), maxLevel=2,
+                  criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+
+
+def _mean_ear(arr):
+    le, re = eye_aspect_ratios(arr)
+    return 0.5 * (le + re)
+
 
 class FaceProcessor:
-    def __init__(self, static_mode=False, refine_iris=True, max_faces=1):
-        self.face_mesh = mp.solutions.face_mesh.FaceMesh(
+    """FaceMesh で顔ランドマークを求める
+
+    process() の 'landmarks' は (N, 3) float32 の配列（正規化座標 x, y, z。顔が無ければ None）。
+    毎フレーム FaceMesh を使う場合、この配列は内部のバッファで、次の process() で上書きされます
+    （フレームをまたいで保持する場合は copy() すること）。
+    max_faces が 2 以上のときは 'faces' に検出した全員分の配列のリストも入れます（'landmarks' はその先頭）。
+    複数人の処理では顔ROI・キーフレームは使いません（どちらも1人の顔を前提にしているため）。
+
+    presence_interval を 1 以上にすると、顔を absent_after フレーム続けて見失った後は FaceMesh を止め、
+    presence_interval フレームに1回だけ軽い判定（presence_mode: 'detector' は短距離の顔検出器、
+    'motion' はフレーム差分、'both' は差分で動きがあったときだけ検出器）を行います。
+    顔が現れたらそのフレームから FaceMesh を再開します。止めている間の結果には 'absent': True が入ります。
+    """
+
+    def __init__(self, static_mode=False, refine_iris=True, max_faces=1, roi=False, roi_pad=0.5, orientation=None,
+                 keyframe_interval=1, track_max_error=1.5, blink_drop_ratio=0.93,
+                 presence_interval=0, presence_mode='detector', absent_after=5, motion_thresh=4.0):
+        self.face_mesh = self._create(static_mode, refine_iris, max_faces)
+        self.max_faces = max(1, int(max_faces))
+        if self.max_faces > 1:
+            roi = False
+            keyframe_interval = 1
+        # 画素の向きを変えずに渡す場合の変換（orientation.Orientation）。ランドマーク座標側を変換する
+        self.orientation = orientation
+        # 顔ROIモード: 前フレームのランドマーク外接矩形を広げた領域だけを FaceMesh に渡す
+        self.roi_enabled = roi
+        self.roi_pad = roi_pad  # 外接矩形の幅・高さに対する余白の割合
+        self.roi = None  # (x0, y0, x1, y1) ピクセル座標。None なら全画面
+        # 切り出し画像は全画面とサイズが違うため、FaceMesh の追跡状態が混ざらないよう別インスタンスで処理
+        self.roi_mesh = self._create(static_mode, refine_iris, max_faces) if roi else None
+        # 全画面1回あたりの処理時間（EWMA, 秒）。ROI 処理の速度向上率の基準に使う
+        self.full_time = None
+        self.last_time = 0.0
+        self.last_speedup = 1.0
+        # ランドマークの変換先（毎フレーム使い回す）
+        self._buf = np.empty((NUM_LANDMARKS if refine_iris else 468, 3), dtype=np.float32)
+        self._face_bufs = [self._buf] + [np.empty_like(self._buf) for _ in range(self.max_faces - 1)]
+        # キーフレームモード: FaceMesh は keyframe_interval フレームに1回だけ実行し、
+        # 間のフレームは目と虹彩の点を Lucas-Kanade 法で追跡する（1 なら毎フレーム FaceMesh）
+        self.keyframe_interval = max(1, int(keyframe_interval))
+        self.track_max_error = track_max_error  # 往復追跡の誤差（ピクセル）がこれを超えたらキーフレーム
+        self.blink_drop_ratio = blink_drop_ratio  # EAR が開眼時のこの比率を下回ったら瞬目の開始とみなす
+        self._key_arr = None  # 直近のランドマーク（元画像基準の正規化座標, (N, 3)）
+        self._prev_gray = None
+        self._prev_pts = None  # 追跡点のピクセル座標 (M, 1, 2)
+        self._track_idx = None
+        self._since_key = 0
+        self._force_key = False
+        self._open_ear = None  # 開眼時の EAR（キーフレームの EWMA）
+        self._key_ear = None
+        self.frames = 0
+        self.mesh_calls = 0
+        self.last_track_error = 0.0
+        # 顔の有無の事前判定（カスケード）。FaceMesh も顔が無いときは内部の検出器を毎フレーム実行するだけなので、
+        # 判定の頻度を下げ、動きの無いフレームでは検出器も省くことで負荷を減らす
+        if presence_mode not in ('detector', 'motion', 'both'):
+            raise ValueError(f"presence_mode must be 'detector', 'motion' or 'both': {presence_mode}")
+        self.presence_interval = max(0, int(presence_interval))
+        self.presence_mode = presence_mode
+        self.absent_after = max(1, int(absent_after))
+        self.motion_thresh = motion_thresh  # 縮小したグレー画像の平均の差（0〜255）がこれを超えたら動きあり
+        self.face_detector = None
+        if self.presence_interval > 0 and presence_mode != 'motion':
+            # 誤検出しても FaceMesh を数フレーム実行するだけなので、見逃しにくい低めのしきい値にする
+            self.face_detector = mp.solutions.face_detection.FaceDetection(
+                model_selection=0, min_detection_confidence=0.3)
+        self._absent = False
+        self._miss_run = 0
+        self._absent_frames = 0
+        self._motion_ref = None
+        self._quiet_checks = 0
+        self.presence_recheck = 10  # 'both' で動きが無くても、判定のこの回数に1回は検出器で確かめる
+        self.absent_skipped = 0  # FaceMesh を実行せずに返したフレーム
+        self.presence_checks = 0
+        self.detector_calls = 0
+
+    @staticmethod
+    def _create(static_mode, refine_iris, max_faces):
+        return mp.solutions.face_mesh.FaceMesh(
             static_image_mode=static_mode,
             max_num_faces=max_faces,
             refine_landmarks=refine_iris,
@@ -10,10 +111,376 @@ class FaceProcessor:
             min_tracking_confidence=0.5,
         )
 
-    def process(self, rgb_image):
-        res = self.face_mesh.process(rgb_image)
+    @staticmethod
+    def _run(mesh, rgb_image):
+        t0 = time.perf_counter()
+        res = mesh.process(rgb_image)
+        return res, time.perf_counter() - t0
+
+    def _update_roi(self, lms, w, h):
+        bx0, by0 = lms[:, :2].min(axis=0) * (w, h)
+        bx1, by1 = lms[:, :2].max(axis=0) * (w, h)
+        # 顔が現在の ROI の内側に十分収まっている間は ROI を動かさない
+        # （毎フレーム切り出し位置が変わると FaceMesh の追跡が不安定になるため）
+        if self.roi is not None:
+            x0, y0, x1, y1 = self.roi
+            mx = 0.1 * (x1 - x0)
+            my = 0.1 * (y1 - y0)
+            if bx0 >= x0 + mx and bx1 <= x1 - mx and by0 >= y0 + my and by1 <= y1 - my:
+                return
+        pw = (bx1 - bx0) * self.roi_pad
+        ph = (by1 - by0) * self.roi_pad
+        x0 = max(0, int(bx0 - pw))
+        y0 = max(0, int(by0 - ph))
+        x1 = min(w, int(bx1 + pw) + 1)
+        y1 = min(h, int(by1 + ph) + 1)
+        # 画面のほとんどを占めるなら切り出す意味が無い
+        if (x1 - x0) * (y1 - y0) >= 0.8 * w * h or x1 - x0 < 16 or y1 - y0 < 16:
+            self.roi = None
+        else:
+            self.roi = (x0, y0, x1, y1)
+
+    @staticmethod
+    def _to_full_frame(lms, roi, w, h):
+        # 切り出し画像基準の正規化座標を、全画面基準の正規化座標へ戻す
+        x0, y0, x1, y1 = roi
+        sx = (x1 - x0) / float(w)
+        sy = (y1 - y0) / float(h)
+        ox = x0 / float(w)
+        oy = y0 / float(h)
+        lms[:, 0] = lms[:, 0] * sx + ox
+        lms[:, 1] = lms[:, 1] * sy + oy
+        lms[:, 2] *= sx  # z は画像幅で正規化されている
+
+    def _process_mesh(self, rgb_image):
+        # FaceMesh を実行し、元画像基準のランドマークを返す（向きの変換は呼び出し側で行う）
+        if not self.roi_enabled:
+            res = self.face_mesh.process(rgb_image)
+            if not res.multi_face_landmarks:
+                return {'landmarks': None, 'has_face': False}
+            if self.max_faces > 1:
+                faces = [landmarks_to_array(f.landmark, out=buf)
+                         for f, buf in zip(res.multi_face_landmarks, self._face_bufs)]
+                return {'landmarks': faces[0], 'has_face': True, 'faces': faces}
+            # 最初の1人分のランドマークのみを使用
+            lms = landmarks_to_array(res.multi_face_landmarks[0].landmark, out=self._buf)
+            return {'landmarks': lms, 'has_face': True}
+
+        h, w = rgb_image.shape[:2]
+        used_roi = None
+        res = None
+        elapsed = 0.0
+        if self.roi is not None:
+            x0, y0, x1, y1 = self.roi
+            crop = np.ascontiguousarray(rgb_image[y0:y1, x0:x1])
+            res, elapsed = self._run(self.roi_mesh, crop)
+            if res.multi_face_landmarks:
+                used_roi = self.roi
+            else:
+                # 追跡が外れたら同じフレームを全画面で処理し直す
+                self.roi = None
+        if used_roi is None:
+            res, t_full = self._run(self.face_mesh, rgb_image)
+            elapsed += t_full
+            self.full_time = t_full if self.full_time is None else 0.9 * self.full_time + 0.1 * t_full
+        self.last_time = elapsed
+        self.last_speedup = (self.full_time / elapsed) if (self.full_time and elapsed > 0) else 1.0
+
         if not res.multi_face_landmarks:
-            return {'landmarks': None, 'has_face': False}
-        # 最初の1人分のランドマークのみを使用
-        lms = res.multi_face_landmarks[0].landmark
-        return {'landmarks': lms, 'has_face': True}
+            self.roi = None
+            return {'landmarks': None, 'has_face': False, 'roi': None,
+                    'proc_ms': elapsed * 1000.0, 'roi_speedup': self.last_speedup}
+        lms = landmarks_to_array(res.multi_face_landmarks[0].landmark, out=self._buf)
+        if used_roi is not None:
+            self._to_full_frame(lms, used_roi, w, h)
+        self._update_roi(lms, w, h)
+        return {'landmarks': lms, 'has_face': True, 'roi': used_roi,
+                'proc_ms': elapsed * 1000.0, 'roi_speedup': self.last_speedup}
+
+    def _orient(self, lms, w, h):
+        # ROI・追跡点は元画像の座標で持つので、向きの変換は最後に行う
+        if self.orientation is not None:
+            self.orientation.apply_landmarks(lms, w, h)
+        return lms
+
+    def process(self, rgb_image):
+        if self.presence_interval <= 0:
+            return self._process_frame(rgb_image)
+        if self._absent:
+            if not self._face_appeared(rgb_image):
+                self.absent_skipped += 1
+                return {'landmarks': None, 'has_face': False, 'absent': True}
+            # 顔らしきものが見つかったら FaceMesh に戻す（見つからなければ absent_after フレーム後に再び止める）
+            self._absent = False
+            self._miss_run = 0
+        fm = self._process_frame(rgb_image)
+        if fm['landmarks'] is not None:
+            self._miss_run = 0
+        else:
+            self._miss_run += 1
+            if self._miss_run >= self.absent_after:
+                self._absent = True
+                self._absent_frames = 0
+                self._motion_ref = None
+        return fm
+
+    def _face_appeared(self, rgb_image):
+        """FaceMesh を止めている間の軽い判定。顔が現れた（かもしれない）なら True"""
+        self._absent_frames += 1
+        if self._absent_frames % self.presence_interval:
+            return False
+        self.presence_checks += 1
+        if self.presence_mode != 'detector':
+            gray = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2GRAY)
+            small = cv2.resize(gray, (80, 60), interpolation=cv2.INTER_AREA)
+            ref, self._motion_ref = self._motion_ref, small
+            # 止めてから最初の判定は比較の基準を作るだけ
+            moved = ref is not None and float(cv2.absdiff(small, ref).mean()) > self.motion_thresh
+            if self.presence_mode == 'motion':
+                return moved
+            # 動きの直後（着席の途中）は数回続けて検出器を使い、じっとしている人を見逃さないよう
+            # 動きが無くても presence_recheck 回に1回は検出器で確かめる
+            self._quiet_checks = 0 if (moved or ref is None) else self._quiet_checks + 1
+            if self._quiet_checks >= 3 and self._quiet_checks % self.presence_recheck:
+                return False
+        return self._detect_face(rgb_image)
+
+    def _detect_face(self, rgb_image):
+        # 短距離の検出器の入力は 128x128 なので、縮小してから渡して変換の負荷を減らす
+        h, w = rgb_image.shape[:2]
+        if w > 320:
+            rgb_image = cv2.resize(rgb_image, (320, max(1, h * 320 // w)), interpolation=cv2.INTER_AREA)
+        self.detector_calls += 1
+        return bool(self.face_detector.process(rgb_image).detections)
+
+    def _process_frame(self, rgb_image):
+        h, w = rgb_image.shape[:2]
+        if self.keyframe_interval <= 1:
+            fm = self._process_mesh(rgb_image)
+            for lms in fm.get('faces') or ([fm['landmarks']] if fm['landmarks'] is not None else []):
+                self._orient(lms, w, h)
+            return fm
+
+        self.frames += 1
+        gray = cv2.cvtColor(rgb_image, cv2.COLOR_RGB2GRAY)
+        if self._key_arr is not None and not self._force_key and self._since_key < self.keyframe_interval:
+            arr = self._track(gray, w, h)
+            if arr is not None:
+                self._since_key += 1
+                lms = self._orient(arr.copy(), w, h)
+                return {'landmarks': lms, 'has_face': True, 'keyframe': False,
+                        'track_error': self.last_track_error}
+        return self._keyframe(rgb_image, gray, w, h)
+
+    def _keyframe(self, rgb_image, gray, w, h):
+        self.mesh_calls += 1
+        fm = self._process_mesh(rgb_image)
+        fm['keyframe'] = True
+        if fm['landmarks'] is None:
+            self._key_arr = None
+            self._force_key = False
+            return fm
+        # 内部バッファは次のキーフレームで上書きされるので、追跡の基準として複製しておく
+        arr = fm['landmarks'].copy()
+        self._key_arr = arr
+        self._prev_gray = gray
+        self._track_idx = [i for i in TRACK_INDICES if i < len(arr)]
+        self._prev_pts = (arr[self._track_idx, :2] * (w, h)).astype(np.float32).reshape(-1, 1, 2)
+        self._since_key = 1
+        ear = _mean_ear(arr)
+        self._key_ear = ear
+        # 目を閉じかけ・閉じている間は毎フレーム FaceMesh を使い、瞬目の判定を追跡誤差に左右させない
+        closing = self._open_ear is not None and ear < self.blink_drop_ratio * self._open_ear
+        if not closing:
+            self._open_ear = ear if self._open_ear is None else 0.9 * self._open_ear + 0.1 * ear
+        self._force_key = closing
+        fm['landmarks'] = self._orient(arr.copy(), w, h)
+        return fm
+
+    def _track(self, gray, w, h):
+        """前フレームから目と虹彩の点を追跡したランドマーク配列を返す（追跡できなければ None）"""
+        pts, st, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, self._prev_pts, None, **_LK_PARAMS)
+        if pts is None or not st.all():
+            return None
+        # 逆方向にも追跡し、元の位置に戻らない点があれば追跡が崩れたとみなす
+        back, st_back, _ = cv2.calcOpticalFlowPyrLK(gray, self._prev_gray, pts, None, **_LK_PARAMS)
+        if back is None or not st_back.all():
+            return None
+        err = float(np.abs(back - self._prev_pts).reshape(-1, 2).max())
+        self.last_track_error = err
+        if err > self.track_max_error:
+            return None
+        new_xy = pts.reshape(-1, 2) / (w, h)
+        arr = self._key_arr.copy()
+        # 追跡していない点は目の点の移動量（中央値）だけ平行移動しておく（表示用の近似）
+        shift = np.median(new_xy - arr[self._track_idx, :2], axis=0)
+        arr[:, :2] += shift
+        arr[self._track_idx, :2] = new_xy
+        # 瞬目が始まったら、このフレームから FaceMesh に切り替える
+        if self._key_ear is not None and _mean_ear(arr) < self.blink_drop_ratio * self._key_ear:
+            return None
+        self._key_arr = arr
+        self._prev_gray = gray
+        self._prev_pts = pts
+        return arr
+
+    def warm_up(self, width=640, height=480):
+        """ダミーフレームを1回処理して FaceMesh のグラフを初期化しておく（追跡の状態・集計は変えない）"""
+        dummy = np.zeros((height, width, 3), dtype=np.uint8)
+        for mesh in (self.face_mesh, self.roi_mesh, self.face_detector):
+            if mesh is not None:
+                mesh.process(dummy)
+
+    def close(self):
+        """FaceMesh・顔検出のグラフを解放する"""
+        for mesh in (self.face_mesh, self.roi_mesh, self.face_detector):
+            if mesh is not None:
+                mesh.close()
+
+    def mesh_ratio(self):
+        """キーフレームモードで FaceMesh を実行したフレームの割合"""
+        return self.mesh_calls / float(self.frames) if self.frames else 1.0
+
+
+# MediaPipe Tasks の FaceLandmarker のモデル（https://developers.google.com/mediapipe/solutions/vision/face_landmarker から取得）
+DEFAULT_FACE_MODEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models', 'face_landmarker.task')
+FACE_MODEL_URL = 'https://storage.googleapis.com/mediapipe-models/face_landmarker/face_landmarker/float16/1/face_landmarker.task'
+
+
+def missing_face_model(model_path):
+    """FaceLandmarker のモデルが無ければ、ダウンロード方法を含むメッセージを返す（あれば None）"""
+    if model_path and os.path.isfile(model_path):
+        return None
+    return (f"FaceLandmarker model not found: {model_path}\n"
+            f"  Download it with: mkdir -p models && curl -L -o models/face_landmarker.task {FACE_MODEL_URL}")
+
+
+def limit_threads(num_threads):
+    """OpenCV の画像処理に使うスレッド数の上限を設定する
+
+    Tasks / solutions の Python API には推論スレッド数の指定が無いため、抑えられるのは OpenCV 側だけです。
+    プロセス全体をコアに固定（sched_setaffinity）すると、取得・録画のスレッドや --face-workers の
+    子プロセスまで同じコアに押し込められ、GUI では次の計測にも残るため行いません。
+    """
+    if not num_threads or num_threads <= 0:
+        return
+    cv2.setNumThreads(int(num_threads))
+
+
+class FaceLandmarkerProcessor:
+    """MediaPipe Tasks の FaceLandmarker（LIVE_STREAM モード）で顔ランドマークを求める
+
+    process() はフレームを非同期の推論に渡してすぐ戻り、その時点で届いている最新の結果を返します。
+    推論は MediaPipe 内部のスレッドで進むので、次のフレームの取得や描画と重なります。
+    結果は前のフレームのものになることがあり、'result_ts' に元フレームのタイムスタンプ（ミリ秒）、
+    'fresh' に前回の process() 以降に届いた結果かどうかを入れます（推論が追いつかない間は
+    同じ結果が続くので、'fresh' が False のフレームは特徴量を更新しないこと）。
+    MediaPipe は渡したフレームを全て順に処理するため、推論中のフレームが max_in_flight 枚あるときは
+    新しいフレームを渡さずに捨てます（推論が追いつかないときに遅延が積み上がらないように）。
+
+    wait_ms を指定すると、新しい結果が無いときに最大その時間だけ待ちます。
+    max_faces が 2 以上のときは FaceProcessor と同じく 'faces' に全員分の配列を入れます。
+    """
+
+    def __init__(self, model_path=DEFAULT_FACE_MODEL, max_faces=1, orientation=None, wait_ms=0.0, max_in_flight=1):
+        missing = missing_face_model(model_path)
+        if missing:
+            raise FileNotFoundError(missing)
+        from mediapipe.tasks.python import BaseOptions
+        from mediapipe.tasks.python.vision import FaceLandmarker, FaceLandmarkerOptions, RunningMode
+        self.orientation = orientation
+        self.max_faces = max(1, int(max_faces))
+        self.wait_ms = wait_ms
+        self.max_in_flight = max(1, int(max_in_flight))
+        self._cond = threading.Condition()
+        self._latest = None  # (タイムスタンプ, 顔ごとのランドマーク配列のリストまたは None, 届いた時刻)
+        self._returned_ts = -1
+        self._last_ts = -1
+        self._sent = {}  # 推論中のフレーム: タイムスタンプ → 渡した時刻（遅延の計測にも使う）
+        self.submitted = 0
+        self.skipped = 0  # 推論が追いつかず渡さなかったフレーム
+        self.results = 0
+        self.latency_ms = None  # 渡してから結果が届くまで（EWMA）
+        options = FaceLandmarkerOptions(
+            base_options=BaseOptions(model_asset_path=model_path),
+            running_mode=RunningMode.LIVE_STREAM,
+            num_faces=max_faces,
+            min_face_detection_confidence=0.5,
+            min_face_presence_confidence=0.5,
+            min_tracking_confidence=0.5,
+            result_callback=self._on_result,
+        )
+        self.landmarker = FaceLandmarker.create_from_options(options)
+
+    def _on_result(self, result, image, timestamp_ms):
+        # MediaPipe の推論スレッドから呼ばれる
+        now = time.perf_counter()
+        lms = None
+        if result.face_landmarks:
+            # 複数人のときは全員分（先頭が 'landmarks'）、1人なら最初の顔のみ
+            faces = result.face_landmarks if self.max_faces > 1 else result.face_landmarks[:1]
+            lms = [landmarks_to_array(f) for f in faces]
+        with self._cond:
+            sent = self._sent.pop(timestamp_ms, None)
+            # これより古いフレームは捨てられているので、遅延の記録も消す
+            for ts in [t for t in self._sent if t < timestamp_ms]:
+                del self._sent[ts]
+            if sent is not None:
+                lat = (now - sent) * 1000.0
+                self.latency_ms = lat if self.latency_ms is None else 0.9 * self.latency_ms + 0.1 * lat
+            self.results += 1
+            self._latest = (timestamp_ms, lms, now)
+            self._cond.notify_all()
+
+    def process(self, rgb_image, timestamp_ms=None):
+        h, w = rgb_image.shape[:2]
+        # LIVE_STREAM のタイムスタンプは単調増加でなければならない
+        ts = int(time.monotonic() * 1000) if timestamp_ms is None else int(timestamp_ms)
+        if ts <= self._last_ts:
+            ts = self._last_ts + 1
+        self._last_ts = ts
+        with self._cond:
+            busy = len(self._sent) >= self.max_in_flight
+            if not busy:
+                self._sent[ts] = time.perf_counter()
+        if busy:
+            self.skipped += 1
+        else:
+            image = mp.Image(image_format=mp.ImageFormat.SRGB, data=np.ascontiguousarray(rgb_image))
+            self.submitted += 1
+            self.landmarker.detect_async(image, ts)
+
+        with self._cond:
+            if self.wait_ms > 0 and (self._latest is None or self._latest[0] <= self._returned_ts):
+                self._cond.wait_for(lambda: self._latest is not None and self._latest[0] > self._returned_ts,
+                                    timeout=self.wait_ms / 1000.0)
+            latest = self._latest
+        if latest is None:
+            return {'landmarks': None, 'has_face': False, 'fresh': False, 'result_ts': None}
+        result_ts, lms, _ = latest
+        fresh = result_ts > self._returned_ts
+        self._returned_ts = result_ts
+        faces = None
+        if lms is not None:
+            # 結果の配列は次の process() でも返すことがあるので、変換は複製に対して行う
+            faces = [f.copy() for f in lms]
+            if self.orientation is not None:
+                for f in faces:
+                    self.orientation.apply_landmarks(f, w, h)
+        fm = {'landmarks': faces[0] if faces else None, 'has_face': faces is not None, 'fresh': fresh,
+              'result_ts': result_ts, 'result_age_ms': float(ts - result_ts)}
+        if self.max_faces > 1:
+            fm['faces'] = faces
+        return fm
+
+    def get_stats(self):
+        return {
+            'landmarker_submitted': self.submitted,
+            'landmarker_results': self.results,
+            'landmarker_skipped': self.skipped,
+            'landmarker_pending': len(self._sent),
+            'landmarker_latency_ms': self.latency_ms or 0.0,
+        }
+
+    def close(self):
+        self.landmarker.close()
@@ -0,0 +1,185 @@
+"""
+複数人の顔を追跡し、顔ごとに瞬目・視線・スコアの状態を持つ
+1台のカメラで複数の席（自習室など）を見る場合に使う
+
+フレームごとの顔（ランドマーク配列）を、前フレームの顔の中心に近い順に対応付けて
+追跡 ID を割り当てます。顔ごとの BlinkDetector / GazeEstimator / FusionScorer は
+プールから貸し出し、顔を見失った追跡が終わるとプールに戻して次の顔で使い回します。
+"""
+import numpy as np
+
+from features.blink import BlinkDetector
+from features.gaze import GazeEstimator
+from fusion import FusionScorer
+from temporal import REF_FPS
+
+
+class FaceTrack:
+    """1人分の追跡状態と、その顔専用の検出器・スコア"""
+
+    def __init__(self):
+        self.blink = BlinkDetector()
+        self.gaze = GazeEstimator()
+        self.fusion = FusionScorer()
+        self.track_id = None
+        self.center = None  # 顔の中心（正規化座標）
+        self.missed = 0  # 連続して見つからなかったフレーム数
+        self.last_seen_ts = None  # 最後に見つかったフレームの時刻（秒）
+        self.visible = False
+        self.feats = None
+        self.score = 0.0
+        self.last_alert_time = 0.0
+
+    def reset(self, track_id, center):
+        # 検出器は作り直さず、計測中の状態だけを初期値に戻して使い回す
+        self.blink.reset()
+        self.gaze.reset()
+        self.fusion.reset()
+        self.track_id = track_id
+        self.center = center
+        self.missed = 0
+        self.last_seen_ts = None
+        self.visible = True
+        self.feats = None
+        self.score = 0.0
+        self.last_alert_time = 0.0
+
+    def update(self, landmarks, perso=None, ts=None):
+        """ランドマーク（見失ったフレームは None）で特徴量とスコアを更新する。ts はフレームの時刻（秒）"""
+        if landmarks is not None:
+            feats = {'blink': self.blink.update(landmarks, ts), 'gaze': self.gaze.update(landmarks, ts)}
+        else:
+            feats = {'blink': self.blink.miss(ts), 'gaze': self.gaze.miss(ts)}
+        self.feats = feats
+        self.score = self.fusion.update(feats, perso, ts)
+        return feats, self.score
+
+
+class DetectorPool:
+    """FaceTrack を size 個確保しておき、追跡の開始・終了に合わせて貸し出す・返却する
+
+    setup(track) を渡すと、貸し出すたびに初期化後の検出器・スコア（track.blink / gaze / fusion）へ
+    設定（しきい値や個人化の基準値など）を反映します。空きが無いときは新しく作ります。
+    """
+
+    def __init__(self, size, setup=None):
+        self._free = [FaceTrack() for _ in range(max(1, int(size)))]
+        self.setup = setup
+        self.created = len(self._free)
+
+    def acquire(self, track_id, center):
+        if self._free:
+            track = self._free.pop()
+        else:
+            track = FaceTrack()
+            self.created += 1
+        track.reset(track_id, center)
+        if self.setup is not None:
+            self.setup(track)
+        return track
+
+    def release(self, track):
+        track.visible = False
+        self._free.append(track)
+
+
+class FaceTracker:
+    """顔の中心の近さで追跡 ID を対応付ける
+
+    match_dist: 前フレームの顔と同じ人とみなす中心間の距離（画面の幅・高さに対する割合）
+    max_missed_sec: この秒数より長く見つからなかった追跡は終了する（席を離れた扱い）。
+        フレームの時刻（update の ts）で測るので、fps が下がっても同じ時間で終わる。
+        ts を渡さない場合は 30fps で1フレーム進んだものとして数える
+    """
+
+    def __init__(self, max_faces=4, setup=None, match_dist=0.15, max_missed_sec=0.5):
+        self.max_faces = max(1, int(max_faces))
+        self.pool = DetectorPool(self.max_faces, setup)
+        self.match_dist = match_dist
+        self.max_missed_sec = max_missed_sec
+        self.tracks = []  # 追跡中の顔（ID 順）
+        self._next_id = 1
+        self._events = []
+
+    @staticmethod
+    def _center(lms):
+        return lms[:, :2].mean(axis=0)
+
+    def update(self, faces, perso=None, ts=None):
+        """このフレームの顔（ランドマーク配列のリスト）で追跡と顔ごとの状態を更新し、追跡中の顔を返す"""
+        centers = [self._center(f) for f in faces]
+        # 全ての組の距離を近い順に見て、まだ使われていない追跡と顔を対応付ける
+        assigned = {}
+        if self.tracks and centers:
+            prev = np.array([t.center for t in self.tracks])
+            cur = np.array(centers)
+            dist = np.linalg.norm(prev[:, None, :] - cur[None, :, :], axis=2)
+            used_faces = set()
+            for k in np.argsort(dist, axis=None):
+                ti, fi = divmod(int(k), len(centers))
+                if dist[ti, fi] > self.match_dist:
+                    break
+                if ti in assigned or fi in used_faces:
+                    continue
+                assigned[ti] = fi
+                used_faces.add(fi)
+        matched_faces = set(assigned.values())
+
+        ended = []
+        for ti, track in enumerate(self.tracks):
+            fi = assigned.get(ti)
+            if fi is None:
+                track.missed += 1
+                track.visible = False
+                if ts is not None and track.last_seen_ts is not None:
+                    missed_sec = ts - track.last_seen_ts
+                else:
+                    missed_sec = track.missed / REF_FPS
+                if missed_sec > self.max_missed_sec + 1e-6:
+                    ended.append(track)
+                    continue
+                track.update(None, perso, ts)
+            else:
+                track.missed = 0
+                track.last_seen_ts = ts
+                track.visible = True
+                track.center = centers[fi]
+                track.update(faces[fi], perso, ts)
+        for track in ended:
+            self.tracks.remove(track)
+            self._events.append(('face_track_end', f'face={track.track_id}'))
+            self.pool.release(track)
+
+        for fi, face in enumerate(faces):
+            if fi in matched_faces:
+                continue
+            track = self.pool.acquire(self._next_id, centers[fi])
+            self._next_id += 1
+            track.last_seen_ts = ts
+            track.update(face, perso, ts)
+            self.tracks.append(track)
+            self._events.append(('face_track_start', f'face={track.track_id}'))
+        return self.tracks
+
+    def visible_tracks(self):
+        return [t for t in self.tracks if t.visible]
+
+    def primary(self):
+        """表示・個人化に使う代表の顔（見えている中で最も古い追跡）。いなければ None"""
+        for track in self.tracks:
+            if track.visible:
+                return track
+        return None
+
+    def pop_events(self):
+        """追跡の開始・終了のイベント（イベント名, 詳細）を取り出す"""
+        events, self._events = self._events, []
+        return events
+
+
+def frame_faces(fm):
+    """FaceProcessor などの結果から、顔ごとのランドマーク配列のリストを取り出す"""
+    if fm is None or fm.get('landmarks') is None:
+        return []
+    faces = fm.get('faces')
+    return faces if faces is not None else [fm['landmarks']]
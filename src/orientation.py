@@ -0,0 +1,95 @@
+"""
+画像の向き（回転・反転）を1回の変換にまとめて適用する
+回転と左右・上下反転の組み合わせは 8 通りしかないため、事前に1つの操作に畳み込んでおき、
+フレームごとには1パスで変換する。画素を動かさずランドマーク座標だけを変換することもできる
+"""
+import cv2
+import numpy as np
+
+
+class Orientation:
+    """rotate（時計回り, 度）→ flip_h → flip_v の順に適用した結果と同じ向きにする変換
+
+    内部では「転置するか・x を反転するか・y を反転するか」の3つのフラグに畳み込みます。
+    apply() の dst に前回の出力を渡すと、その配列に書き込んで確保を省きます
+    （返したフレームを後段が保持し続ける場合は dst を使い回さないこと）。
+    """
+
+    def __init__(self, rotate=0, flip_h=False, flip_v=False):
+        if rotate not in (0, 90, 180, 270):
+            raise ValueError(f"rotate must be 0, 90, 180 or 270: {rotate}")
+        self.rotate = rotate
+        self.flip_h = flip_h
+        self.flip_v = flip_v
+        # 回転を「転置 + 反転」で表す（90: 転置→x反転, 180: x・y反転, 270: 転置→y反転）
+        transpose = rotate in (90, 270)
+        fx = rotate in (90, 180)
+        fy = rotate in (180, 270)
+        # 回転後の左右・上下反転を重ねる
+        self.transpose = transpose
+        self.fx = fx != bool(flip_h)
+        self.fy = fy != bool(flip_v)
+        self._op = self._select_op()
+
+    @property
+    def identity(self):
+        return not (self.transpose or self.fx or self.fy)
+
+    def _select_op(self):
+        t, fx, fy = self.transpose, self.fx, self.fy
+        if not t:
+            if fx and fy:
+                return lambda src, dst: cv2.flip(src, -1, dst=dst)
+            if fx:
+                return lambda src, dst: cv2.flip(src, 1, dst=dst)
+            if fy:
+                return lambda src, dst: cv2.flip(src, 0, dst=dst)
+            return None
+        if fx and not fy:
+            return lambda src, dst: cv2.rotate(src, cv2.ROTATE_90_CLOCKWISE, dst=dst)
+        if fy and not fx:
+            return lambda src, dst: cv2.rotate(src, cv2.ROTATE_90_COUNTERCLOCKWISE, dst=dst)
+        if not fx and not fy:
+            return lambda src, dst: cv2.transpose(src, dst=dst)
+        # 反対角線での転置は OpenCV に1パスの関数が無いので、numpy のビューから1回コピーする
+        return self._anti_transpose
+
+    @staticmethod
+    def _anti_transpose(src, dst):
+        view = src.swapaxes(0, 1)[::-1, ::-1]
+        if dst is None:
+            return np.ascontiguousarray(view)
+        np.copyto(dst, view)
+        return dst
+
+    def output_size(self, width, height):
+        """入力 (幅, 高さ) に対する出力の (幅, 高さ)"""
+        return (height, width) if self.transpose else (width, height)
+
+    def apply(self, frame, dst=None):
+        """向きを変換したフレームを返す（恒等変換なら frame をそのまま返す）"""
+        if self._op is None:
+            return frame
+        if dst is not None:
+            h, w = frame.shape[:2]
+            oh, ow = (w, h) if self.transpose else (h, w)
+            if dst.shape != (oh, ow) + frame.shape[2:] or dst.dtype != frame.dtype:
+                dst = None
+        return self._op(frame, dst)
+
+    def apply_landmarks(self, arr, width=None, height=None):
+        """元画像基準の正規化ランドマーク（(N, 3) 配列）を、向きを変換した画像基準の座標へその場で書き換える
+
+        z は画像の幅で正規化されているため、転置する場合は width/height で縮尺を合わせます。
+        """
+        if self.identity:
+            return arr
+        if self.transpose:
+            arr[:, [0, 1]] = arr[:, [1, 0]]
+            if width and height:
+                arr[:, 2] *= width / float(height)
+        if self.fx:
+            arr[:, 0] = 1.0 - arr[:, 0]
+        if self.fy:
+            arr[:, 1] = 1.0 - arr[:, 1]
+        return arr
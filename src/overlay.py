@@ -3,11 +3,32 @@ import numpy as np
 
 class Overlay:
     def __init__(self):
-        pass
+        self._preview = None  # landmark_preview() の描画先（使い回す）
 
-    def draw(self, frame, feats, score, alert, fps, status=None, show_alert_text=True, cam_status=None, landscape_mode=False, is_recording=False, block_id=None):
-        vis = frame.copy()
-        h, w = vis.shape[:2]
+    def landmark_preview(self, landmarks, size):
+        """ランドマークの点だけを描いた RGB 画像を返す（backend=landmarks で画素が届かない場合の表示用）"""
+        w, h = size
+        canvas = self._preview
+        if canvas is None or canvas.shape[:2] != (h, w):
+            canvas = np.empty((h, w, 3), dtype=np.uint8)
+            self._preview = canvas
+        canvas.fill(20)
+        if landmarks is not None:
+            pts = landmarks[:, :2] * (w, h)
+            xs = np.clip(pts[:, 0].astype(np.int32), 0, w - 1)
+            ys = np.clip(pts[:, 1].astype(np.int32), 0, h - 1)
+            canvas[ys, xs] = (120, 255, 120)
+        return canvas
+
+    def draw(self, frame, feats, score, alert, fps, status=None, show_alert_text=True, cam_status=None, landscape_mode=False, is_recording=False, block_id=None,
+             color_order='bgr', orientation=None):
+        # color_order='rgb' のフレームは、表示用の BGR をここで初めて作る（描画先の複製を兼ねる）
+        # orientation: カメラが画素の向きを変えていない場合の変換（表示用の画像にだけ適用する）
+        if orientation is not None and orientation.identity:
+            orientation = None
+        h, w = frame.shape[:2]
+        if orientation is not None:
+            w, h = orientation.output_size(w, h)
         
         if landscape_mode:
             # --- 横長画面（480x320）向け最適化 ---
@@ -18,13 +39,21 @@ class Overlay:
             cam_w_max = w - panel_w - 15  # 15pxはマージン
             cam_h_max = h
             
-            frame_h, frame_w = frame.shape[:2]
+            frame_h, frame_w = h, w
             # カメラ映像を cam_w_max x cam_h_max に収まるようにリサイズ
             scale = min(cam_w_max / frame_w, cam_h_max / frame_h)
             cam_w = int(frame_w * scale)
             cam_h = int(frame_h * scale)
             
-            frame_resized = cv2.resize(frame, (cam_w, cam_h), interpolation=cv2.INTER_LINEAR)
+            if orientation is not None:
+                # 縮小してから向きを変える（変換する画素数を減らす）
+                src_w, src_h = orientation.output_size(cam_w, cam_h)
+                frame_resized = orientation.apply(cv2.resize(frame, (src_w, src_h), interpolation=cv2.INTER_LINEAR))
+            else:
+                frame_resized = cv2.resize(frame, (cam_w, cam_h), interpolation=cv2.INTER_LINEAR)
+            if color_order == 'rgb':
+                # 縮小後の小さい画像だけを BGR に変換
+                cv2.cvtColor(frame_resized, cv2.COLOR_RGB2BGR, dst=frame_resized)
             
             # 背景作成（真っ黒）
             vis = np.zeros((h, w, 3), dtype=np.uint8)
@@ -40,6 +69,15 @@ class Overlay:
             panel_h = info_panel_h
         else:
             # 縦長モードは現状維持
+            if orientation is not None:
+                # 向きの変換で新しい画像になるので、色の並び替えはその場で行う
+                vis = orientation.apply(frame)
+                if color_order == 'rgb':
+                    cv2.cvtColor(vis, cv2.COLOR_RGB2BGR, dst=vis)
+            elif color_order == 'rgb':
+                vis = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+            else:
+                vis = frame.copy()
             panel_w = min(300, w - 20)
             panel_h = 140
             panel_x = 10
@@ -100,8 +138,15 @@ class Overlay:
             cam_ok = cam_status.get('connected', False) and cam_status.get('frame_ok', False)
             cam_color = (0, 255, 0) if cam_ok else (0, 0, 255)
             cam_text = f"Cam: {'OK' if cam_ok else 'NG'}"
+            if cam_status.get('reconnecting'):
+                cam_text = f"Cam: RECONNECTING ({cam_status.get('downtime_sec', 0):.0f}s)"
             if cam_ok:
                 cam_text += f" ({cam_status.get('fps', 0):.1f}fps)"
+                if cam_status.get('dropped_frames'):
+                    cam_text += f" drop:{cam_status['dropped_frames']}"
+                if cam_status.get('latency_ms') is not None:
+                    # 取得から処理開始まで / 判定までの時間
+                    cam_text += f" {cam_status.get('frame_age_ms', 0):.0f}/{cam_status['latency_ms']:.0f}ms"
             put(cam_text, cam_color)
         
         # 検出状態
@@ -110,8 +155,15 @@ class Overlay:
             iris_ok = feats['gaze'].get('has_iris', False)
             face_color = (0, 255, 0) if face_ok else (0, 0, 255)
             iris_color = (0, 255, 0) if iris_ok else (0, 0, 255)
-            put(f"Face: {'OK' if face_ok else 'NO'} | Iris: {'OK' if iris_ok else 'NO'}", 
-                (255, 255, 255) if (face_ok and iris_ok) else (0, 0, 255))
+            face_text = f"Face: {'OK' if face_ok else 'NO'} | Iris: {'OK' if iris_ok else 'NO'}"
+            if status.get('roi_speedup'):
+                face_text += f" ROI x{status['roi_speedup']:.1f}"
+            if status.get('faces') is not None:
+                face_text += f" ({status['faces']} faces)"
+            put(face_text, (255, 255, 255) if (face_ok and iris_ok) else (0, 0, 255))
+            if status.get('idle'):
+                # 不在時の省電力中（取得・描画の頻度を下げている）
+                put("Idle: no face (low power)", (160, 160, 160))
         
         # まばたき情報（簡潔に）
         b = feats['blink']
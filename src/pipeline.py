@@ -0,0 +1,305 @@
+"""
+計測ループの1フレーム分の処理（取得 → 顔ランドマーク → 特徴量・スコア → 省電力・取得設定 → ログ）
+app.py（CLI 版）と app_gui.py（GUI 版）で共通に使い、表示とキー・タッチ操作は呼び出し側で行う
+"""
+import time
+
+import cv2
+import numpy as np
+
+from multi_face import frame_faces
+
+
+class FramePipeline:
+    """カメラ1台分の計測ループの状態を持ち、step() で1フレームを処理する
+
+    顔ランドマークは face（FaceProcessor / FaceLandmarkerProcessor）か、別プロセスの face_pool
+    （face_worker.FaceWorkerPool）で求めます。ワーカーが落ちたときは face_factory() で作った
+    FaceProcessor に切り替えます。tracker（multi_face.FaceTracker）を渡すと複数人モードになり、
+    idle（idle.IdleController）・governor（governor.CaptureGovernor）を渡すと取得設定を切り替えます。
+    """
+
+    def __init__(self, cam, blink, gaze, fusion, perso, face=None, face_pool=None, face_factory=None,
+                 landmark_mode=False, tracker=None, idle=None, governor=None, phase='eval',
+                 learning_enabled=False, alert_enabled=True, cooldown_sec=60.0, overlay=None):
+        self.cam = cam
+        self.blink = blink
+        self.gaze = gaze
+        self.fusion = fusion
+        self.perso = perso
+        self.face = face
+        self.face_pool = face_pool
+        self.face_factory = face_factory
+        self.landmark_mode = landmark_mode
+        self.tracker = tracker
+        self.idle = idle
+        self.governor = governor
+        self.phase = phase
+        self.learning_enabled = learning_enabled
+        self.alert_enabled = alert_enabled
+        self.cooldown_sec = cooldown_sec
+        # landmarks バックエンドで、点だけを描いた表示用の画像を作る overlay.Overlay（None なら作らない）
+        self.overlay = overlay
+
+        self.last_alert_time = 0.0
+        self.last_feats = None  # 直前のフレームの特徴量
+        self.last_has_face = False  # 直前に処理したフレームで顔があったか
+        self.last_loop_ts = 0.0
+        self.frame_failure_count = 0
+        self.max_failures = 30  # 約1秒間（30fps想定）連続で失敗したら警告
+        self.reconnect_ui_interval = 0.2  # 再接続中は 5fps 程度で表示だけを更新する
+        self.error_frames = {}  # エラー表示用のダミーフレーム（毎回作り直さないよう文言と解像度ごとに保持）
+        # 処理性能の集計（--headless の再生ベンチマーク用）
+        self.bench_frames = 0
+        self.bench_proc_sec = 0.0
+
+    def _error_frame(self, cam_status_dict):
+        err_text = "Reconnecting..." if cam_status_dict.get('reconnecting', False) else "Camera Error"
+        # 取得解像度は途中で変わる（--governor・省電力）ので、今の解像度で作る
+        key = (err_text, self.cam.width, self.cam.height)
+        if key not in self.error_frames:
+            w, h = self.cam.width, self.cam.height
+            err = np.zeros((h, w, 3), dtype=np.uint8)
+            # フレームは RGB 順で扱うため、赤は (255, 0, 0)
+            cv2.putText(err, err_text, (50, h // 2), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2)
+            self.error_frames[key] = err
+        return self.error_frames[key]
+
+    def step(self, logger=None, recorder=None, block_id=None):
+        """1フレームを取得・処理してログに書き、表示に使う結果を辞書で返す
+
+        再生が末尾に達した（またはワーカーが落ちて残りを処理できない）ときは None を返します。
+        別プロセスの処理結果がまだ無いフレームも、表示・キー操作・イベントの処理が止まらないよう結果を返します
+        （'pending' が True。特徴量は前回のものを使い、ログ・録画・省電力と取得設定の判定は行いません）。
+        """
+        cam = self.cam
+        idle = self.idle
+        tracker = self.tracker
+        if idle is not None and idle.idle:
+            # カメラの fps を変えられないバックエンド（zmq など）でも、ループ自体を間引いて負荷を下げる
+            wait = idle.interval - (time.time() - self.last_loop_ts)
+            if wait > 0:
+                time.sleep(wait)
+        ok, frame = cam.read()
+        cam_status_dict = cam.get_status()
+        draining = False
+        if not ok and cam_status_dict.get('eof', False):
+            # 再生が末尾に達したら終了（別プロセスで処理中のフレームがあれば、その結果を反映してから）
+            if self.face_pool is None or self.face_pool.in_flight == 0:
+                return None
+            ok = draining = True
+        if not ok and cam_status_dict.get('reconnecting', False):
+            # 再接続中は UI を低いレートで回して CPU を使いすぎないようにする
+            wait = self.reconnect_ui_interval - (time.time() - self.last_loop_ts)
+            if wait > 0:
+                time.sleep(wait)
+        self.last_loop_ts = time.time()
+        if not ok:
+            self.frame_failure_count += 1
+            if self.frame_failure_count >= self.max_failures and not cam_status_dict.get('reconnecting', False):
+                print(f"Warning: Camera frame read failed {self.frame_failure_count} times consecutively.")
+                # 完全に停止せず、エラー表示を続ける
+            # エラー時も空のフレームで処理を続行（UIでエラー表示）
+            if frame is None:
+                frame = self._error_frame(cam_status_dict)
+        else:
+            self.frame_failure_count = 0
+        # カメラ側の取得時刻（フレームの経過時間・遅延の計算に使う）
+        capture_ts = cam.last_capture_ts if ok else None
+        t0 = time.time()
+        fm = None
+        pending = False
+        if self.face_pool is not None and ok:
+            # 処理中のフレームが depth 枚たまるまでは渡すだけ。たまったら最も古いフレームの結果を待つ
+            try:
+                if not draining:
+                    self.face_pool.submit(frame, (frame, capture_ts, t0))
+                done = self.face_pool.get(block=draining or self.face_pool.full())
+            except RuntimeError as e:
+                # ワーカーが落ちたら、以降はメインループ内で処理する
+                print(f"Warning: {e}; processing in the main loop")
+                self.face_pool.close()
+                self.face_pool = None
+                self.face = self.face_factory()
+                if draining:
+                    return None
+                done = ((frame, capture_ts, t0), None)
+            if done is None:
+                # まだ結果が無い。取得したフレームを表示し、前回の特徴量を使う（非同期推論の 'fresh' と同じ扱い）
+                pending = True
+                fm = {'landmarks': None, 'has_face': self.last_has_face, 'fresh': False}
+            else:
+                (frame, capture_ts, t0), fm = done
+        try:
+            if self.landmark_mode:
+                # frame はランドマーク（顔が無ければ None）。FaceMesh は送信側で実行済み
+                fm = {'landmarks': frame, 'has_face': frame is not None} if ok else None
+            elif fm is None and self.face_pool is None:
+                # カメラが RGB 順で返すので、変換せずそのまま FaceMesh に渡す
+                # 取得に失敗したダミーフレームは処理しない
+                fm = self.face.process(frame) if ok else None
+        except Exception as e:
+            print(f"Error processing frame: {e}")
+            fm = None
+        if self.landmark_mode and ok and self.overlay is not None:
+            # 表示用に、ランドマークの点だけを描いた画像を作る（顔が無い・処理に失敗したフレームは背景だけ）
+            lms = fm.get('landmarks') if fm is not None else None
+            frame = self.overlay.landmark_preview(lms, cam.impl.frame_size or (cam.width, cam.height))
+
+        feats = {}
+        status = {
+            'has_face': bool(fm and fm.get('has_face', False)),
+            'phase': self.phase,
+            'calibrating': self.perso.in_calibration() if self.phase == 'train' else False,
+            'roi_speedup': fm.get('roi_speedup') if (fm and fm.get('roi')) else None,
+        }
+        # 平滑化や閉眼の継続時間はフレームの時刻で進める（fps を下げても同じ時定数・時間になる）
+        frame_ts = capture_ts if capture_ts else t0
+        primary = None
+        if tracker is not None:
+            if fm is None or fm.get('fresh') is not False:
+                tracker.update(frame_faces(fm), self.perso, frame_ts)
+            primary = tracker.primary()
+            status['faces'] = len(tracker.visible_tracks())
+        if primary is not None:
+            feats.update(primary.feats)
+        elif fm is not None and fm.get('fresh') is False and self.last_feats is not None:
+            # 非同期推論（--face-backend tasks）の新しい結果がまだ無いフレームは、前回の特徴量をそのまま使う
+            feats.update(self.last_feats)
+        elif fm is not None and fm['landmarks'] is not None:
+            lms = fm['landmarks']
+            feats['blink'] = self.blink.update(lms, frame_ts)
+            feats['gaze'] = self.gaze.update(lms, frame_ts)
+        else:
+            feats['blink'] = self.blink.miss(frame_ts)
+            feats['gaze'] = self.gaze.miss(frame_ts)
+        self.last_feats = {'blink': feats['blink'], 'gaze': feats['gaze']}
+        if not pending:
+            self.last_has_face = status['has_face']
+
+        # まずスコアを更新し、アラート判定
+        now = time.time()
+        alert_ids = set()
+        if tracker is not None:
+            # 顔ごとにクールダウンを持ち、誰か1人でも該当すればアラート
+            score = primary.score if primary is not None else self.fusion.update(feats, self.perso, frame_ts)
+            for track in tracker.tracks:
+                if self.alert_enabled and track.visible and track.fusion.should_alert(
+                        track.score, now, track.last_alert_time, self.cooldown_sec):
+                    track.last_alert_time = now
+                    alert_ids.add(track.track_id)
+            alert = bool(alert_ids)
+        else:
+            score = self.fusion.update(feats, self.perso, frame_ts)
+            alert = (self.fusion.should_alert(score, now, self.last_alert_time, self.cooldown_sec)
+                     if self.alert_enabled else False)
+        if alert:
+            self.last_alert_time = now
+
+        # 次に、学習ONの場合のみパーソナライズを更新
+        if self.learning_enabled and not pending:
+            self.perso.update(feats, status=status, alert=alert)
+
+        fps = 1.0 / max(1e-3, (time.time() - t0))
+        # 結果待ちのフレームは、結果が届いたときに数える・判定する
+        counted = ok and not pending
+        if counted:
+            self.bench_frames += 1
+            self.bench_proc_sec += time.time() - t0
+        if idle is not None and counted:
+            idle.step(cam, status['has_face'], now, capture_ts)
+            status['idle'] = idle.idle
+        if self.governor is not None and counted and not (idle is not None and idle.idle):
+            level = self.governor.update(time.time() - t0, now)
+            if level is not None:
+                lw, lh, lfps = level
+                applied = cam.reconfigure(lw, lh, lfps)
+                info = f'level={self.governor.level} {lw}x{lh}@{lfps:g} applied={applied}'
+                print(f"Capture level changed: {info}")
+                if logger:
+                    logger.write_event('capture_level', info=info, block_id=block_id)
+
+        # 再接続・顔の追跡の開始と終了（席に着いた・離れた）・不在の開始と終了のイベントをログに残す
+        events = cam.pop_events()
+        if tracker is not None:
+            events += tracker.pop_events()
+        if idle is not None:
+            events += idle.pop_events()
+        for name, info in events:
+            if logger:
+                logger.write_event(name, info=info, block_id=block_id)
+        cam_status = {
+            'connected': cam_status_dict.get('connected', cam.impl is not None),
+            'frame_ok': ok,
+            'fps': fps,
+            'consecutive_failures': cam_status_dict.get('consecutive_failures', 0),
+            'reconnecting': cam_status_dict.get('reconnecting', False),
+            'downtime_sec': cam_status_dict.get('downtime_sec', 0.0),
+            'frame_age_ms': (t0 - capture_ts) * 1000.0 if capture_ts else None,
+            'latency_ms': (now - capture_ts) * 1000.0 if capture_ts else None,
+            'dropped_frames': (cam_status_dict.get('dropped_frames', 0) + cam_status_dict.get('zmq_skipped', 0)
+                               + cam_status_dict.get('shm_skipped', 0)),
+        }
+        if ok:
+            # 送信側（cam_proxy.py --adaptive）が JPEG 品質・縮小率を調整できるよう遅れを報告する
+            cam.report_latency(cam_status['latency_ms'], (now - t0) * 1000.0)
+
+        if logger and not pending:
+            if tracker is not None and tracker.tracks:
+                # 複数人モードでは追跡中の顔ごとに1行（face_id 列で区別）
+                row_ts = now
+                for track in tracker.tracks:
+                    row_ts = logger.write_frame(track.feats, track.score, track.track_id in alert_ids,
+                                                block_id=block_id, ts=now, capture_ts=capture_ts,
+                                                processed_ts=t0, face_id=track.track_id)
+            else:
+                row_ts = logger.write_frame(feats, score, alert, block_id=block_id,
+                                            capture_ts=capture_ts, processed_ts=t0)
+            if recorder is not None and ok:
+                recorder.submit(frame, capture_ts, log_ts=row_ts)
+
+        return {
+            'pending': pending,
+            'ok': ok,
+            'frame': frame,
+            'fm': fm,
+            'feats': feats,
+            'score': score,
+            'alert': alert,
+            'fps': fps,
+            'status': status,
+            'cam_status': cam_status,
+        }
+
+    def calibrate_center(self):
+        """視線の中心をキャリブレーション（複数人モードでは追跡中の全員）"""
+        self.gaze.calibrate_center()
+        if self.tracker is not None:
+            for track in self.tracker.tracks:
+                track.gaze.calibrate_center()
+
+    def reset_blink_counts(self):
+        """記録開始時に瞬目のカウントと閉眼の状態を初期化する（複数人モードでは追跡中の全員）"""
+        blinks = [self.blink] + ([t.blink for t in self.tracker.tracks] if self.tracker is not None else [])
+        for b in blinks:
+            b.blinks = 0
+            b.close_sec = 0.0
+            b.closed = False
+
+    def finish(self, logger=None, block_id=None):
+        """終了時の集計（省電力・ワーカー）を表示・記録し、ワーカーを止める"""
+        idle = self.idle
+        if idle is not None and idle.absences:
+            idle_stats = idle.get_stats()
+            wake = (f"wake-up {idle_stats['idle_wake_ms_mean']:.0f} ms mean / {idle_stats['idle_wake_ms_max']:.0f} ms max"
+                    if idle.wake_ms else "no wake-up")
+            print(f"Idle: {idle.absences} absences ({idle.camera_slowed} with camera fps lowered), "
+                  f"{idle_stats['idle_sec']:.1f}s idle, {wake}")
+            if logger:
+                logger.write_event('idle_stats', info=str(idle_stats), block_id=block_id)
+        if self.face_pool is not None:
+            pool_stats = self.face_pool.get_stats()
+            print(f"FaceMesh workers: {pool_stats['face_workers']} processes, "
+                  f"{pool_stats['face_worker_ms']:.1f} ms/frame in worker, {pool_stats['face_failed']} failed")
+            self.face_pool.close()
+            self.face_pool = None
@@ -0,0 +1,136 @@
+"""
+計測中のカメラフレームを録画する（後からの再生・オフライン調整用）
+書き込みは別スレッドで行い、処理ループは待たせない
+"""
+import csv
+import os
+import queue
+import threading
+
+import cv2
+
+
+class FrameRecorder:
+    """フレームを MJPG の AVI に、取得時刻を <名前>_frames.csv に記録する
+
+    submit() は上限付きキューに積むだけで、満杯なら drop_policy に従って捨てます
+    （'drop_new': 新しいフレームを捨てる / 'drop_oldest': 一番古い未書き込みを捨てる）。
+    CSV の log_ts は CSVLogger のフレーム行の ts と同じ値なので、ログと突き合わせられます。
+    出力は capture.Camera の backend=replay でそのまま再生できます。
+    索引 CSV は flush_every 行ごとにディスクへ書き出すので、異常終了や Ctrl-C で close() が
+    呼ばれなくても、それまでのフレームの取得時刻は残ります。
+    動画ファイルを開けなかった場合は一度だけ警告して録画を止め、以後のフレームは書かずに failed として数えます。
+    """
+
+    def __init__(self, path, fps=30, queue_size=64, drop_policy='drop_oldest', color_order='bgr', fourcc='MJPG',
+                 flush_every=30):
+        if drop_policy not in ('drop_new', 'drop_oldest'):
+            raise ValueError(f"drop_policy must be 'drop_new' or 'drop_oldest': {drop_policy}")
+        self.path = path
+        self.index_path = os.path.splitext(path)[0] + '_frames.csv'
+        self.fps = fps
+        self.drop_policy = drop_policy
+        self.color_order = color_order
+        self.fourcc = fourcc
+        self.flush_every = max(1, int(flush_every))
+        self.q = queue.Queue(maxsize=max(1, int(queue_size)))
+        self.writer = None
+        self.size = None
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0  # 録画を止めた後に捨てたフレーム数（開けなかったフレームを含む）
+        self.disabled = False
+        self._lock = threading.Lock()
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._index_file = open(self.index_path, 'w', newline='', encoding='utf-8')
+        self._index = csv.writer(self._index_file)
+        self._index.writerow(['index', 'ts', 'log_ts'])
+        self._index_file.flush()
+        self._thread = threading.Thread(target=self._run, name='frame-recorder', daemon=True)
+        self._thread.start()
+
+    def submit(self, frame, capture_ts, log_ts=None):
+        """フレームを書き込みキューに積む（ブロックしない）。積めたら True"""
+        with self._lock:
+            self.submitted += 1
+            if self.disabled:
+                self.failed += 1
+                return False
+        item = (frame, capture_ts, log_ts)
+        try:
+            self.q.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+        if self.drop_policy == 'drop_oldest':
+            try:
+                self.q.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self.q.put_nowait(item)
+            except queue.Full:
+                pass
+        with self._lock:
+            self.dropped += 1
+        return self.drop_policy == 'drop_oldest'
+
+    def _run(self):
+        while True:
+            item = self.q.get()
+            if item is None:
+                break
+            frame, capture_ts, log_ts = item
+            if self.disabled:
+                with self._lock:
+                    self.failed += 1
+                continue
+            try:
+                self._write(frame, capture_ts, log_ts)
+            except Exception as e:
+                print(f"Error writing recorded frame: {e}")
+
+    def _write(self, frame, capture_ts, log_ts):
+        if self.color_order == 'rgb':
+            # 処理ループ側がまだ同じフレームを使っているので、その場では変換しない
+            frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+        h, w = frame.shape[:2]
+        if self.writer is None:
+            self.size = (w, h)
+            self.writer = cv2.VideoWriter(self.path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps, (w, h))
+            if not self.writer.isOpened():
+                self.writer = None
+                with self._lock:
+                    self.disabled = True
+                    self.failed += 1
+                print(f"Warning: Cannot open video writer: {self.path}; frame recording disabled")
+                return
+        elif (w, h) != self.size:
+            # 取得解像度が途中で変わった場合（解像度の自動切り替えなど）は最初の解像度に揃える
+            frame = cv2.resize(frame, self.size, interpolation=cv2.INTER_LINEAR)
+        self.writer.write(frame)
+        self._index.writerow([self.written, capture_ts, log_ts])
+        self.written += 1
+        if self.written % self.flush_every == 0:
+            self._index_file.flush()
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'submitted': self.submitted,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'queued': self.q.qsize(),
+            }
+
+    def close(self):
+        """キューに残ったフレームを書き切ってから閉じる"""
+        self.q.put(None)
+        self._thread.join()
+        if self.writer is not None:
+            self.writer.release()
+        self._index_file.close()
+        return self.get_stats()
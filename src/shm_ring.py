@@ -0,0 +1,133 @@
+"""
+共有メモリ上のフレームリングバッファ
+同じ Raspberry Pi 上で動く cam_proxy.py（書き込み側）とアプリ（読み出し側）の間で、
+JPEG のエンコード/デコードを挟まずに生フレームを受け渡す
+"""
+import struct
+from multiprocessing import shared_memory
+
+import numpy as np
+
+# 先頭ヘッダ: マジック, スロット数, 1スロットあたりの最大バイト数
+_RING_HEADER = struct.Struct('<4sII')
+_RING_HEADER_SIZE = 64
+# スロットヘッダ: 通し番号, 取得時刻, 高さ, 幅, チャンネル数
+_SLOT_HEADER = struct.Struct('<QdIII')
+_SLOT_HEADER_SIZE = 32
+_MAGIC = b'FARB'
+
+
+def _attach(name):
+    # 読み出し側では resource_tracker に登録しない（終了時に共有メモリを消されないように）
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python 3.12 以前は track 引数が無いので、登録を手動で取り消す
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        return shm
+
+
+class ShmFrameRing:
+    """固定長スロットを持つフレームのリングバッファ
+
+    書き込み側は seq を 1 ずつ増やしながら seq % slots 番目のスロットへ上書きします。
+    書き込み中はスロットの seq を 0 にしておき、読み出し側はコピーの前後で seq が
+    変わっていないことを確認して、上書き途中のフレームを捨てます。
+    """
+
+    def __init__(self, shm, slots, slot_bytes, owner=False):
+        self.shm = shm
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+        self.owner = owner
+        self.seq = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @classmethod
+    def create(cls, name, width, height, channels=3, slots=4):
+        slot_bytes = width * height * channels
+        size = _RING_HEADER_SIZE + slots * (_SLOT_HEADER_SIZE + slot_bytes)
+        try:
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # 前回異常終了したプロキシの残骸は作り直す
+            old = _attach(name)
+            old.close()
+            old.unlink()
+            shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _RING_HEADER.pack_into(shm.buf, 0, _MAGIC, slots, slot_bytes)
+        for i in range(slots):
+            _SLOT_HEADER.pack_into(shm.buf, cls._slot_offset(i, slot_bytes), 0, 0.0, 0, 0, 0)
+        return cls(shm, slots, slot_bytes, owner=True)
+
+    @classmethod
+    def attach(cls, name, shared_tracker=False):
+        # shared_tracker: 作成側と同じ resource_tracker を使う子プロセス（multiprocessing で起動）から開く場合。
+        # 登録を取り消すと作成側の登録まで消えてしまうので、そのまま開く
+        shm = shared_memory.SharedMemory(name=name) if shared_tracker else _attach(name)
+        magic, slots, slot_bytes = _RING_HEADER.unpack_from(shm.buf, 0)
+        if magic != _MAGIC:
+            shm.close()
+            raise ValueError(f"Not a frame ring: {name}")
+        return cls(shm, slots, slot_bytes, owner=False)
+
+    @staticmethod
+    def _slot_offset(slot, slot_bytes):
+        return _RING_HEADER_SIZE + slot * (_SLOT_HEADER_SIZE + slot_bytes)
+
+    def _data_view(self, slot, nbytes):
+        off = self._slot_offset(slot, self.slot_bytes) + _SLOT_HEADER_SIZE
+        return np.ndarray((nbytes,), dtype=np.uint8, buffer=self.shm.buf, offset=off)
+
+    def write(self, frame, ts):
+        """フレームを書き込み、(slot, seq) を返す"""
+        if frame.dtype != np.uint8 or frame.nbytes > self.slot_bytes:
+            raise ValueError(f"Frame does not fit in ring slot: {frame.shape} {frame.dtype}")
+        h, w = frame.shape[:2]
+        c = frame.shape[2] if frame.ndim == 3 else 1
+        self.seq += 1
+        slot = self.seq % self.slots
+        off = self._slot_offset(slot, self.slot_bytes)
+        # 書き込み中の印として seq=0 にする
+        _SLOT_HEADER.pack_into(self.shm.buf, off, 0, 0.0, h, w, c)
+        dst = self._data_view(slot, frame.nbytes).reshape(frame.shape)
+        np.copyto(dst, frame)
+        _SLOT_HEADER.pack_into(self.shm.buf, off, self.seq, ts, h, w, c)
+        return slot, self.seq
+
+    def read(self, slot, seq):
+        """slot から seq 番のフレームをコピーして返す（上書き済み・書き込み中なら None）"""
+        off = self._slot_offset(slot, self.slot_bytes)
+        cur, ts, h, w, c = _SLOT_HEADER.unpack_from(self.shm.buf, off)
+        if cur != seq:
+            return None, None
+        shape = (h, w, c) if c > 1 else (h, w)
+        frame = self._data_view(slot, h * w * c).reshape(shape).copy()
+        if _SLOT_HEADER.unpack_from(self.shm.buf, off)[0] != seq:
+            return None, None
+        return frame, ts
+
+    def view(self, slot, seq):
+        """slot の seq 番のフレームをコピーせずに返す（書き込み側が上書きしないと分かっている場合に使う）"""
+        off = self._slot_offset(slot, self.slot_bytes)
+        cur, ts, h, w, c = _SLOT_HEADER.unpack_from(self.shm.buf, off)
+        if cur != seq:
+            return None
+        shape = (h, w, c) if c > 1 else (h, w)
+        return self._data_view(slot, h * w * c).reshape(shape)
+
+    def close(self):
+        try:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+        except Exception:
+            pass
@@ -0,0 +1,111 @@
+"""
+起動の高速化: 起動時間の区間ごとの計測と、FaceMesh のバックグラウンド準備
+GUI 版（app_gui.py）はメニューを先に表示し、利用者がメニューを操作している間に
+mediapipe の読み込みと FaceMesh のグラフ構築を別スレッドで済ませておく
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StartupTimer:
+    """起動からの経過時間を区間（読み込み・初期化など）ごとに記録し、どこに時間がかかったかを表示する
+
+    phase() は所要時間のある区間、mark() はその時点の経過時間だけを記録します。
+    バックグラウンドのスレッドから記録した区間には、表示時にスレッド名を付けます。
+    """
+
+    def __init__(self, t0=None):
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self._lock = threading.Lock()
+        self._entries = []  # (名前, 開始の経過秒, 所要秒または None, スレッド名)
+
+    def _add(self, name, start, duration):
+        thread = threading.current_thread()
+        who = None if thread is threading.main_thread() else thread.name
+        with self._lock:
+            self._entries.append((name, start - self.t0, duration, who))
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._add(name, start, time.perf_counter() - start)
+
+    def mark(self, name):
+        self._add(name, time.perf_counter(), None)
+
+    def report(self, title='Startup timing'):
+        """記録した区間を開始順に表示し、記録を空にする"""
+        with self._lock:
+            entries, self._entries = sorted(self._entries, key=lambda e: e[1]), []
+        if not entries:
+            return
+        print(f"{title} (seconds since launch):")
+        for name, start, duration, who in entries:
+            label = f"[{who}] {name}" if who else name
+            span = f"+{duration:.2f}" if duration is not None else ''
+            print(f"  {label:<40} {start:>7.2f} {span:>7}")
+
+
+class FaceWarmup:
+    """FaceProcessor をバックグラウンドのスレッドで作り、ダミーフレームで FaceMesh を初期化しておく
+
+    mediapipe の読み込み（Raspberry Pi では数秒）とグラフの構築を、メニュー表示中に済ませるためのもの。
+    take() で準備済みの FaceProcessor を受け取ります（1回だけ。失敗していれば None）。
+    build=False なら mediapipe の読み込みだけを行います（ワーカープロセスや Tasks を使う場合）。
+    """
+
+    def __init__(self, face_kwargs, timer=None, frame_size=(640, 480), build=True):
+        self.face_kwargs = face_kwargs
+        self.timer = timer or StartupTimer()
+        self.frame_size = frame_size
+        self.build = build
+        self.error = None
+        self._face = None
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='face-warmup', daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            with self.timer.phase('import mediapipe_wrappers'):
+                from mediapipe_wrappers import FaceProcessor
+            if not self.build:
+                return
+            with self.timer.phase('build FaceMesh'):
+                face = FaceProcessor(**self.face_kwargs)
+            with self.timer.phase('warm-up frame'):
+                face.warm_up(*self.frame_size)
+            self._face = face
+        except Exception as e:
+            self.error = e
+
+    @property
+    def ready(self):
+        return self._thread is not None and not self._thread.is_alive()
+
+    def take(self, timeout=None):
+        """準備が終わるまで最大 timeout 秒待ち、FaceProcessor を返す（まだ・失敗なら None）"""
+        if self._thread is None:
+            return None
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            return None
+        if self.error is not None:
+            print(f"Warning: FaceMesh warm-up failed ({self.error}); building it on demand")
+        face, self._face = self._face, None
+        return face
+
+    def close(self):
+        """受け取られなかった FaceProcessor を閉じる（準備中なら終わるまで待つ）"""
+        if self._thread is not None:
+            self._thread.join()
+        face, self._face = self._face, None
+        if face is not None:
+            face.close()
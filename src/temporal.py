@@ -0,0 +1,41 @@
+"""
+フレームの時刻にもとづく時間的な処理（平滑化の係数・継続時間）の共通部品
+検出器の係数やしきい値は 30fps で調整してきたので、その値を基準 fps での値として残し、
+実際のフレーム間隔（dt）に合わせて換算する。fps を下げても（Raspberry Pi で 10〜15fps など）
+平滑化の時定数と継続時間が変わらず、同じ場面で同じアラートになるようにするためのもの
+"""
+
+# 係数・しきい値を調整したときのフレームレート
+REF_FPS = 30.0
+# 1フレームとして扱う間隔の上限（秒）。長い欠測・アイドルの後に平滑値が一気に飛ばないようにする
+MAX_DT = 1.0
+
+
+def ewma_alpha(alpha, dt):
+    """基準 fps で 1フレームあたり alpha の指数移動平均を、間隔 dt 秒のフレームでの係数に換算する
+
+    基準 fps の n フレーム分の減衰 (1 - alpha)^n を、同じ時間 dt = n / REF_FPS で与えます。
+    dt = 1 / REF_FPS なら alpha そのものです。
+    """
+    if dt <= 0.0:
+        return 0.0
+    return 1.0 - (1.0 - alpha) ** (dt * REF_FPS)
+
+
+class FrameClock:
+    """フレームの時刻（秒）を受け取り、前のフレームからの間隔 dt を返す
+
+    時刻を渡さない（None）場合は、基準 fps で 1フレーム進んだものとして扱います
+    （時刻を持たない呼び出し元や、これまでのフレーム数ベースの動作との互換のため）。
+    """
+
+    def __init__(self):
+        self.last_ts = None
+
+    def tick(self, ts=None):
+        if ts is None:
+            return 1.0 / REF_FPS
+        last, self.last_ts = self.last_ts, ts
+        if last is None:
+            return 1.0 / REF_FPS
+        return min(max(ts - last, 0.0), MAX_DT)